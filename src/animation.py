@@ -0,0 +1,149 @@
+from array import array
+
+from colors import blend, compile_color
+
+
+EASINGS = ("linear", "ease_in", "ease_out", "ease_in_out")
+
+_easing_tables = {}
+
+
+def easing_table(easing: str):
+    '''
+    Lookup table mapping linear progress (0 .. 256) to eased progress
+    (0 .. 256). Tables are built once and shared by all animations.
+    '''
+    table = _easing_tables.get(easing)
+
+    if table is None:
+        assert easing in EASINGS, f'Unknown easing {easing}'
+
+        table = array('H', [0] * 257)
+
+        for i in range(257):
+            x = i / 256
+
+            if easing == "ease_in":
+                y = x * x
+            elif easing == "ease_out":
+                y = 1 - (1 - x) * (1 - x)
+            elif easing == "ease_in_out":
+                y = 2 * x * x if x < .5 else 1 - 2 * (1 - x) * (1 - x)
+            else:
+                y = x
+
+            table[i] = int(round(256 * y))
+
+        _easing_tables[easing] = table
+
+    return table
+
+
+def parse_offset(offset: int | str):
+    '''
+    Keyframe offset in ms, given as seconds (int) or "HH:MM" (str).
+    '''
+    if isinstance(offset, str):
+        h, m = map(int, offset.split(':'))
+        return (3600 * h + 60 * m) * 1000
+
+    return int(offset * 1000)
+
+
+class Animation:
+    '''
+    Keyframe animation of a NeoPixel state, precompiled into integer tables.
+
+    Keyframes are given as [offset, color] or [offset, color, easing], with
+    the offset relative to the start of the state (seconds or "HH:MM"). The
+    easing applies to the segment ending at the keyframe. Before the first
+    and after the last keyframe, the respective colour is held.
+
+    Example state:
+
+            {
+                "name": "SUNRISE",
+                "keyframes": [
+                    ["00:00", "#000000"],
+                    ["00:20", "#ff4000", "ease_in"],
+                    ["00:30", "#ffd080", "ease_out"]
+                ],
+                "luminosity": 0.6
+            }
+
+    Rendering a frame (render()) does not allocate: colours are blended with
+    integer math and written to the NeoPixel buffer directly.
+    '''
+    def __init__(self, state: dict, gamma: float = 2.2):
+        keyframes = state["keyframes"]
+        assert len(keyframes) > 0, 'Need at least one keyframe'
+
+        luminosity = state.get("luminosity", 1)
+        n = len(keyframes)
+
+        self.offsets = array('l', [0] * n)
+        self.colors = array('l', [0] * n)
+        self.easings = []
+
+        for i, keyframe in enumerate(keyframes):
+            self.offsets[i] = parse_offset(keyframe[0])
+            self.colors[i] = compile_color(keyframe[1], luminosity, gamma)
+            self.easings += [easing_table(keyframe[2] if len(keyframe) > 2 else "linear")]
+
+            if i > 0:
+                assert self.offsets[i] > self.offsets[i - 1], 'Keyframe offsets need to increase'
+
+        self.easings = tuple(self.easings)
+        self.duration = self.offsets[n - 1]
+        self._segment = 1
+
+    def color(self, elapsed: int):
+        '''
+        Packed perceptual colour at elapsed ms.
+        '''
+        offsets = self.offsets
+        n = len(offsets)
+
+        if elapsed <= offsets[0]:
+            return self.colors[0]
+
+        if elapsed >= offsets[n - 1]:
+            return self.colors[n - 1]
+
+        # segments are usually visited in order, keep track of the current one
+
+        i = self._segment
+
+        if i >= n or elapsed < offsets[i - 1]:
+            i = 1
+
+        while elapsed >= offsets[i]:
+            i += 1
+
+        self._segment = i
+
+        t0 = offsets[i - 1]
+        p = ((elapsed - t0) << 8) // (offsets[i] - t0)
+
+        return blend(self.colors[i - 1], self.colors[i], self.easings[i][p])
+
+    def render(self, leds, elapsed: int, lut: bytearray):
+        '''
+        Write the frame at elapsed ms to the NeoPixel buffer (without
+        calling leds.write()).
+        '''
+        c = self.color(elapsed)
+        r, g, b = lut[(c >> 16) & 0xff], lut[(c >> 8) & 0xff], lut[c & 0xff]
+
+        buf = leds.buf
+        order = leds.ORDER
+        bpp = leds.bpp
+        ir, ig, ib = order[0], order[1], order[2]
+
+        for j in range(0, len(buf), bpp):
+            buf[j + ir] = r
+            buf[j + ig] = g
+            buf[j + ib] = b
+
+            if bpp == 4:
+                buf[j + order[3]] = 0
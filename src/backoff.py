@@ -0,0 +1,78 @@
+import random
+
+
+class Backoff:
+    '''
+    Exponential backoff with jitter and a cap, counted separately per failure
+    cause. Times are in seconds (time.time()). The state can be persisted
+    (see state() and restore()) to survive reboots.
+
+    Example:
+
+            backoff = Backoff(base=60, cap=3600)
+            delay = backoff.failure('ntp', time.time())  # 60s (+ jitter)
+            delay = backoff.failure('ntp', time.time())  # 120s (+ jitter)
+            backoff.due(time.time())  # True once the delay has passed
+            backoff.success()  # reset
+    '''
+    def __init__(
+        self,
+        base: int = 60,  # s
+        cap: int = 3600,  # s
+        factor: int = 2,
+        jitter: float = .25,  # fraction of delay
+    ):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.jitter = jitter
+
+        self.failures = {}
+        self.next_retry = None
+        self.last_cause = None
+
+    @property
+    def pending(self):
+        return self.next_retry is not None
+
+    def failure(self, cause: str, now: int):
+        '''
+        Register a failure, returns the delay (s) until the next retry.
+        '''
+        n = self.failures.get(cause, 0) + 1
+        self.failures[cause] = n
+        self.last_cause = cause
+
+        delay = min(self.cap, self.base * self.factor ** (n - 1))
+        delay += int(delay * self.jitter * random.getrandbits(16) / 65536)
+
+        self.next_retry = now + delay
+
+        return delay
+
+    def success(self):
+        self.failures = {}
+        self.next_retry = None
+        self.last_cause = None
+
+    def due(self, now: int):
+        if self.next_retry is None:
+            return False
+
+        # clock jumped back (e.g. RTC reset on reboot), don't wait forever
+        if self.next_retry - now > self.cap * (1 + self.jitter):
+            self.next_retry = now + self.cap
+
+        return now >= self.next_retry
+
+    def state(self):
+        return {
+            'failures': dict(self.failures),
+            'next_retry': self.next_retry,
+            'last_cause': self.last_cause,
+        }
+
+    def restore(self, state: dict):
+        self.failures = state['failures']
+        self.next_retry = state['next_retry']
+        self.last_cause = state['last_cause']
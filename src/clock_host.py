@@ -0,0 +1,92 @@
+from leds import NeoPixelSegment
+from schedule import Schedule
+from sequencer import Sequencer
+
+
+class ClockHost:
+    '''
+    Host for multiple independent clocks on one board (e.g. one per room),
+    each on its own LED groups or NeoPixel segment.
+
+    All clocks are advanced from one step() call, their blink and animation
+    patterns run from a single shared sequencer (one timer), and NeoPixel
+    output is written once per frame (per strip). Clocks with identical
+    configs share the compiled schedule.
+
+    Example:
+
+            strip = NeoPixel(Pin(22), 2)
+            host = ClockHost()
+            app1 = GetUpClock(NeoPixelSegment(strip, 0, 1), cache_file="cache_1.json", host=host)
+            app2 = GetUpClock(NeoPixelSegment(strip, 1, 1), cache_file="cache_2.json", host=host)
+
+            while True:
+                host.step()  # once per second
+    '''
+    def __init__(
+        self,
+        tick_period: int = 50,  # ms
+    ):
+        self.tick_period = tick_period
+
+        self.clocks = []
+        self._segments = []
+        self._strips = []
+        self._schedules = []  # (config, feeds version, schedule)
+
+        self.sequencer = Sequencer(tick_period, after_tick=self.flush)
+
+    def add(self, clock):
+        self.clocks += [clock]
+
+        leds = clock.leds
+
+        if isinstance(leds, NeoPixelSegment):
+            leds.deferred = True
+            self._segments += [leds]
+
+            if leds.parent not in self._strips:
+                self._strips += [leds.parent]
+
+    def schedule(self, data: dict, feeds=None):
+        '''
+        Compiled schedule for a config, shared between clocks with the same
+        config (and ICS feeds). Returns (config, schedule), clocks should use
+        the returned (shared) config object.
+        '''
+        version = None if feeds is None else (id(feeds), feeds.version)
+
+        for config, v, schedule in self._schedules:
+            if config == data and v == version:
+                return config, schedule
+
+        schedule = Schedule(data, feeds)
+
+        # drop schedules no longer used by any clock
+        self._schedules = [
+            (config, v, s) for config, v, s in self._schedules
+            if any(clock._schedule is s for clock in self.clocks)]
+        self._schedules += [(data, version, schedule)]
+
+        return data, schedule
+
+    def step(self, now=None):
+        for clock in self.clocks:
+            clock.step(now)
+
+        self.flush()
+
+    def flush(self):
+        '''
+        Write every strip with changed segments once.
+        '''
+        for strip in self._strips:
+            dirty = False
+
+            for segment in self._segments:
+                if segment.parent is strip and segment.dirty:
+                    segment.dirty = False
+                    dirty = True
+
+            if dirty:
+                strip.write()
@@ -0,0 +1,141 @@
+'''
+Colour pipeline for NeoPixel outputs.
+
+Colours are parsed once (at config load) into packed 0xRRGGBB ints in a
+perceptual space. Luminosity is folded into these values, so a fade can
+interpolate linearly in perceptual space and only a 256-entry gamma lookup
+table is needed per frame to get the output values.
+'''
+
+
+def gamma_table(gamma: float = 2.2):
+    '''
+    Build the 256-entry lookup table mapping perceptual values to output
+    (PWM) values.
+    '''
+    lut = bytearray(256)
+
+    for i in range(256):
+        lut[i] = int(round(255 * (i / 255) ** gamma))
+
+    return lut
+
+
+def parse_hex(color: str):
+    '''
+    Parse "#rrggbb" or "rrggbb" into a packed int.
+    '''
+    if len(color) == 7:
+        assert color.startswith("#")
+        color = color[1:]
+    else:
+        assert len(color) == 6
+
+    return int(color, 16)
+
+
+def pack(r: int, g: int, b: int):
+    return (r << 16) | (g << 8) | b
+
+
+def unpack(c: int, lut: bytearray = None):
+    '''
+    Split a packed colour into an (r, g, b) tuple, optionally mapping it
+    through a gamma lookup table.
+    '''
+    r, g, b = (c >> 16) & 0xff, (c >> 8) & 0xff, c & 0xff
+
+    if lut is not None:
+        r, g, b = lut[r], lut[g], lut[b]
+
+    return (r, g, b)
+
+
+def compile_color(
+    color: str,
+    luminosity: int | float = 1,
+    gamma: float = 2.2,
+):
+    '''
+    Turn a config colour and luminosity into a packed perceptual colour.
+
+    The luminosity scales the output (post-gamma) intensity, so it is applied
+    here as luminosity ** (1 / gamma). Fully saturated colours ("#ff0000" etc.)
+    therefore render exactly as before gamma correction.
+    '''
+    c = parse_hex(color)
+
+    luminosity = clip(luminosity, 0, 1)
+
+    if luminosity != 1:
+        scale = luminosity ** (1 / gamma)
+        r, g, b = unpack(c)
+        r, g, b = (clip(int(round(v * scale)), 0, 255) for v in (r, g, b))
+        c = pack(r, g, b)
+
+    return c
+
+
+def blend(c0: int, c1: int, p: int):
+    '''
+    Interpolate two packed colours, p in 0 .. 256 (fixed point progress).
+    '''
+    r0, g0, b0 = (c0 >> 16) & 0xff, (c0 >> 8) & 0xff, c0 & 0xff
+    r1, g1, b1 = (c1 >> 16) & 0xff, (c1 >> 8) & 0xff, c1 & 0xff
+
+    return pack(
+        r0 + (((r1 - r0) * p) >> 8),
+        g0 + (((g1 - g0) * p) >> 8),
+        b0 + (((b1 - b0) * p) >> 8))
+
+
+def clip(
+    v: int | float | list[int | float],
+    vmin: int | float | None = None,
+    vmax: int | float | None = None,
+):
+    if isinstance(v, list):
+        return [clip(v0, vmin, vmax) for v0 in v]
+    if vmin is not None:
+        v = max(v, vmin)
+    if vmax is not None:
+        v = min(v, vmax)
+    return v
+
+
+class Palette:
+    '''
+    Precompiled colours of all states of a config, keyed by state.
+
+    Example:
+
+            palette = Palette(gamma=2.2)
+            palette.compile(data["states"])
+            rgb = palette.rgb(state)  # gamma corrected (r, g, b) or None
+    '''
+    def __init__(self, gamma: float = 2.2):
+        self.gamma = gamma
+        self.lut = gamma_table(gamma)
+        self._colors = {}
+
+    def compile(self, states: list[dict]):
+        colors = {}
+
+        for state in states:
+            if state.get("color") is not None:
+                colors[id(state)] = compile_color(
+                    state["color"],
+                    state.get("luminosity", 1),
+                    self.gamma)
+
+        self._colors = colors
+
+    def color(self, state: dict):
+        '''
+        Packed perceptual colour of a state, None if the state has no colour.
+        '''
+        return self._colors.get(id(state))
+
+    def rgb(self, state: dict):
+        c = self.color(state)
+        return None if c is None else unpack(c, self.lut)
@@ -1,9 +1,21 @@
+import _thread
+import binascii
+import hashlib
+import json
+import time
+
+import tracer
+from backoff import Backoff
 from datetime import date, datetime
-
+from json_patch import apply_patch, copy
 from logging import log as print
 from wifi_manager import WifiManager
 
 
+SYNC_GUARD = 5  # s, distance of a sync from app deadlines
+SYNC_MIN_BUDGET = 10  # s
+
+
 class ConfigSync:
     '''
     Online config syncing manager. Syncs config of one or multiple apps at
@@ -16,7 +28,7 @@ class ConfigSync:
             # register app
             url = "https://..."
             callback = lambda cfg: app.update(cfg)
-            cfg_sync.register(url, callback)
+            cfg_sync.register_app(url, callback)
 
             # force sync
             cfg_sync.sync(force=True)
@@ -28,20 +40,156 @@ class ConfigSync:
 
             # get success of last sync
             print(cfg_sync.synced)
+
+    Bundle mode: if a bundle URL is given, all app configs are downloaded in
+    a single request. The bundle is a JSON dict with the app ids as keys:
+
+            cfg_sync = ConfigSync(wifi_man, ("04:00", ), bundle_url="https://...")
+            cfg_sync.register_app(None, app.update, app_id="clock")
+
+    Failed syncs are retried with exponential backoff (per failure cause:
+    "no_ap", "ntp", or "http"), scheduled sync times are skipped while a retry
+    is pending. Each app has its own sync state (last success, validators,
+    next due time): if only some downloads fail, only these are retried. An
+    app can also be refreshed at its own interval (s). The sync state is
+    persisted in the state file:
+
+            cfg_sync.register_app(url, app.update_data, interval=6 * 3600)
+            print(cfg_sync.retry_state, cfg_sync.app_state("clock"))
+
+    Delta updates: if an app provides its current config, only changes are
+    downloaded. The ETag of the last download is sent (If-None-Match, with
+    "A-IM: json-patch"), and the server answers with 304 (unchanged), 226 (a
+    JSON patch, RFC 6902, to apply to the current config), or 200 (the full
+    config). If the patch cannot be applied, the full config is downloaded:
+
+            cfg_sync.register_app(url, app.update_data, current=lambda: app.data)
+
+    Deferred sync (e.g. after a warm boot): skip the initial sync and sync
+    once the delay has passed instead:
+
+            cfg_sync.defer_sync(300)
+
+    Threaded mode: the network part of a sync (connect, NTP, downloads) runs in
+    a second thread (on the RP2040: on core 1), so the main loop keeps running.
+    Results are handed back through a lock-protected mailbox and applied (app
+    callbacks) by the next sync() call in the main thread:
+
+            cfg_sync = ConfigSync(wifi_man, ("04:00", ), threaded=True)
+            cfg_sync.sync()  # starts a sync or applies the result of the last one
+
+    Sync planning: apps can report upcoming deadlines (e.g. state
+    transitions). A sync (scheduled, retried, or deferred) is moved by up to
+    sync_tolerance seconds into the nearest window in which it can run for
+    sync_budget seconds without hitting a deadline. A running sync is cut
+    off before the next deadline (failure cause "budget", retried later):
+
+            cfg_sync = ConfigSync(wifi_man, ("04:00", ), sync_tolerance=600, sync_budget=60)
+            cfg_sync.register_app(url, app.update_data, deadlines=app.deadlines)
+
+    ICS feeds: with a feed cache, the feeds an app uses (feeds(config)
+    returns their URLs) are fetched after the configs. If a feed changed,
+    the app's callback is called (with its current config if the config is
+    unchanged) so it can recompile:
+
+            feed_cache = FeedCache()
+            cfg_sync = ConfigSync(wifi_man, ("04:00", ), feed_cache=feed_cache)
+            cfg_sync.register_app(url, app.update_data, current=lambda: app.data, feeds=app.feeds)
+
+    Fragments: with a fragment cache, the fragments a config includes
+    (includes(config) returns their URLs, see fragments.py) are fetched
+    before the feeds, and cached the same way:
+
+            fragment_cache = FragmentCache()
+            cfg_sync = ConfigSync(wifi_man, ("04:00", ), fragment_cache=fragment_cache)
+            cfg_sync.register_app(url, app.update_data, current=lambda: app.data, includes=app.includes)
+
+    Telemetry: with a Telemetry (see telemetry.py), the buffered logs and
+    counters are uploaded at the end of a sync, while the wifi is up anyway
+    (skipped if out of time, kept for the next sync if the upload fails):
+
+            telemetry = Telemetry(url)
+            cfg_sync = ConfigSync(wifi_man, ("04:00", ), telemetry=telemetry)
     '''
     def __init__(self,
                  wifi_man: WifiManager,
                  sync_times: list[str],
+                 bundle_url: str = None,
+                 retry_base: int = 60,  # s
+                 retry_cap: int = 3600,  # s
+                 state_file: str = "sync_state.json",
+                 threaded: bool = False,
+                 sync_tolerance: int = 600,  # s, max shift of a sync
+                 sync_budget: int = 60,  # s, max duration of a sync
+                 feed_cache=None,  # FeedCache for ICS feeds
+                 fragment_cache=None,  # FragmentCache for included fragments
+                 telemetry=None,  # Telemetry, uploaded during syncs
                  verbose: bool = True):
         self.wifi_man = wifi_man
         self.sync_times = sync_times
+        self.bundle_url = bundle_url
         self._sync_times_today = None
         self.verbose = verbose
 
         self._last_sync_date = None
+        self._deferred_until = None
         self.synced = False
+        self.last_error = None
+        self.last_sync = None  # time.time() of last successful sync
+
+        self.state_file = state_file
+        self.threaded = threaded
+        self.sync_tolerance = sync_tolerance
+        self.sync_budget = sync_budget
+        self.feed_cache = feed_cache
+        self.fragment_cache = fragment_cache
+        self.telemetry = telemetry
+        self._budget_end = None  # ticks_ms
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.backoff = Backoff(  # connection level failures
+            base=retry_base,
+            cap=retry_cap)
+
+        self._apps = []
+        self._app_states = {}  # app key -> persisted state, until registered
+        self._deadline_sources = []
+
+        self._lock = _thread.allocate_lock()
+        self._mailbox = None  # result of threaded sync, guarded by lock
+        self._worker_running = False
+
+        self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+
+            self.backoff.restore(state['backoff'])
+            self._app_states = state['apps']
+
+        except (ValueError, KeyError, OSError) as ex:
+            if self.verbose:
+                print(f'[ConfigSync] no state loaded: {ex}')
 
-        self._registered_apps = []
+    def _save_state(self):
+        apps = dict(self._app_states)
+
+        for app in self._apps:
+            apps[app.key] = app.state()
+
+        state = {
+            'backoff': self.backoff.state(),
+            'apps': apps,
+        }
+
+        try:
+            with open(self.state_file, 'w') as f:
+                json.dump(state, f)
+
+        except OSError as ex:
+            print(f'[ConfigSync] ERROR: cannot write state: {ex}')
 
     def _get_sync_times_today(self):
         sync_times_today = []
@@ -56,19 +204,95 @@ class ConfigSync:
 
         return sorted(sync_times_today)
 
-    def register_app(self, url: str, callback: Callable):
-        self._registered_apps += [(url, callback)]
+    def register_app(
+        self,
+        url: str,
+        callback: Callable,
+        app_id: str = None,
+        current: Callable = None,
+        deadlines: Callable = None,
+        feeds: Callable = None,
+        includes: Callable = None,
+        interval: int = None,  # s
+    ):
+        '''
+        Register an app: callback(config) is called with new configs (if it
+        returns False, the config was rejected and the app is retried). With
+        current (returns the app's config), delta updates are used. With
+        deadlines(now, horizon) (returns the datetimes of upcoming deadlines
+        within horizon seconds), syncs are kept away from them. With feeds
+        (returns the URLs of the ICS feeds a config uses), the feeds are
+        fetched into the feed cache, with includes (returns the URLs of the
+        fragments a config includes) into the fragment cache. With an
+        interval, the app is refreshed at least every interval seconds
+        (besides the sync times).
+        '''
+        if self.bundle_url is not None:
+            assert app_id is not None, 'Need an app id in bundle mode'
+
+        app = SyncedApp(url, callback, app_id, current, feeds, includes, interval, self.retry_base, self.retry_cap)
+
+        if app.key in self._app_states:
+            app.restore(self._app_states.pop(app.key))
+
+        if interval is not None and app.next_due is None and app.last_success is not None:
+            app.next_due = app.last_success + interval
+
+        self._apps += [app]
+
+        if deadlines is not None:
+            self._deadline_sources += [deadlines]
+
+    def defer_sync(self, delay: int = 0):
+        '''
+        Don't sync before delay (s) has passed, then sync once (unless a
+        failed sync is retried before).
+        '''
+        self._deferred_until = time.time() + delay
+        self.synced = True  # assume cached configs are fine until then
+
+    @property
+    def retry_state(self):
+        return self.backoff.state()
+
+    def app_state(self, key: str):
+        '''
+        Sync state of an app (by app id or URL).
+        '''
+        for app in self._apps:
+            if app.key == key:
+                return app.state()
+
+        return None
+
+    @property
+    def busy(self):
+        '''
+        True while a threaded sync is running.
+        '''
+        return self._worker_running
 
     def sync(self, force: bool = False):
         '''
         Sync if time matches the defined sync times or we haven't synced before.
+
+        In threaded mode, this applies the result of a finished sync (and
+        returns its success) or starts a new sync (and returns None).
         '''
-        sync = False
+        if self.threaded:
+            result = self._collect()
+
+            if result is not None:
+                return result
+
+            if self._worker_running:
+                return None
+
         now = datetime.now()
         today = now.date()
+        t = time.time()
 
-        if self._last_sync_date is None:
-            sync = True
+        pending = self.backoff.pending or self._deferred_until is not None
 
         if (
             self._last_sync_date is None or
@@ -78,29 +302,249 @@ class ConfigSync:
         ):
             self._sync_times_today = self._get_sync_times_today()
 
+        # when should we sync all apps (s from now, negative: overdue)
+
+        targets = []
+        immediate = force or (self._last_sync_date is None and not pending)
+
+        if immediate:
+            targets += [0]
+
         while (len(self._sync_times_today) > 0):
-            if now >= self._sync_times_today[0]:
-                sync = True
+            offset = now.diff_seconds(self._sync_times_today[0])
+
+            if pending and offset <= 0:
+                # skipped, the pending retry or deferred sync covers it
+                if self.backoff.pending:
+                    self._mark_due(t)
                 self._sync_times_today.pop(0)
                 continue
 
+            if not pending and not (immediate and offset < 0):
+                # past sync times are covered by an immediate (forced or
+                # first) sync, it is not late for them
+                targets += [offset]
+
             break
 
-        if not sync:
+        if self._deferred_until is not None:
+            targets += [self._deferred_until - t]
+
+        all_target = min(targets) if targets else None
+
+        # when are single apps due (retries, intervals)
+
+        due = [app.next_due - t for app in self._apps if app.next_due is not None]
+
+        if due:
+            due_target = min(due)
+
+            if self.backoff.pending:
+                self.backoff.due(t)  # fixes the retry time if the clock jumped back
+                due_target = max(due_target, self.backoff.next_retry - t)
+
+            targets += [due_target]
+
+        if not targets:
             return None
 
+        target = min(targets)
+
+        if target > self.sync_tolerance:
+            return None
+
+        # plan sync around app deadlines
+
+        deadlines = self._deadlines(now)
+
+        if not force and self._plan(target, deadlines) > 0:
+            return None
+
+        budget = self.sync_budget
+
+        for d in deadlines:
+            if d > 0:
+                budget = max(SYNC_MIN_BUDGET, min(budget, d - SYNC_GUARD))
+                break
+
+        if self.verbose and target < 0:
+            print(f'[ConfigSync] syncing {-target}s after planned time, budget {budget}s')
+
         self._last_sync_date = today
+        self._budget_end = time.ticks_add(time.ticks_ms(), 1000 * budget)
 
-        success = self._sync()
+        if all_target is not None and all_target <= self.sync_tolerance:
+            self._mark_due(t)
+            self._deferred_until = None
 
-        if not success:
-            # sync failed, try again next time sync is run
-            self._sync_times_today = [datetime.now()] + self._sync_times_today
+            # this sync covers scheduled times within the tolerance
+            while (
+                len(self._sync_times_today) > 0 and
+                now.diff_seconds(self._sync_times_today[0]) <= self.sync_tolerance
+            ):
+                self._sync_times_today.pop(0)
 
-        return success
+        # apps due now or within the tolerance
+        apps = [
+            app for app in self._apps
+            if app.next_due is not None and app.next_due - t <= self.sync_tolerance]
 
-    def _sync(self):
-        self.synced = False
+        if self.threaded:
+            self._worker_running = True
+            _thread.start_new_thread(self._sync_worker, (apps, ))
+            return None
+
+        return self._sync(apps)
+
+    def _mark_due(self, t: int):
+        # all apps need a refresh
+        for app in self._apps:
+            if app.next_due is None or app.next_due > t:
+                app.next_due = t
+
+    def _deadlines(self, now: datetime):
+        '''
+        Upcoming deadlines of all apps, in s from now (sorted).
+        '''
+        horizon = 2 * self.sync_tolerance + self.sync_budget
+        deadlines = []
+
+        for source in self._deadline_sources:
+            try:
+                deadlines += [now.diff_seconds(d) for d in source(now, horizon)]
+            except Exception as ex:
+                print(f'[ConfigSync] ERROR getting deadlines: {ex}')
+
+        return sorted(deadlines)
+
+    def _plan(self, target: int, deadlines: list):
+        '''
+        Start of the sync (s from now): the start nearest to target (s from
+        now) within the tolerance, not before now, at which the sync can run
+        for its budget without getting close to a deadline. If there is no
+        such window, the sync starts at target.
+        '''
+        lo = max(0, target - self.sync_tolerance)
+        hi = target + self.sync_tolerance
+        length = self.sync_budget + SYNC_GUARD
+
+        candidates = [max(lo, target), lo]
+        for d in deadlines:
+            candidates += [d + SYNC_GUARD, d - length]
+
+        best = None
+
+        for start in candidates:
+            if start < lo or start > hi:
+                continue
+
+            if any(start - SYNC_GUARD < d < start + length for d in deadlines):
+                continue
+
+            if best is None or abs(start - target) < abs(best - target):
+                best = start
+
+        return max(0, target) if best is None else best
+
+    def _over_budget(self):
+        return (
+            self._budget_end is not None and
+            time.ticks_diff(time.ticks_ms(), self._budget_end) > 0)
+
+    def _sync(self, apps: list):
+        return self._finish(*self._fetch(apps))
+
+    def _sync_worker(self, apps: list):
+        # runs in second thread, only does network work
+
+        try:
+            result = self._fetch(apps)
+        except Exception as ex:
+            print(f'[ConfigSync] ERROR in sync thread: {ex}')
+            result = ('error', [], [])
+        finally:
+            self.wifi_man.down()  # radio off, also if the sync failed
+
+        with self._lock:
+            self._mailbox = result
+            self._worker_running = False
+
+    def _collect(self):
+        with self._lock:
+            result = self._mailbox
+            self._mailbox = None
+
+        if result is None:
+            return None
+
+        return self._finish(*result)
+
+    def _finish(self, error: str, updates: list, results: list):
+        # apply downloaded configs and update sync state (main thread)
+
+        rejected = []
+
+        for app, data, validator in updates:
+            if app.callback(data) is False:
+                # not applied (e.g. fragments not cached yet), no validator
+                # for it, so it is downloaded again when the app is retried
+                rejected += [app]
+            else:
+                app.validator = validator
+
+        if rejected:
+            results = [(app, ok and app not in rejected) for app, ok in results]
+
+            if error is None:
+                error = 'http'
+
+        t = time.time()
+
+        self.synced = error is None
+        self.last_error = error
+
+        tracer.event(
+            tracer.SYNC_END,
+            int(self.synced),
+            tracer.CAUSES.index(error) if error in tracer.CAUSES else tracer.CAUSES.index('error'))
+
+        if self.telemetry is not None:
+            self.telemetry.count('sync_ok' if self.synced else f'sync_{error}')
+
+        # per app: only failed apps are retried
+
+        for app, ok in results:
+            if ok:
+                app.success(t)
+            else:
+                delay = app.failure('http', t)
+
+                if self.verbose:
+                    print(f'[ConfigSync] sync of {app.key} failed, retrying in {delay}s')
+
+        # connection level: apps not synced stay due, retry them all
+
+        if error is None or error == 'http':
+            self.backoff.success()
+        else:
+            delay = self.backoff.failure(error, t)
+
+            if self.verbose:
+                print(f'[ConfigSync] sync failed ({error}), retrying in {delay}s')
+
+        if self.synced:
+            self.last_sync = t
+
+        self._save_state()
+
+        return self.synced
+
+    def _fetch(self, apps: list):
+        '''
+        Connect, sync NTP, and download the configs of apps. Returns (error
+        cause or None, [(app, data, validator), ...], [(app, success), ...]).
+        '''
+        tracer.event(tracer.SYNC_START)
 
         if self.verbose:
             print('[ConfigSync] syncing NTP')
@@ -110,28 +554,232 @@ class ConfigSync:
         if not self.wifi_man.connect():
             if self.verbose:
                 print('[ConfigSync] no wifi connetion, aborting')
-            return False
+            error = self.wifi_man.last_error or 'no_ap'
+            self.wifi_man.down()
+            return error, [], []
+
+        if self._over_budget():
+            if self.verbose:
+                print('[ConfigSync] out of time after connecting, aborting')
+            self.wifi_man.down()
+            return 'budget', [], []
 
         # download config
 
-        error = False
+        error = None
+        updates = []
+        results = []
 
-        if not self._registered_apps:
+        if not apps:
             if self.verbose:
-                print('[ConfigSync] no apps registered')
+                print('[ConfigSync] no apps to sync')
 
-        for url, callback in self._registered_apps:
-            data = self.wifi_man.get_json(url)
-            if data:
-                callback(data)
+        bundle = None
+
+        if self.bundle_url is not None and apps:
+            bundle = self.wifi_man.get_json(self.bundle_url)
+
+            if not isinstance(bundle, dict):
+                if self.verbose:
+                    print('[ConfigSync] bundle download failed')
+                bundle = {}
+
+        fragment_urls = []
+        feed_urls = []
+
+        for app in apps:
+            if self._over_budget():
+                if self.verbose:
+                    print('[ConfigSync] out of time, skipping remaining downloads')
+                error = 'budget'
+                break
+
+            validator = app.validator
+
+            if bundle is not None:
+                data = bundle.get(app.app_id)
+
+                if not data and self.verbose:
+                    print(f'[ConfigSync] no config for app {app.app_id}')
+
+            elif app.current is None:
+                data = self.wifi_man.get_json(app.url)
             else:
-                error = True
+                data, validator = self._get_delta(app, app.current())
+
+            ok = bool(data) or data is False  # False: unchanged
+
+            # fragments, then ICS feeds (also of the fragments) of the (new
+            # or current) config
+
+            if ok:
+                config = data if data else (app.current() if app.current is not None else None)
+                changed = False
+
+                for cache, sources, urls in (
+                        (self.fragment_cache, app.includes, fragment_urls),
+                        (self.feed_cache, app.feeds, feed_urls)):
+                    if cache is None or sources is None or not config:
+                        continue
+
+                    for url in sources(config):
+                        urls += [url]
+                        result = cache.fetch(self.wifi_man, url)
+
+                        if result is None:
+                            ok = False
+                        elif result:
+                            changed = True
+
+                if data and not self._complete(app, data):
+                    # keep the running config until all its fragments are cached
+                    if self.verbose:
+                        print(f'[ConfigSync] fragments of {app.key} missing, keeping the current config')
+                    ok = False
+                    data = None
+                    validator = app.validator
+                    config = app.current() if app.current is not None else None
+
+                if changed and not data and config:
+                    updates += [(app, config, validator)]  # recompile with new fragments / feeds
+
+            if data:
+                updates += [(app, data, validator)]
+
+            if not ok and error is None:
+                error = 'http'
+
+            results += [(app, ok)]
+
+        if error is None and len(apps) == len(self._apps):
+            if self.fragment_cache is not None:
+                self.fragment_cache.retain(fragment_urls)
+
+            if self.feed_cache is not None:
+                self.feed_cache.retain(feed_urls)
+
+        # upload telemetry (failures do not fail the sync)
+
+        if self.telemetry is not None and not self._over_budget():
+            if not self.telemetry.upload(self.wifi_man) and self.verbose:
+                print('[ConfigSync] telemetry upload failed, keeping it for the next sync')
 
         # wrap up
 
         self.wifi_man.down()
 
-        self.synced = not error
+        return error, updates, results
 
-        return self.synced
+    def _complete(self, app, config: dict):
+        # all fragments included by a config are in the fragment cache
+        if app.includes is None:
+            return True
 
+        urls = app.includes(config)
+
+        if self.fragment_cache is None:
+            return not urls
+
+        return all(self.fragment_cache.get(url) is not None for url in urls)
+
+    def _get_delta(self, app, base: dict):
+        '''
+        Download the config of an app as a delta to its current config (base).
+        Returns the new config (False if unchanged, None on error) and its
+        validator, which is only stored once the app accepted the config.
+        '''
+        url = app.url
+        headers = {}
+        validator = app.validator
+
+        if validator is not None and base and validator[1] == content_hash(base):
+            headers['If-None-Match'] = validator[0]
+            headers['A-IM'] = 'json-patch'
+
+        status, response_headers, data = self.wifi_man.request(
+            'GET', url, headers, json=True)
+
+        if status == 304:
+            if self.verbose:
+                print('[ConfigSync] config unchanged')
+            return False, validator
+
+        if status == 226:
+            try:
+                data = apply_patch(copy(base), data)
+
+                if self.verbose:
+                    print('[ConfigSync] config patched')
+
+            except ValueError as ex:
+                print(f'[ConfigSync] ERROR applying patch: {ex}, downloading full config')
+                status, response_headers, data = self.wifi_man.request('GET', url, json=True)
+
+        if status not in (200, 226) or not data:
+            return None, validator
+
+        etag = response_headers.get('etag')
+
+        return data, None if etag is None else [etag, content_hash(data)]
+
+
+class SyncedApp:
+    '''
+    A registered app and its sync state.
+    '''
+    def __init__(
+        self,
+        url: str,
+        callback: Callable,
+        app_id: str,
+        current: Callable,
+        feeds: Callable,
+        includes: Callable,
+        interval: int,  # s
+        retry_base: int,  # s
+        retry_cap: int,  # s
+    ):
+        self.url = url
+        self.callback = callback
+        self.app_id = app_id
+        self.key = app_id or url
+        self.current = current
+        self.feeds = feeds
+        self.includes = includes
+        self.interval = interval
+
+        self.backoff = Backoff(base=retry_base, cap=retry_cap)
+        self.validator = None  # (etag, hash of config)
+        self.last_success = None  # time.time()
+        self.next_due = None  # time.time(), None: only at sync times
+
+    def success(self, now: int):
+        self.backoff.success()
+        self.last_success = now
+        self.next_due = None if self.interval is None else now + self.interval
+
+    def failure(self, cause: str, now: int):
+        delay = self.backoff.failure(cause, now)
+        self.next_due = self.backoff.next_retry
+        return delay
+
+    def state(self):
+        return {
+            'backoff': self.backoff.state(),
+            'validator': self.validator,
+            'last_success': self.last_success,
+            'next_due': self.next_due,
+        }
+
+    def restore(self, state: dict):
+        self.backoff.restore(state['backoff'])
+        self.validator = state['validator']
+        self.last_success = state['last_success']
+        self.next_due = state['next_due']
+
+
+def content_hash(data):
+    '''
+    Hash of a JSON document (hex string).
+    '''
+    return binascii.hexlify(hashlib.sha256(json.dumps(data).encode()).digest()).decode()
@@ -38,6 +38,23 @@ class date:  # lower case to match python lib
     def __ge__(self, other):
         return not self < other
 
+    def weekday(self):  # method to match python lib
+        return datetime(self.year, self.month, self.day).weekday()
+
+    def next_day(self):
+        if self.day < datetime.days_in_month(self.year, self.month):
+            return date(self.year, self.month, self.day + 1)
+        elif self.month < 12:
+            return date(self.year, self.month + 1, 1)
+        else:
+            return date(self.year + 1, 1, 1)
+
+    def key(self):
+        '''
+        Sortable int representation (YYYYMMDD).
+        '''
+        return 10000 * self.year + 100 * self.month + self.day
+
 
 class datetime:  # lower case to match python lib
     def __init__(
@@ -58,8 +75,7 @@ class datetime:  # lower case to match python lib
             wd = 5  # reference: weekday of 2000-01-01
 
             for y in range(2000, year):
-                if not datetime.is_leap_year(y):
-                    wd += 1
+                wd += 1 + int(datetime.is_leap_year(y))  # 365 % 7 == 1
 
             for m in range(1, month):
                 if m in (1, 3, 5, 7, 8, 10, 12):
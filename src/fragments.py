@@ -0,0 +1,195 @@
+'''
+Config fragments shared between configs ("include").
+
+A config can include fragments by URL, e.g. a shared state palette or a
+holiday rule used by several clocks:
+
+        {
+            "include": ["https://.../palette.json", "https://.../holidays.json"],
+            "rules": [...]
+        }
+
+A fragment is a partial config with "states" and/or "rules". Fragments are
+fetched, validated, and cached on flash on their own, with their ETag and
+content hash: unchanged fragments are not downloaded (ETag) or not parsed
+(hash) again. merge() builds the config to compile.
+
+Example:
+
+        fragments = FragmentCache()
+        fragments.fetch(wifi_man, "https://.../palette.json")  # True if changed
+        config = merge(data, fragments)
+'''
+import _thread
+import binascii
+import hashlib
+import json
+
+from logging import log as print
+
+
+def include_urls(data: dict):
+    '''
+    URLs of the fragments included by a config.
+    '''
+    urls = data.get('include', [])
+    return [urls] if isinstance(urls, str) else urls
+
+
+def validate(fragment):
+    '''
+    Check the structure of a fragment, raises AssertionError if invalid.
+    '''
+    assert isinstance(fragment, dict), 'Fragment is not an object'
+    assert set(fragment) <= {'states', 'rules'}, f'Unknown keys in fragment: {list(fragment)}'
+    assert isinstance(fragment.get('states', []), list), 'states is not a list'
+    assert isinstance(fragment.get('rules', []), list), 'rules is not a list'
+
+    for state in fragment.get('states', []):
+        assert isinstance(state, dict) and 'name' in state, f'Invalid state {state}'
+
+    for rule in fragment.get('rules', []):
+        assert isinstance(rule, dict) and 'name' in rule, f'Invalid rule {rule}'
+        assert isinstance(rule.get('transitions'), list), f'No transitions in rule {rule["name"]}'
+
+
+def merge(data: dict, fragments):
+    '''
+    Config with its fragments (from a FragmentCache) merged: the states of
+    the config, or of the first fragment with states, and the rules of the
+    fragments (in include order) before the rules of the config, so the last
+    rule of the config stays the fallback. Configs without includes are
+    returned as is.
+    '''
+    urls = include_urls(data)
+
+    if not urls:
+        return data
+
+    assert fragments is not None, 'Config has includes, but there is no fragment cache'
+
+    states = data.get('states')
+    rules = []
+
+    for url in urls:
+        fragment = fragments.get(url)
+        assert fragment is not None, f'Fragment {url} not loaded'
+
+        if states is None:
+            states = fragment.get('states')
+
+        rules += fragment.get('rules', [])
+
+    config = {key: value for key, value in data.items() if key != 'include'}
+    config['states'] = states if states is not None else []
+    config['rules'] = rules + data.get('rules', [])
+
+    return config
+
+
+class FragmentCache:
+    '''
+    Validated config fragments by URL, persisted on flash. version is
+    incremented whenever a fragment changes (e.g. to recompile configs).
+    Fragments can be read while another thread fetches (entries are
+    replaced, not modified).
+    '''
+    def __init__(
+        self,
+        cache_file: str = "fragments.json",
+        verbose: bool = True,
+    ):
+        self.cache_file = cache_file
+        self.verbose = verbose
+
+        self.version = 0
+        self._lock = _thread.allocate_lock()  # fetch() may run in a sync thread
+        self._fragments = {}  # url -> [etag, content hash, fragment]
+
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                self._fragments = json.load(f)
+
+        except (ValueError, OSError) as ex:
+            if self.verbose:
+                print(f'[FragmentCache] no fragments loaded: {ex}')
+
+    def _save(self):
+        try:
+            with open(self.cache_file, 'w') as f:
+                json.dump(self._fragments, f)
+
+        except OSError as ex:
+            print(f'[FragmentCache] ERROR: cannot write fragments: {ex}')
+
+    def get(self, url: str):
+        with self._lock:
+            entry = self._fragments.get(url)
+
+        return None if entry is None else entry[2]
+
+    def retain(self, urls: list):
+        '''
+        Drop cached fragments not in urls.
+        '''
+        with self._lock:
+            dropped = [url for url in self._fragments if url not in urls]
+
+            for url in dropped:
+                del self._fragments[url]
+
+            if dropped:
+                self.version += 1
+                self._save()
+
+    def fetch(self, wifi_man, url: str):
+        '''
+        Download and validate a fragment if it changed. Returns True if it
+        changed, False if not, None if the download failed or the fragment
+        is invalid (the cached fragment is kept).
+        '''
+        with self._lock:
+            entry = self._fragments.get(url)
+
+        headers = {}
+
+        if entry is not None and entry[0]:
+            headers['If-None-Match'] = entry[0]
+
+        status, response_headers, text = wifi_man.request('GET', url, headers)
+
+        if status == 304:
+            return False
+
+        if status != 200 or text is None:
+            return None
+
+        etag = response_headers.get('etag')
+        digest = binascii.hexlify(hashlib.sha256(text.encode()).digest()).decode()
+
+        if entry is not None and entry[1] == digest:
+            with self._lock:
+                self._fragments[url] = [etag, digest, entry[2]]
+                self._save()
+            return False
+
+        try:
+            fragment = json.loads(text)
+            validate(fragment)
+
+        except (ValueError, AssertionError) as ex:
+            print(f'[FragmentCache] ERROR: invalid fragment {url}: {ex}')
+            return None
+
+        if self.verbose:
+            print(f'[FragmentCache] fragment {url} updated')
+
+        with self._lock:
+            self._fragments[url] = [etag, digest, fragment]
+            self.version += 1
+            self._save()
+
+        return True
@@ -1,51 +1,81 @@
 import json
+import time
 
-from machine import Timer
 from neopixel import NeoPixel
 
-from leds import LEDs
+import tracer
+from colors import Palette, blend, unpack
+from leds import LEDs, NeoPixelSegment
 from logging import log as print
 from datetime import date, datetime
+from fragments import include_urls, merge
+from outputs import output_for
+from render import ANIMATION, BLINK, FADE, appearance, compile_plan, compile_plans
+from schedule import Schedule, feed_urls
+from sequencer import Sequencer
 
 
 class GetUpClock:
     def __init__(
         self,
-        leds: LEDs | NeoPixel,
+        leds: LEDs | NeoPixel | NeoPixelSegment,  # or an output backend (see outputs.py)
         error_state_leds: str = None,
         blink_period: int = 1000,  # ms
+        frame_period: int = 50,  # ms, for keyframe animations
+        gamma: float = 2.2,
         cache_file: str = "cache_clock.json",
+        host=None,
+        sequencer: Sequencer = None,
+        feed_cache=None,  # FeedCache for rules with ICS feeds ("cond_ics")
+        fragment_cache=None,  # FragmentCache for configs with includes
+        stats=None,  # TransitionStats, records transition delays
         verbose: bool = True,
     ):
         self.leds = leds
+        self.output = output_for(leds)
+        self.host = host
+        self.feed_cache = feed_cache
+        self.fragment_cache = fragment_cache
+        self.stats = stats
         self.blink_period = blink_period
+        self.frame_period = frame_period
         self.cache_file = cache_file
         self.verbose = verbose
 
-        if isinstance(leds, LEDs):
-            self.error_state = {
-                "name": "RULE_ERROR",
-                "leds": "all",
-                "blink": True,
-            }
-            if error_state_leds is not None:
-                self.error_state["leds"] = error_state_leds
-        else:
-            assert isinstance(leds, NeoPixel)
-            self.error_state = {
-                "name": "RULE_ERROR",
-                "color": "#ff0000",
-                "luminosity": .5,
-                "blink": True,
-            }
+        self.error_state = self.output.error_state(error_state_leds)
 
         self._state = None
         self._last_date = None
+        self._transitions_today = None
         self._fader = None
-        self._timer = None
+        self._pattern = None
+        self._palette = Palette(gamma)
+        self._schedule = None
+        self._feeds_version = None
+        self._fragments_version = None
+        self._config = {}  # config with fragments merged
+        self._plans = {}
+        self._error_plan = None
+        self._animation = None
+        self._animation_start = 0
+        self._animation_frame_cb = self._animation_frame  # bound once, no allocation in timer
+        self._fade_on_cb = self._fade_on
+        self._off_cb = self.output.off
+
+        if sequencer is None:
+            sequencer = Sequencer() if host is None else host.sequencer
+
+        self.sequencer = sequencer
+
+        if host is not None:
+            host.add(self)
 
         self.load_cache()
 
+    @property
+    def state_name(self):
+        return None if self._state is None else self._state["name"]
+
     def load_cache(self):
         if self.verbose:
             print(f'[GetUpClock] loading data from cache')
@@ -63,6 +93,51 @@ class GetUpClock:
             self.last_updated = None
             self.data = {}
 
+        self._compile()
+
+    def _compile(self):
+        # compile the config into a schedule and a render plan per state, so
+        # config errors show up here and not when a state is activated
+
+        self._schedule = None
+        self._plans = {}
+        self._config = {}
+
+        try:
+            schedule = None
+
+            if self.feed_cache is not None:
+                self._feeds_version = self.feed_cache.version
+
+            if self.fragment_cache is not None:
+                self._fragments_version = self.fragment_cache.version
+
+            config = merge(self.data, self.fragment_cache)
+
+            if config:
+                if self.host is None:
+                    schedule = Schedule(config, self.feed_cache)
+                else:
+                    shared, schedule = self.host.schedule(config, self.feed_cache)
+
+                    if config is self.data:
+                        self.data = shared
+
+                    config = shared
+
+            states = config.get('states', [])
+            self._palette.compile(states + [self.error_state])
+            self._plans = compile_plans(states, self.output, self._palette, schedule)
+            self._config = config
+            self._schedule = schedule
+
+        except Exception as ex:
+            print(f'[GetUpClock] ERROR compiling cfg: {ex}')
+            tracer.event(tracer.ERROR, aux=tracer.ERR_COMPILE)
+            self._palette.compile([self.error_state])
+
+        self._error_plan = compile_plan(self.error_state, self.output, self._palette)
+
     def write_cache(self, data, today):
         if self.verbose:
             print(f'[GetUpClock] writing data to cache')
@@ -80,55 +155,177 @@ class GetUpClock:
         self,
         data,
     ):
+        '''
+        Apply a new config. Returns False if it was not applied because
+        fragments it includes are not cached yet (the current config is kept),
+        True otherwise (invalid configs are applied and show the error state).
+        '''
         if self.verbose:
             print(f'[GetUpClock] updating data')
 
         if data:  # don't write to cache if download fails
             today = date.today()
-            new_data = data != self.data
+            new_data = data != self.data or (
+                self.feed_cache is not None and self.feed_cache.version != self._feeds_version) or (
+                self.fragment_cache is not None and self.fragment_cache.version != self._fragments_version)
+
+            if new_data and self.data and self._missing_fragments(data):
+                print('[GetUpClock] ERROR: fragments of the new cfg are not cached, keeping the current one')
+                return False
 
             self.last_updated = today
 
             if new_data:
                 self.data = data
+                self._compile()
                 self.write_cache(data, today)
-                self.step(force_update=True)
+                self._reload()
 
-    def _get_transitions_today(self, now: datetime):
-        # get transitions (time, new state) for the current day
+        return True
 
-        rule = None
+    def _missing_fragments(self, data: dict):
+        # URLs of fragments included by a config that are not cached yet
+        return [
+            url for url in include_urls(data)
+            if self.fragment_cache is None or self.fragment_cache.get(url) is None]
 
-        for rule in self.data['rules']:
-            if f'{now.year}-{now.month:02d}-{now.day:02d}' in rule.get('cond_date', []):
-                break
+    def _reload(self, now: datetime = None):
+        # apply a recompiled config (or feeds). The running state (blinking,
+        # fade, animation) is kept if it looks the same with the new config,
+        # only today's pending transitions are replaced. Otherwise the day is
+        # re-evaluated as on a date change.
 
-            if now.weekday() in rule.get('cond_weekday', []):
-                break
+        if now is None:
+            now = datetime.now()
+
+        old_state = self._state
+        old_pending = self._transitions_today
+
+        keep = (
+            self._schedule is not None and
+            old_state is not None and
+            old_state is not self.error_state and
+            old_pending is not None and
+            self._last_date == now.date())
+
+        if keep:
+            transitions = self._schedule.transitions(now.date(), now.weekday())
+            state = None
+
+            while transitions and now >= transitions[0][0]:
+                state = transitions.pop(0)[1]
 
-        assert rule is not None
+            keep = state is not None and appearance(state) == appearance(old_state)
+
+        if keep and self._plans[id(state)].pattern & FADE:
+            # a fade also depends on the following transition
+            keep = (
+                len(transitions) > 0 and len(old_pending) > 0 and
+                transitions[0][0] == old_pending[0][0] and
+                appearance(transitions[0][1]) == appearance(old_pending[0][1]))
+
+        if not keep:
+            self._state = None  # re-render
+            self.step(now, force_update=True)
+            return
 
         if self.verbose:
-            print(f'[GetUpClock] using rule: {rule["name"]}')
+            print(f'[GetUpClock] config reloaded, keeping state {state["name"]}')
+
+        self._state = state
+        self._transitions_today = transitions
+
+    def feeds(self, data: dict = None):
+        '''
+        URLs of the ICS feeds used by the rules of a config and its fragments
+        (default: the current config).
+        '''
+        if data is None:
+            data = self.data
+
+        try:
+            data = merge(data, self.fragment_cache)
+        except AssertionError:
+            pass  # fragments not loaded, feeds of the config only
+
+        urls = []
+
+        for rule in data.get('rules', []):
+            urls += [url for url in feed_urls(rule) if url not in urls]
+
+        return urls
+
+    def includes(self, data: dict = None):
+        '''
+        URLs of the fragments included by a config (default: the current
+        config).
+        '''
+        return include_urls(self.data if data is None else data)
+
+    def _get_transitions_today(self, now: datetime):
+        # get transitions (time, new state) for the current day
+
+        assert self._schedule is not None, 'No valid config'
 
         today = now.date()
+        weekday = now.weekday()
 
-        def get_datetime(h, m):
-            return datetime(
-                today.year,
-                today.month,
-                today.day,
-                h,
-                m)
+        if self.verbose:
+            print(f'[GetUpClock] using rule: {self._schedule.rule(today, weekday)["name"]}')
+
+        return self._schedule.transitions(today, weekday)
+
+    def next_transitions(
+        self,
+        n: int = 1,
+        now: datetime = None,
+    ):
+        '''
+        Get the next n transitions (datetime, state) after now (default:
+        current time), across days and rules.
+
+        Example:
+
+                # when is the next CAN_GET_UP?
+                for t, state in app.next_transitions(10):
+                    if state["name"] == "CAN_GET_UP":
+                        break
+        '''
+        if now is None:
+            now = datetime.now()
+
+        if self._schedule is None:
+            return []
+
+        return self._schedule.next_transitions(now, n)
+
+    def deadlines(
+        self,
+        now: datetime = None,
+        horizon: int = 3600,  # s
+    ):
+        '''
+        Times of the transitions within horizon (s) after now, e.g. to keep
+        config syncs (which may block the main loop) away from them.
+        '''
+        if now is None:
+            now = datetime.now()
+
+        if self._schedule is None:
+            return []
+
+        deadlines = []
+
+        if self._transitions_today and now >= self._transitions_today[0][0]:
+            deadlines += [now]  # due, not applied yet
 
-        transitions = [(get_datetime(0, 0), self.data['states'][0])]
+        for t, state in self.next_transitions(2 * len(self._config.get('states', [])), now):
+            if now.diff_seconds(t) > horizon:
+                break
 
-        for i, t in enumerate(rule['transitions']):
-            if t is not None:
-                t_unpacked = tuple(map(int, t.split(':')))
-                transitions += [(get_datetime(*t_unpacked), self.data['states'][i + 1])]
+            deadlines += [t]
 
-        return transitions
+        return deadlines
 
     def step(
         self,
@@ -142,6 +339,9 @@ class GetUpClock:
         if self._state == self.error_state and not force_update:
             return
 
+        # transitions due since the last step are timed (not on reloads)
+        timed = not force_update and self._last_date is not None
+
         if force_update or self._last_date is None or now.date() != self._last_date:
             try:
                 self._transitions_today = self._get_transitions_today(now)
@@ -151,6 +351,7 @@ class GetUpClock:
 
             except Exception as ex:
                 print(f'[GetUpClock] ERROR parsing cfg: {ex}')
+                tracer.event(tracer.ERROR, aux=tracer.ERR_PARSE)
                 self._transitions_today = None
 
         if self._fader is not None:
@@ -158,18 +359,28 @@ class GetUpClock:
 
         try:
             new_state = None
+            new_time = None
+            skipped = -1
 
             while (len(self._transitions_today) > 0):
                 next_time, next_state = self._transitions_today[0]
 
                 if now >= next_time:
                     new_state = next_state
+                    new_time = next_time
+                    skipped += 1
                     self._transitions_today.pop(0)
                     continue
 
                 break
 
             if new_state is not None:
+                if timed:
+                    tracer.event(tracer.TRANSITION, new_time.diff_seconds(now), min(skipped, 255))
+
+                    if self.stats is not None:
+                        self.stats.record(new_time, now, skipped)
+
                 # get following state (for transitions)
                 if len(self._transitions_today) > 0:
                     following_time = self._transitions_today[0][0]
@@ -181,10 +392,12 @@ class GetUpClock:
                 self._activate_state(
                     new_state,
                     following_state,
-                    following_time)
+                    following_time,
+                    new_time.diff_seconds(now))
 
         except Exception as ex:
             print(f'[GetUpClock] ERROR applying rules: {ex}')
+            tracer.event(tracer.ERROR, aux=tracer.ERR_APPLY)
             self._activate_state(self.error_state, None, None)
 
         self._last_date = now.date()
@@ -194,166 +407,104 @@ class GetUpClock:
         state: dict,
         following_state: dict,
         following_time: datetime,
+        elapsed: int = 0,  # s since the state's scheduled start
     ):
         if self._state != state:
             if self.verbose:
                 print(f'[GetUpClock] activating state {state["name"]}')
 
-            if self._fader is not None:
-                self._fader = None
-
-            if self._timer is not None:
-                self._timer.deinit()
-                self._timer_state = TimerState()
-
-            if isinstance(self.leds, LEDs):
-                self.leds.all.off()
-
-                if state.get("leds"):
-                    groups = [getattr(self.leds, group) for group in state["leds"].split(",")]
-
-                    if state.get("blink"):
-                        self._timer_state = TimerState([
-                            lambda: [group.toggle() for group in groups],
-                            lambda: [group.toggle() for group in groups],
-                        ])
-                        self._timer = Timer(
-                            mode=Timer.PERIODIC,
-                            period=self.blink_period,
-                            callback=self._timer_state.next)
-                    else:
-                        [group.on() for group in groups]
-            else:
-                assert isinstance(self.leds, NeoPixel)
+            states = self._config.get('states', [])
+            tracer.event(tracer.STATE, states.index(state) if state in states else -1)
 
-                color = state.get("color", None)
+            plan = self._error_plan if state is self.error_state else self._plans[id(state)]
 
-                if color is None:
-                    self.leds.fill((0, 0, 0))
-                    self.leds.write()
-                else:
-                    rgb = hex_to_rgb(color, state.get("luminosity", 1))
-
-                    if state.get("transition"):
-                        assert following_state is not None
-                        assert "color" in following_state
-                        assert following_time is not None
-
-                        if state.get("blink"):
-                            def apply_func(color):
-                                pass
-                        else:
-                            def apply_func(color):
-                                self.leds.fill(color)
-                                self.leds.write()
-
-                        self._fader = FaderState(
-                            start=datetime.now(),
-                            end=following_time,
-                            color_start=rgb,
-                            color_end=hex_to_rgb(following_state["color"]),
-                            apply_func=apply_func)
-
-                    if state.get("blink"):
-                        if state.get("transition"):
-                            def on():
-                                self._fader.fill(rgb)
-                                self.leds.write()
-                        else:
-                            def on():
-                                self.leds.fill(rgb)
-                                self.leds.write()
-
-                        def off():
-                            self.leds.fill((0, 0, 0))
-                            self.leds.write()
-
-                        self._timer_state = TimerState([on, off])
-                        self._timer = Timer(
-                            mode=Timer.PERIODIC,
-                            period=self.blink_period,
-                            callback=self._timer_state.next)
-                    else:
-                        self.leds.fill(rgb)
-                        self.leds.write()
+            self._fader = None
+            self._animation = None
+
+            if self._pattern is not None:
+                self._pattern.deinit()
+                self._pattern = None
+
+            if plan.pattern == ANIMATION:
+                self._animation = plan.animation
+                self._animation_start = time.ticks_add(time.ticks_ms(), -1000 * elapsed)
+                self._animation_frame()
+
+                if 1000 * elapsed < plan.animation.duration:
+                    self._pattern = self.sequencer.periodic(self.frame_period, self._animation_frame_cb)
+
+            else:
+                if plan.pattern & FADE:
+                    self._fader = FaderState(
+                        start=datetime.now(),
+                        end=following_time,
+                        color_start=plan.color,
+                        color_end=self._plans[id(following_state)].color,
+                        lut=self._palette.lut,
+                        apply_func=None if plan.pattern & BLINK else self.output.show)
+
+                if plan.pattern & BLINK:
+                    self.output.off()
+                    self._pattern = self.sequencer.pattern(
+                        (self.blink_period, self.blink_period),
+                        (self._fade_on_cb if self._fader is not None else plan.show, self._off_cb))
+                elif self._fader is None:
+                    plan.show()
 
             self._state = state
 
+    def _animation_frame(self, *args):
+        animation = self._animation
 
-class TimerState:
-    def __init__(
-        self,
-        steps: list = [],
-        *,
-        current_step: int = 0,
-    ):
-        self.current_step = current_step
-        self.steps = steps
+        if animation is None:
+            return
 
-    def next(self, *args, **kwargs):
-        self.steps[self.current_step]()
-        self.current_step = (self.current_step + 1) % len(self.steps)
+        elapsed = time.ticks_diff(time.ticks_ms(), self._animation_start)
+        self.output.render(animation, elapsed, self._palette.lut)
+
+        if elapsed >= animation.duration and self._pattern is not None:
+            # animation finished, hold last frame
+            self._pattern.deinit()
+            self._pattern = None
+
+    def _fade_on(self):
+        self.output.show(self._fader.current)
 
 
 class FaderState:
+    '''
+    Fade between two packed perceptual colours (see colors.py). Interpolation
+    is done in perceptual space with integer math, the result is mapped through
+    the gamma lookup table.
+    '''
     def __init__(
         self,
         start: datetime,
         end: datetime,
-        color_start: tuple,
-        color_end: tuple,
+        color_start: int,
+        color_end: int,
+        lut: bytearray,
         apply_func,
     ):
         self.start = start
         self.end = end
         self.color_start = color_start
         self.color_end = color_end
+        self.lut = lut
         self.apply_func = apply_func
 
-        self.current = color_start
+        self.current = unpack(color_start, lut)
         self.diff = start.diff_seconds(end)
         assert self.diff > 0
 
+        if apply_func is not None:
+            apply_func(self.current)
+
     def step(self, *args, **kwargs):
-        progress = 1 - datetime.now().diff_seconds(self.end) / self.diff
-        color = [(v1 - v0) * progress + v0 for v0, v1 in zip(self.color_start, self.color_end)]
-        color = [int(round(v)) for v in color]
-        color = clip(color, 0, 255)
-        self.apply_func(color)
+        remaining = datetime.now().diff_seconds(self.end)
+        progress = 256 - (max(0, min(remaining, self.diff)) << 8) // self.diff
+        color = unpack(blend(self.color_start, self.color_end, progress), self.lut)
         self.current = color
 
-
-def hex_to_rgb(
-    color: str,
-    luminosity: int | float = 1,
-):
-    if len(color) == 7:
-        assert color.startswith("#")
-        color = color[1:]
-    else:
-        assert len(color) == 6
-
-    r, g, b = color[:2], color[2:4], color[4:]
-    r, g, b = int(r, 16), int(g, 16), int(b, 16)
-
-    if luminosity != 1:
-        luminosity = clip(luminosity, 0, 1)
-        r, g, b = r * luminosity, g * luminosity, b * luminosity
-        r, g, b = map(int, map(round, (r, g, b)))
-
-    return clip([r, g, b], 0, 255)
-
-
-def clip(
-    v: int | float | list[int | float],
-    vmin: int | float | None = None,
-    vmax: int | float | None = None,
-):
-    if isinstance(v, list):
-        return [clip(v0, vmin, vmax) for v0 in v]
-    if vmin is not None:
-        v = max(v, vmin)
-    if vmax is not None:
-        v = min(v, vmax)
-    return v
-
+        if self.apply_func is not None:
+            self.apply_func(color)
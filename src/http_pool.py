@@ -0,0 +1,430 @@
+import io
+import json
+import socket
+import ssl
+
+from logging import log as print
+
+try:
+    import deflate  # MicroPython
+    zlib = None
+except ImportError:
+    import zlib  # CPython
+    deflate = None
+
+
+REDIRECTS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 4
+
+
+class ConnectionPool:
+    '''
+    Minimal HTTP/1.1 client keeping one keep-alive connection per host, so
+    multiple downloads within one sync window share a single TCP and TLS
+    handshake. Supports Content-Length and chunked responses, gzip or
+    deflate encoded bodies (decompressed while streaming), and redirects (up
+    to MAX_REDIRECTS, 303 continues with GET).
+
+    Example:
+
+            pool = ConnectionPool()
+            response = pool.request("GET", "https://...")
+            if response.status == 200:
+                data = response.json()
+            response.close()  # hands the connection back to the pool
+            pool.close()  # closes all sockets
+    '''
+    def __init__(
+        self,
+        timeout: int = 10,  # s
+        verbose: bool = True,
+    ):
+        self.timeout = timeout
+        self.verbose = verbose
+
+        self._connections = {}
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict = None,
+        body: bytes = None,
+    ):
+        hops = 0
+
+        while True:
+            response = self._send(method, url, headers, body)
+            location = response.headers.get('location')
+
+            if response.status not in REDIRECTS or location is None or hops >= MAX_REDIRECTS:
+                return response
+
+            response.close()
+            hops += 1
+            url = resolve_url(url, location)
+
+            if response.status == 303 or (response.status in (301, 302) and method == 'POST'):
+                method = 'GET'
+                body = None
+
+            if self.verbose:
+                print(f'[HTTP] redirected ({response.status}) to {url}')
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        headers: dict,
+        body: bytes,
+    ):
+        scheme, host, port, path = parse_url(url)
+        key = (scheme, host, port)
+
+        lines = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {host}',
+            'Connection: keep-alive',
+        ]
+
+        if body is not None:
+            lines += [f'Content-Length: {len(body)}']
+
+        for k, v in (headers or {}).items():
+            lines += [f'{k}: {v}']
+
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+        conn = self._connections.pop(key, None)
+        reused = conn is not None
+
+        while True:
+            if conn is None:
+                conn = Connection(scheme, host, port, self.timeout)
+
+                if self.verbose:
+                    print(f'[HTTP] connected to {host}:{port}')
+
+            try:
+                conn.write(head)
+                if body is not None:
+                    conn.write(body)
+
+                status, response_headers = conn.read_head()
+                break
+
+            except (OSError, ValueError) as ex:
+                conn.close()
+                conn = None
+
+                if not reused:
+                    raise OSError(f'request failed: {ex}')
+
+                # stale keep-alive connection, retry once with a new one
+
+                if self.verbose:
+                    print(f'[HTTP] reconnecting to {host}:{port}')
+
+                reused = False
+
+        return Response(self, key, conn, status, response_headers, method == 'HEAD')
+
+    def _release(self, key, conn):
+        old = self._connections.pop(key, None)
+        if old is not None:
+            old.close()
+
+        self._connections[key] = conn
+
+    def close(self):
+        for conn in self._connections.values():
+            conn.close()
+
+        self._connections = {}
+
+
+class Connection:
+    def __init__(self, scheme: str, host: str, port: int, timeout: int):
+        addr = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][-1]
+
+        sock = socket.socket()
+        sock.settimeout(timeout)
+
+        try:
+            sock.connect(addr)
+
+            if scheme == 'https':
+                if hasattr(ssl, 'create_default_context'):  # CPython
+                    sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+                else:
+                    sock = ssl.wrap_socket(sock, server_hostname=host)
+
+        except OSError:
+            sock.close()
+            raise
+
+        self._sock = sock
+
+        # MicroPython sockets are streams, CPython needs a file wrapper
+        self._reader = sock if hasattr(sock, 'readline') else sock.makefile('rb')
+        self.write = sock.write if hasattr(sock, 'write') else sock.sendall
+
+    def readline(self):
+        line = self._reader.readline()
+        if not line:
+            raise OSError('connection closed')
+        return line
+
+    def read(self, n: int):
+        data = self._reader.read(n)
+        if not data:
+            raise OSError('connection closed')
+        return data
+
+    def read_head(self):
+        status_line = self.readline().split(None, 2)
+
+        if len(status_line) < 2 or not status_line[0].startswith(b'HTTP/'):
+            raise ValueError('invalid status line')
+
+        status = int(status_line[1])
+        headers = {}
+
+        while True:
+            line = self.readline()
+
+            if line in (b'\r\n', b'\n'):
+                break
+
+            k, _, v = line.decode().partition(':')
+            headers[k.strip().lower()] = v.strip()
+
+        return status, headers
+
+    def close(self):
+        try:
+            if self._reader is not self._sock:
+                self._reader.close()
+            self._sock.close()
+        except OSError:
+            pass
+
+
+class Response(io.IOBase):
+    '''
+    Streaming HTTP response. Read the raw body with read() or the decoded
+    (decompressed) body with stream(), text, or json(), then close() it to
+    hand the connection back to the pool (or close it).
+    '''
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        key: tuple,
+        conn: Connection,
+        status: int,
+        headers: dict,
+        no_body: bool = False,
+    ):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self.status = status
+        self.status_code = status  # requests compatibility
+        self.headers = headers
+
+        self._chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        self._keep_alive = headers.get('connection', '').lower() != 'close'
+
+        if no_body or status == 204 or status == 304 or 100 <= status < 200:
+            self._remaining = 0
+        elif self._chunked:
+            self._remaining = None  # start of next chunk
+        elif 'content-length' in headers:
+            self._remaining = int(headers['content-length'])
+        else:
+            self._remaining = -1  # until connection is closed
+            self._keep_alive = False
+
+    @property
+    def done(self):
+        return self._remaining == 0
+
+    def read(self, n: int = -1):
+        '''
+        Read up to n bytes of the (de-chunked) body, all if n < 0. Returns b''
+        at the end of the body.
+        '''
+        if n < 0:
+            parts = []
+            while True:
+                data = self.read(1024)
+                if not data:
+                    break
+                parts += [data]
+            return b''.join(parts)
+
+        if self._remaining == 0:
+            return b''
+
+        if self._remaining == -1:
+            data = self._conn._reader.read(n)
+            if not data:
+                self._remaining = 0
+            return data
+
+        if self._remaining is None:
+            size = int(self._conn.readline().split(b';')[0].strip(), 16)
+
+            if size == 0:
+                # skip trailers
+                while self._conn.readline() not in (b'\r\n', b'\n'):
+                    pass
+                self._remaining = 0
+                return b''
+
+            self._remaining = size
+
+        data = self._conn.read(min(n, self._remaining))
+        self._remaining -= len(data)
+
+        if self._remaining == 0 and self._chunked:
+            self._conn.readline()  # CRLF after chunk
+            self._remaining = None
+
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        n = len(data)
+        buf[:n] = data
+        return n
+
+    def stream(self):
+        '''
+        Body as a stream, decompressed on the fly if it is gzip or deflate
+        encoded.
+        '''
+        encoding = self.headers.get('content-encoding', '').lower()
+
+        if encoding in ('gzip', 'deflate'):
+            if deflate is not None:
+                return deflate.DeflateIO(self, deflate.AUTO)
+            return InflateStream(self)
+
+        if encoding not in ('', 'identity'):
+            raise ValueError(f'unsupported content encoding: {encoding}')
+
+        return self
+
+    @property
+    def content(self):
+        return self.stream().read()
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        # json.load streams on MicroPython, no full body buffer needed
+        return json.load(self.stream())
+
+    def close(self):
+        if self._conn is None:
+            return
+
+        if self._keep_alive and self._remaining != -1:
+            try:
+                # drain the rest of the body so the connection can be reused
+                while self.read(256):
+                    pass
+            except (OSError, ValueError):
+                self._keep_alive = False
+
+        if self._keep_alive:
+            self._pool._release(self._key, self._conn)
+        else:
+            self._conn.close()
+
+        self._conn = None
+
+
+class InflateStream:
+    '''
+    Streaming gzip / zlib decompression using zlib (CPython stand-in for
+    MicroPython's deflate.DeflateIO). Corrupt data raises ValueError.
+    '''
+    def __init__(self, raw, chunk_size: int = 512):
+        self._raw = raw
+        self._chunk_size = chunk_size
+        self._inflate = zlib.decompressobj(32 + 15)  # auto-detect gzip / zlib
+        self._buf = b''
+        self._eof = False
+
+    def read(self, n: int = -1):
+        while not self._eof and (n < 0 or len(self._buf) < n):
+            data = self._raw.read(self._chunk_size)
+
+            try:
+                if data:
+                    self._buf += self._inflate.decompress(data)
+                else:
+                    self._buf += self._inflate.flush()
+                    self._eof = True
+
+            except zlib.error as ex:
+                # corrupt body, raised like other invalid responses
+                raise ValueError(f'cannot decompress body: {ex}')
+
+        if n < 0:
+            n = len(self._buf)
+
+        data, self._buf = self._buf[:n], self._buf[n:]
+        return data
+
+
+def parse_url(url: str):
+    '''
+    Split a URL into (scheme, host, port, path).
+    '''
+    scheme, sep, rest = url.partition('://')
+
+    if not sep:
+        raise ValueError(f'invalid url: {url}')
+
+    scheme = scheme.lower()
+
+    if scheme not in ('http', 'https'):
+        raise ValueError(f'unsupported scheme: {scheme}')
+
+    host, sep, path = rest.partition('/')
+    path = '/' + path
+
+    port = 443 if scheme == 'https' else 80
+
+    if ':' in host:
+        host, port = host.split(':')
+        port = int(port)
+
+    return scheme, host, port, path
+
+
+def resolve_url(base: str, location: str):
+    '''
+    Absolute URL of a (possibly relative) redirect location.
+    '''
+    if '://' in location:
+        return location
+
+    scheme, _, rest = base.partition('://')
+
+    if location.startswith('//'):
+        return f'{scheme}:{location}'
+
+    host, _, path = rest.partition('/')
+
+    if not location.startswith('/'):
+        # relative to the directory of the base path (without query)
+        directory = ('/' + path.split('?')[0]).rsplit('/', 1)[0]
+        location = f'{directory}/{location}'
+
+    return f'{scheme}://{host}{location}'
@@ -0,0 +1,346 @@
+'''
+iCalendar (ICS) feeds as date conditions (e.g. school holidays).
+
+Feeds are parsed line by line while streaming, only the event being parsed is
+kept in memory. The result of a feed is a list of date ranges (YYYYMMDD keys,
+end exclusive), cached on flash together with the ETag and content hash of
+the feed: unchanged feeds are not downloaded (ETag) or not parsed (hash)
+again.
+
+Supported: all-day and timed events (DTSTART with DTEND or DURATION in days /
+weeks). Recurring events (RRULE) are not expanded, only their first
+occurrence is used.
+
+Example:
+
+        feeds = FeedCache()
+        feeds.fetch(wifi_man, "https://.../holidays.ics")  # True if changed
+        feeds.ranges("https://.../holidays.ics")  # [(20241223, 20250104), ...]
+'''
+import _thread
+import binascii
+import hashlib
+import json
+import os
+
+from datetime import date, datetime
+from logging import log as print
+
+
+MAX_LINE = 256  # longer (unfolded) lines are truncated, no needed value is that long
+MAX_EVENT_DAYS = 366  # longer events are cut off
+
+
+def decode(line: bytes):
+    # lines that are not valid UTF-8 (or cut in a character at MAX_LINE) are
+    # returned empty, the values needed (dates, durations) are ASCII
+    try:
+        return line.decode()
+    except UnicodeError:
+        return ''
+
+
+def iter_lines(stream, chunk_size: int = 256):
+    '''
+    Unfolded lines (str, without line break) of a stream, in bounded memory.
+    '''
+    line = b''
+    pending = None
+
+    while True:
+        chunk = stream.read(chunk_size)
+
+        if not chunk:
+            break
+
+        start = 0
+
+        while True:
+            end = chunk.find(b'\n', start)
+
+            if end < 0:
+                line = (line + chunk[start:])[:MAX_LINE]
+                break
+
+            line = (line + chunk[start:end])[:MAX_LINE].rstrip(b'\r')
+            start = end + 1
+
+            if line[:1] in (b' ', b'\t') and pending is not None:
+                pending = (pending + line[1:])[:MAX_LINE]  # folded line
+            else:
+                if pending is not None:
+                    yield decode(pending)
+                pending = line
+
+            line = b''
+
+    line = line.rstrip(b'\r')
+
+    if line[:1] in (b' ', b'\t') and pending is not None:
+        pending = (pending + line[1:])[:MAX_LINE]
+    elif line:
+        if pending is not None:
+            yield decode(pending)
+        pending = line
+
+    if pending is not None:
+        yield decode(pending)
+
+
+def next_key(key: int):
+    return date(key // 10000, key // 100 % 100, key % 100).next_day().key()
+
+
+def add_days(key: int, days: int):
+    for _ in range(days):
+        key = next_key(key)
+    return key
+
+
+def parse_value(value: str):
+    '''
+    DATE or DATE-TIME value into (date key, has time of day). Raises
+    ValueError if the value does not start with a valid date.
+    '''
+    if len(value) < 8 or not value[:8].isdigit():
+        raise ValueError(f'invalid date {value}')
+
+    key = int(value[:8])
+    y, m, d = key // 10000, key // 100 % 100, key % 100
+
+    if y < 1 or not 1 <= m <= 12 or not 1 <= d <= datetime.days_in_month(y, m):
+        raise ValueError(f'invalid date {value}')
+
+    timed = len(value) > 9 and value[9:15].strip('0Z') != ''
+    return key, timed
+
+
+def parse_duration(value: str):
+    # days of a "P<n>D" / "P<n>W" duration (time parts round up to a day)
+    value = value.lstrip('+')
+    assert value.startswith('P'), f'Invalid duration {value}'
+
+    days = 0
+    number = ''
+
+    for c in value[1:]:
+        if c.isdigit():
+            number += c
+        elif c == 'W':
+            days += 7 * int(number)
+            number = ''
+        elif c == 'D':
+            days += int(number)
+            number = ''
+        elif c == 'T':
+            days += 1
+            break
+
+    return max(1, days)
+
+
+def parse_events(lines):
+    '''
+    Date ranges (start key, end key) of the events in ICS lines, end exclusive.
+    '''
+    in_event = False
+    start = end = duration = None
+
+    for line in lines:
+        if line == 'BEGIN:VEVENT':
+            in_event = True
+            start = end = duration = None
+            continue
+
+        if not in_event:
+            continue
+
+        if line == 'END:VEVENT':
+            in_event = False
+
+            if start is None:
+                continue
+
+            key, timed = start
+
+            if end is not None:
+                end_key, end_timed = end
+                if end_timed or end_key == key:
+                    end_key = next_key(end_key)  # timed events include their last day
+            elif duration is not None:
+                end_key = add_days(key, min(duration, MAX_EVENT_DAYS))
+            else:
+                end_key = next_key(key)
+
+            if end_key > key + 10000:  # more than a year, cut off at MAX_EVENT_DAYS
+                end_key = add_days(key, MAX_EVENT_DAYS)
+
+            if end_key > key:
+                yield key, end_key
+
+            continue
+
+        name, _, value = line.partition(':')
+        name = name.split(';')[0].upper()
+
+        try:
+            if name == 'DTSTART':
+                start = parse_value(value)
+            elif name == 'DTEND':
+                end = parse_value(value)
+            elif name == 'DURATION':
+                duration = parse_duration(value)
+        except (ValueError, AssertionError) as ex:
+            print(f'[ICS] ERROR: skipping invalid {name} {value}: {ex}')
+
+
+def merge_ranges(ranges: list):
+    '''
+    Sorted, overlapping or adjacent ranges merged.
+    '''
+    merged = []
+
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged += [[start, end]]
+
+    return merged
+
+
+class FeedCache:
+    '''
+    Parsed ICS feeds by URL, persisted on flash. version is incremented
+    whenever a feed changes (e.g. to recompile schedules). Feeds can be read
+    while another thread fetches (entries are replaced, not modified).
+    '''
+    def __init__(
+        self,
+        cache_file: str = "feeds.json",
+        tmp_file: str = "feed.tmp",
+        verbose: bool = True,
+    ):
+        self.cache_file = cache_file
+        self.tmp_file = tmp_file
+        self.verbose = verbose
+
+        self.version = 0
+        self._lock = _thread.allocate_lock()  # fetch() may run in a sync thread
+        self._feeds = {}  # url -> [etag, content hash, ranges]
+
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                self._feeds = json.load(f)
+
+        except (ValueError, OSError) as ex:
+            if self.verbose:
+                print(f'[FeedCache] no feeds loaded: {ex}')
+
+    def _save(self):
+        try:
+            with open(self.cache_file, 'w') as f:
+                json.dump(self._feeds, f)
+
+        except OSError as ex:
+            print(f'[FeedCache] ERROR: cannot write feeds: {ex}')
+
+    def ranges(self, url: str):
+        with self._lock:
+            entry = self._feeds.get(url)
+
+        return [] if entry is None else entry[2]
+
+    def retain(self, urls: list):
+        '''
+        Drop cached feeds not in urls.
+        '''
+        with self._lock:
+            dropped = [url for url in self._feeds if url not in urls]
+
+            for url in dropped:
+                del self._feeds[url]
+
+            if dropped:
+                self.version += 1
+                self._save()
+
+    def _store(self, stream):
+        # copy the feed to flash, returns its content hash
+        sha = hashlib.sha256()
+        buf = bytearray(256)
+        view = memoryview(buf)
+
+        with open(self.tmp_file, 'wb') as f:
+            while True:
+                data = stream.read(len(buf))
+
+                if not data:
+                    break
+
+                n = len(data)
+                view[:n] = data
+                sha.update(view[:n])
+                f.write(view[:n])
+
+        return binascii.hexlify(sha.digest()).decode()
+
+    def fetch(self, wifi_man, url: str):
+        '''
+        Download and parse a feed if it changed. Returns True if it changed,
+        False if not, None if the download failed (cached ranges are kept).
+        '''
+        with self._lock:
+            entry = self._feeds.get(url)
+
+        headers = {}
+
+        if entry is not None and entry[0]:
+            headers['If-None-Match'] = entry[0]
+
+        try:
+            status, response_headers, digest = wifi_man.request(
+                'GET', url, headers, reader=self._store)
+
+            if status == 304:
+                return False
+
+            if status != 200 or digest is None:
+                return None
+
+            etag = response_headers.get('etag')
+
+            if entry is not None and entry[1] == digest:
+                with self._lock:
+                    self._feeds[url] = [etag, digest, entry[2]]
+                    self._save()
+                return False
+
+            try:
+                with open(self.tmp_file, 'rb') as f:
+                    ranges = merge_ranges(parse_events(iter_lines(f)))
+
+            except (OSError, ValueError, AssertionError) as ex:
+                print(f'[FeedCache] ERROR: cannot parse feed: {ex}')
+                return None
+
+        finally:
+            # the feed is parsed, unchanged, or broken: no need to keep it
+            try:
+                os.remove(self.tmp_file)
+            except OSError:
+                pass
+
+        if self.verbose:
+            print(f'[FeedCache] feed parsed, {len(ranges)} date ranges')
+
+        with self._lock:
+            self._feeds[url] = [etag, digest, ranges]
+            self.version += 1
+            self._save()
+
+        return True
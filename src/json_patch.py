@@ -0,0 +1,169 @@
+'''
+JSON Patch (RFC 6902) support for delta config updates.
+
+Example:
+
+        doc = {"rules": [{"cond_date": ["2024-12-24"]}]}
+        patch = [{"op": "add", "path": "/rules/0/cond_date/-", "value": "2024-12-25"}]
+        doc = apply_patch(doc, patch)
+
+Invalid patches (or patches not matching the document) raise a ValueError.
+The document is patched in place, copy it first if needed (see copy()).
+'''
+import json
+
+
+def copy(doc):
+    '''
+    Deep copy of a JSON document.
+    '''
+    return json.loads(json.dumps(doc))
+
+
+def parse_pointer(pointer: str):
+    '''
+    Split a JSON pointer (RFC 6901) into its unescaped tokens.
+    '''
+    if pointer == '':
+        return []
+
+    if not pointer.startswith('/'):
+        raise ValueError(f'invalid pointer: {pointer}')
+
+    return [t.replace('~1', '/').replace('~0', '~') for t in pointer[1:].split('/')]
+
+
+def _index(container: list, token: str, append: bool = False):
+    if append and token == '-':
+        return len(container)
+
+    if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+        raise ValueError(f'invalid list index: {token}')
+
+    i = int(token)
+
+    if i > len(container) or (i == len(container) and not append):
+        raise ValueError(f'list index out of range: {token}')
+
+    return i
+
+
+def _resolve(doc, tokens: list):
+    # get the parent container of the last token
+
+    for token in tokens[:-1]:
+        if isinstance(doc, dict):
+            if token not in doc:
+                raise ValueError(f'path not found: {token}')
+            doc = doc[token]
+        elif isinstance(doc, list):
+            doc = doc[_index(doc, token)]
+        else:
+            raise ValueError(f'cannot traverse into {token}')
+
+    return doc
+
+
+def _get(doc, path: str):
+    tokens = parse_pointer(path)
+
+    if not tokens:
+        return doc
+
+    parent = _resolve(doc, tokens)
+    token = tokens[-1]
+
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise ValueError(f'path not found: {path}')
+        return parent[token]
+    elif isinstance(parent, list):
+        return parent[_index(parent, token)]
+
+    raise ValueError(f'path not found: {path}')
+
+
+def _add(doc, path: str, value):
+    tokens = parse_pointer(path)
+
+    if not tokens:
+        return value
+
+    parent = _resolve(doc, tokens)
+    token = tokens[-1]
+
+    if isinstance(parent, dict):
+        parent[token] = value
+    elif isinstance(parent, list):
+        parent.insert(_index(parent, token, append=True), value)
+    else:
+        raise ValueError(f'cannot add to {path}')
+
+    return doc
+
+
+def _remove(doc, path: str):
+    tokens = parse_pointer(path)
+
+    if not tokens:
+        raise ValueError('cannot remove document root')
+
+    parent = _resolve(doc, tokens)
+    token = tokens[-1]
+
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise ValueError(f'path not found: {path}')
+        return parent.pop(token)
+    elif isinstance(parent, list):
+        return parent.pop(_index(parent, token))
+
+    raise ValueError(f'cannot remove {path}')
+
+
+def apply_patch(doc, patch: list):
+    '''
+    Apply a JSON patch (list of operations) to doc, returns the patched doc.
+    '''
+    if not isinstance(patch, list):
+        raise ValueError('patch needs to be a list of operations')
+
+    for op in patch:
+        try:
+            name = op['op']
+            path = op['path']
+        except (KeyError, TypeError):
+            raise ValueError(f'invalid operation: {op}')
+
+        try:
+            if name == 'add':
+                doc = _add(doc, path, op['value'])
+
+            elif name == 'remove':
+                _remove(doc, path)
+
+            elif name == 'replace':
+                if parse_pointer(path):
+                    _remove(doc, path)
+                doc = _add(doc, path, op['value'])
+
+            elif name == 'move':
+                if path.startswith(op['from'] + '/'):
+                    raise ValueError('cannot move into own child')
+                value = _remove(doc, op['from'])
+                doc = _add(doc, path, value)
+
+            elif name == 'copy':
+                doc = _add(doc, path, copy(_get(doc, op['from'])))
+
+            elif name == 'test':
+                if _get(doc, path) != op['value']:
+                    raise ValueError(f'test failed: {path}')
+
+            else:
+                raise ValueError(f'unknown operation: {name}')
+
+        except (KeyError, IndexError, TypeError) as ex:
+            raise ValueError(f'invalid operation {name} {path}: {ex}')
+
+    return doc
@@ -86,3 +86,49 @@ class LEDGroup:
         for led in self._leds:
             led.toggle()
 
+
+class NeoPixelSegment:
+    '''
+    A contiguous range of pixels of a NeoPixel strip, usable like a NeoPixel
+    (e.g. one per clock, see ClockHost).
+
+    If the segment is deferred, write() only marks it dirty and the owner
+    (ClockHost) writes the strip once per frame.
+
+    Example:
+
+            strip = NeoPixel(Pin(22), 8)
+            left = NeoPixelSegment(strip, 0, 4)
+            right = NeoPixelSegment(strip, 4, 4)
+    '''
+    def __init__(self, parent, start: int, n: int):
+        assert 0 <= start and start + n <= len(parent), 'Segment out of range'
+
+        self.parent = parent
+        self.start = start
+        self.n = n
+        self.bpp = parent.bpp
+        self.ORDER = parent.ORDER
+        self.buf = memoryview(parent.buf)[start * parent.bpp:(start + n) * parent.bpp]
+
+        self.deferred = False
+        self.dirty = False
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, i, color):
+        self.parent[self.start + i] = color
+
+    def __getitem__(self, i):
+        return self.parent[self.start + i]
+
+    def fill(self, color):
+        for i in range(self.start, self.start + self.n):
+            self.parent[i] = color
+
+    def write(self):
+        if self.deferred:
+            self.dirty = True
+        else:
+            self.parent.write()
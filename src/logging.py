@@ -4,15 +4,25 @@ from machine import UART
 from datetime import datetime
 
 
-def setup():
+_buffer = None
+
+
+def setup(buffer=None):
     '''
-    Set up logging to REPL and UART0.
+    Set up logging to REPL and UART0, and optionally to a buffer (e.g. a
+    Telemetry, see telemetry.py) which gets every log line via buffer.log().
     '''
+    global _buffer
+
     uart = UART(0, 115200)
     os.dupterm(uart)  # send all print output to UART0 for logging
 
+    _buffer = buffer
+
 
 def log(*args, **kwargs):
     now = datetime.now().compact_fmt()
     print(f'{now}', *args, **kwargs)
 
+    if _buffer is not None:
+        _buffer.log(' '.join([now] + [str(a) for a in args]))
@@ -1,14 +1,20 @@
 import json
 import micropython
-from machine import Pin, Timer
+from machine import Pin
 from neopixel import NeoPixel
 
 import logging
+import tracer
 from datetime import datetime
 from config_sync import ConfigSync
 from leds import LEDs
+from runtime import RuntimeSnapshot
+from sequencer import Sequencer
+from stats import TransitionStats
 from secrets import cfg_url, secrets, sync_times, tz_offset
 from get_up_clock import GetUpClock
+from fragments import FragmentCache
+from ics import FeedCache
 from wifi_manager import WifiManager
 
 
@@ -18,6 +24,7 @@ from wifi_manager import WifiManager
 micropython.alloc_emergency_exception_buf(100)
 
 logging.setup()
+tracer.setup()  # binary event trace, decode with tools/trace_decode.py
 
 # ----------------------------------------------------------------------
 # configuration
@@ -35,53 +42,125 @@ app_leds = leds
 #
 # leds = LEDs(status="LED")
 # app_leds = NeoPixel(Pin(22), 1)
+#
+# Alternative: dimmable LEDs on PWM pins (see outputs.py for other backends).
+#
+# leds = LEDs(status="LED")
+# app_leds = PWMOutput(red=(14, 15), green=(16, 17))
 
 #
 # Define wifi SSID and password as well as time zone offset in secrets.py
 # (note: can add multiple networks).
 #
+# Battery builds: use the WLAN power save mode and limit the time the radio is
+# on, e.g. WifiManager(secrets, tz_offset, power_mode="powersave",
+# connect_budget=40, transfer_budget=30). See wifi_man.radio_stats() for the
+# measured radio time.
+#
 wifi_man = WifiManager(secrets, tz_offset)
-wifi_man.connect()  # ntp sync
 
 #
 # Define the sync times in secrets.py.
 #
-cfg_sync = ConfigSync(wifi_man, sync_times)
+# Alternative: download the configs of all apps in a single request, the
+# bundle is a JSON dict keyed by app id (see register_app below).
+#
+# cfg_sync = ConfigSync(wifi_man, sync_times, bundle_url="https://...")
+#
+# Pass threaded=True to run the network part of the sync on the second core,
+# so LEDs keep updating while connecting / downloading.
+#
+# Syncs are moved by up to sync_tolerance (s) to avoid transitions, and cut
+# off after sync_budget (s) or before the next transition.
+#
+# ICS feeds used by rules ("cond_ics", e.g. school holidays) are fetched
+# with the configs and cached on flash.
+#
+feed_cache = FeedCache()
+
+#
+# Fragments included by the config ("include", e.g. a state palette or
+# holidays shared by several clocks) are fetched and cached on their own.
+#
+fragment_cache = FragmentCache()
+
+#
+# Remote logs: buffer log lines and counters on the board and upload them
+# (gzip compressed) at the end of every sync, e.g. to tools/telemetry_server.py:
+#
+# from telemetry import Telemetry
+# telemetry = Telemetry("http://192.168.0.2:8080/telemetry")
+# logging.setup(telemetry)
+# cfg_sync = ConfigSync(wifi_man, sync_times, feed_cache=feed_cache, fragment_cache=fragment_cache, telemetry=telemetry)
+#
+cfg_sync = ConfigSync(wifi_man, sync_times, feed_cache=feed_cache, fragment_cache=fragment_cache)
+
+#
+# All LED patterns (blinking, animations, status LED) run from one timer.
+#
+sequencer = Sequencer()
 
 #
 # Use some of the LED group names defined above here, these groups will blink
 # together if a config error (parsing or applying) occured.
 #
-app = GetUpClock(app_leds)
-cfg_sync.register_app(cfg_url, app.update_data)
+# The delays of state transitions (and the RTC correction at the time) are
+# recorded in transition_stats.json, see stats.py.
+#
+stats = TransitionStats(correction=lambda: wifi_man.last_ntp_correction)
+
+app = GetUpClock(
+    app_leds,
+    sequencer=sequencer,
+    feed_cache=feed_cache,
+    fragment_cache=fragment_cache,
+    stats=stats)
 
 #
-# Run initial sync.
+# Alternative: several clocks (e.g. one per room) on one board, each on its own
+# segment of a NeoPixel strip (or own LED groups). The host advances all clocks
+# and writes the strip once per frame, call host.step(now) instead of
+# app.step(now) in the main loop.
+#
+# strip = NeoPixel(Pin(22), 2)
+# host = ClockHost()
+# sequencer = host.sequencer
+# app = GetUpClock(NeoPixelSegment(strip, 0, 1), cache_file="cache_clock.json", host=host)
+# app2 = GetUpClock(NeoPixelSegment(strip, 1, 1), cache_file="cache_clock2.json", host=host)
+# cfg_sync.register_app(cfg_url2, app2.update_data, app_id="clock2", current=lambda: app2.data)
+#
+# Pass e.g. interval=6 * 3600 to refresh the config more often than at the
+# sync times.
 #
-cfg_sync.sync(force=True)
+cfg_sync.register_app(
+    cfg_url,
+    app.update_data,
+    app_id="clock",
+    current=lambda: app.data,  # enables delta updates
+    deadlines=app.deadlines,  # keeps syncs away from transitions
+    feeds=app.feeds,  # fetches ICS feeds of the config
+    includes=app.includes)  # fetches fragments included by the config
 
 #
-# Setup timer for blinking status LED in case of sync error.
+# Run initial sync (NTP and config). Warm boot: if the RTC and the cached
+# config are still valid (e.g. after a brief power blip or a reset), skip it
+# and sync a few minutes later instead.
 #
-sync_error_cycle_count = 0
+snapshot = RuntimeSnapshot()
 
-def sync_error_callback(t):
-    global sync_error_cycle_count
+warm_boot = snapshot.is_warm(has_cache=app.last_updated is not None)
+tracer.event(tracer.BOOT, int(warm_boot))
 
-    if cfg_sync.synced:
-        sync_error_cycle_count = 0
-    else:
-        sync_error_cycle_count += 1
-        if sync_error_cycle_count > 23:
-            leds.status.on()
-        if sync_error_cycle_count > 24:
-            leds.status.off()
-            sync_error_cycle_count = 0
+if warm_boot:
+    cfg_sync.defer_sync(300)
+else:
+    wifi_man.connect()  # ntp sync
+    cfg_sync.sync(force=True)
 
-sync_error_timer = Timer(
-    mode=Timer.PERIODIC,
-    period=200,
-    callback=sync_error_callback)
+#
+# Status LED flashes (200ms every 5s) in case of sync error.
+#
+sync_error_pattern = None
 
 # ----------------------------------------------------------------------
 # main loop
@@ -98,8 +177,22 @@ while True:
 
         cfg_sync.sync()  # if necessary
 
+        snapshot.update(
+            last_ntp=wifi_man.last_ntp_sync,
+            last_sync=cfg_sync.last_sync)
+
+        tracer.flush()  # if there are new events
+        stats.save()  # if there are new transitions
+
     if now.second != last_iter_sec:
         last_iter_sec = now.second
 
         app.step(now)
 
+        if cfg_sync.synced and sync_error_pattern is not None:
+            sync_error_pattern.deinit()
+            sync_error_pattern = None
+            leds.status.off()
+        elif not cfg_sync.synced and sync_error_pattern is None:
+            sync_error_pattern = sequencer.pattern((4800, 200), (leds.status.on, leds.status.off))
+
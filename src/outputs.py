@@ -0,0 +1,190 @@
+'''
+Output backends for GetUpClock.
+
+A backend turns the LED part of a state config into a value ready to be
+shown (at config load, see render.py) and shows such values. Backends have:
+
+        colors  # True if colours (fades, keyframe animations) are supported
+        error_state(leds)  # default state dict for config errors
+        compile(state, palette)  # value for show(), None for off
+        show(value)  # show a compiled value
+        off()
+        render(animation, elapsed, lut)  # colour backends only
+
+New LED hardware only needs a new backend, pass it to GetUpClock instead of
+the LEDs / NeoPixel.
+
+Example:
+
+        pwm = PWMOutput(red=(14, 15), green=16)
+        app = GetUpClock(pwm)
+'''
+from machine import PWM, Pin
+from neopixel import NeoPixel
+
+from colors import unpack
+from leds import LEDGroup, LEDs, NeoPixelSegment
+
+
+class GroupOutput:
+    '''
+    Base of the backends with named LED groups (no colours).
+    '''
+    colors = False
+
+    def error_state(self, leds: str = None):
+        return {
+            "name": "RULE_ERROR",
+            "leds": "all" if leds is None else leds,
+            "blink": True,
+        }
+
+
+class LEDOutput(GroupOutput):
+    '''
+    Plain LEDs (on / off), states select LED groups by name:
+    {"leds": "red,green"}. Only the pins of the shown state are switched, so
+    other LEDs (e.g. the status LED) are left alone.
+    '''
+    def __init__(self, leds: LEDs):
+        self.leds = leds
+        self._lit = ()  # pins switched on by show()
+
+    def compile(self, state: dict, palette):
+        if not state.get("leds"):
+            return None
+
+        on = []
+
+        for name in state["leds"].split(","):
+            group = getattr(self.leds, name, None)
+            assert isinstance(group, LEDGroup), f'Unknown LED group {name}'
+            on += [pin for pin in group._leds if pin not in on]
+
+        # pins to switch on
+        return tuple(on)
+
+    def show(self, value: tuple):
+        if value is None:
+            self.off()
+            return
+
+        for pin in self._lit:
+            if pin not in value:
+                pin.off()
+
+        for pin in value:
+            pin.on()
+
+        self._lit = value
+
+    def off(self):
+        for pin in self._lit:
+            pin.off()
+
+        self._lit = ()
+
+
+class PWMOutput(GroupOutput):
+    '''
+    Dimmable LEDs on PWM pins. Groups are defined like for LEDs, the
+    luminosity of a state sets the brightness (gamma corrected):
+    {"leds": "red", "luminosity": 0.3}.
+
+    Example:
+
+            output = PWMOutput(red=(14, 15), green=16, freq=1000)
+    '''
+    def __init__(self, *, freq: int = 1000, **kwargs):
+        self.groups = {}
+        pwms = []
+
+        for name, pins in kwargs.items():
+            if isinstance(pins, (int, str)):
+                pins = (pins, )
+
+            group = [PWM(Pin(pin), freq=freq) for pin in pins]
+            self.groups[name] = group
+            pwms += group
+
+        self.groups["all"] = pwms
+        self._pins = tuple(pwms)
+
+    def compile(self, state: dict, palette):
+        if not state.get("leds"):
+            return None
+
+        luminosity = state.get("luminosity", 1)
+        assert 0 <= luminosity <= 1, f'Invalid luminosity {luminosity}'
+        duty = int(round(65535 * luminosity ** palette.gamma))
+
+        on = []
+
+        for name in state["leds"].split(","):
+            assert name in self.groups, f'Unknown LED group {name}'
+            on += self.groups[name]
+
+        # duty cycles, in pin order
+        return tuple(duty if pwm in on else 0 for pwm in self._pins)
+
+    def show(self, value: tuple):
+        if value is None:
+            self.off()
+            return
+
+        for i in range(len(self._pins)):
+            self._pins[i].duty_u16(value[i])
+
+    def off(self):
+        for pwm in self._pins:
+            pwm.duty_u16(0)
+
+
+class PixelOutput:
+    '''
+    NeoPixel (or a segment of a strip), all pixels show the state colour:
+    {"color": "#ff8000", "luminosity": 0.5}.
+    '''
+    colors = True
+
+    def __init__(self, pixels: NeoPixel | NeoPixelSegment):
+        self.pixels = pixels
+
+    def error_state(self, leds: str = None):
+        return {
+            "name": "RULE_ERROR",
+            "color": "#ff0000",
+            "luminosity": .5,
+            "blink": True,
+        }
+
+    def compile(self, state: dict, palette):
+        color = palette.color(state)
+        return None if color is None else unpack(color, palette.lut)
+
+    def show(self, value: tuple):
+        self.pixels.fill((0, 0, 0) if value is None else value)
+        self.pixels.write()
+
+    def off(self):
+        self.show(None)
+
+    def render(self, animation, elapsed: int, lut: bytearray):
+        animation.render(self.pixels, elapsed, lut)
+        self.pixels.write()
+
+
+def output_for(leds):
+    '''
+    Backend for LEDs, a NeoPixel, or a NeoPixelSegment. Backends are returned
+    as they are.
+    '''
+    if isinstance(leds, LEDs):
+        return LEDOutput(leds)
+
+    if isinstance(leds, (NeoPixel, NeoPixelSegment)):
+        return PixelOutput(leds)
+
+    assert hasattr(leds, "compile") and hasattr(leds, "show"), 'Unsupported LED output'
+
+    return leds
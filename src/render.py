@@ -0,0 +1,87 @@
+'''
+Render plans: the states of a config compiled (at config load) for one output
+backend (see outputs.py), so activating a state needs no parsing or lookups.
+
+A plan has a pattern id (bit flags, BLINK and FADE can be combined), the
+compiled output value, and the packed colour (fades) or animation.
+
+Example:
+
+        plans = compile_plans(data["states"], output, palette, schedule)
+        plan = plans[id(state)]
+        plan.show()
+'''
+from animation import Animation
+
+
+STATIC = 0
+BLINK = 1
+FADE = 2  # fade to the colour of the following state
+ANIMATION = 4
+
+
+class RenderPlan:
+    def __init__(
+        self,
+        output,
+        pattern: int,
+        value=None,  # compiled output value, None: off
+        color: int = None,  # packed colour (colour outputs)
+        animation: Animation = None,
+    ):
+        self.output = output
+        self.pattern = pattern
+        self.value = value
+        self.color = color
+        self.animation = animation
+
+    def show(self):
+        self.output.show(self.value)
+
+
+def compile_plan(state: dict, output, palette):
+    if state.get("keyframes"):
+        assert output.colors, f'Keyframes need a colour output (state {state["name"]})'
+        return RenderPlan(output, ANIMATION, animation=Animation(state, palette.gamma))
+
+    pattern = STATIC
+
+    if state.get("blink"):
+        pattern |= BLINK
+
+    color = None
+
+    if output.colors:
+        color = palette.color(state)
+
+    if state.get("transition"):
+        assert color is not None, f'Transition needs a colour (state {state["name"]})'
+        pattern |= FADE
+
+    return RenderPlan(output, pattern, output.compile(state, palette), color)
+
+
+def appearance(state: dict):
+    '''
+    What a state looks like: everything but its name. States with the same
+    appearance get the same plan (fades: given the same following state).
+    '''
+    return {key: value for key, value in state.items() if key != "name"}
+
+
+def compile_plans(states: list[dict], output, palette, schedule=None):
+    '''
+    Render plans of all states, keyed by id(state). The palette has to be
+    compiled for the states. With a schedule, fades are checked to have a
+    following state with a colour in every rule.
+    '''
+    plans = {id(state): compile_plan(state, output, palette) for state in states}
+
+    if schedule is not None:
+        for i, j in schedule.successors():
+            if plans[id(states[i])].pattern & FADE:
+                assert j is not None, f'Transition of state {states[i]["name"]} has no following state'
+                assert plans[id(states[j])].color is not None, \
+                    f'Transition of state {states[i]["name"]} needs a colour in state {states[j]["name"]}'
+
+    return plans
@@ -0,0 +1,94 @@
+import json
+import time
+
+from logging import log as print
+
+
+class RuntimeSnapshot:
+    '''
+    Small runtime snapshot persisted on flash (last NTP sync, last config
+    sync), used to decide whether a boot can be a warm boot:
+    if the RTC still holds a plausible time and the cached config is fresh,
+    there is no need to bring up the wifi right away.
+
+    Example:
+
+            snapshot = RuntimeSnapshot()
+            if snapshot.is_warm(has_cache=True):
+                ...  # trust RTC and cache, sync later
+            snapshot.update(last_ntp=..., last_sync=...)
+    '''
+    def __init__(
+        self,
+        snapshot_file: str = "runtime.json",
+        max_ntp_age: int = 86400,  # s
+        max_sync_age: int = 86400,  # s
+        verbose: bool = True,
+    ):
+        self.snapshot_file = snapshot_file
+        self.max_ntp_age = max_ntp_age
+        self.max_sync_age = max_sync_age
+        self.verbose = verbose
+
+        self.last_ntp = None
+        self.last_sync = None
+
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.snapshot_file, 'r') as f:
+                # older snapshots also hold the state (never restored)
+                self.last_ntp, self.last_sync = json.load(f)[:2]
+
+        except (ValueError, TypeError, OSError) as ex:
+            if self.verbose:
+                print(f'[RuntimeSnapshot] no snapshot loaded: {ex}')
+
+    def update(
+        self,
+        last_ntp: int = None,
+        last_sync: int = None,
+    ):
+        '''
+        Update the snapshot, only written to flash if something changed.
+        '''
+        snapshot = (
+            self.last_ntp if last_ntp is None else last_ntp,
+            self.last_sync if last_sync is None else last_sync,
+        )
+
+        if snapshot == (self.last_ntp, self.last_sync):
+            return
+
+        self.last_ntp, self.last_sync = snapshot
+
+        try:
+            with open(self.snapshot_file, 'w') as f:
+                json.dump(snapshot, f)
+
+        except OSError as ex:
+            print(f'[RuntimeSnapshot] ERROR: cannot write snapshot: {ex}')
+
+    def is_warm(self, has_cache: bool):
+        '''
+        True if RTC and cached config can be trusted without a network sync.
+        '''
+        now = time.time()
+
+        if not has_cache or self.last_ntp is None or self.last_sync is None:
+            reason = 'no snapshot or cache'
+        elif now < self.last_ntp or now < self.last_sync:
+            reason = 'RTC was reset'
+        elif now - self.last_ntp > self.max_ntp_age:
+            reason = 'NTP sync too old'
+        elif now - self.last_sync > self.max_sync_age:
+            reason = 'config sync too old'
+        else:
+            reason = None
+
+        if self.verbose:
+            print(f'[RuntimeSnapshot] {"warm" if reason is None else "cold"} boot' +
+                  ('' if reason is None else f' ({reason})'))
+
+        return reason is None
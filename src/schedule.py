@@ -0,0 +1,189 @@
+from datetime import date, datetime
+
+
+class Schedule:
+    '''
+    Compiled form of the "states" and "rules" of a clock config.
+
+    Rules are resolved as in the config: the first rule whose date or weekday
+    condition matches is used, the last rule is the fallback. At compile time,
+    date conditions are merged into a sorted index (binary search per day) and
+    weekday conditions into a per-weekday table, and transition times are
+    parsed into minutes of the day.
+
+    Rules can also use ICS feeds as date condition ("cond_ics": URL or list
+    of URLs), the dates of the feeds (from a FeedCache, see ics.py) are
+    merged into the date index.
+
+    Example:
+
+            schedule = Schedule(data)
+            schedule.transitions(date.today())  # [(datetime, state), ...]
+            schedule.next_transitions(datetime.now(), 3)
+    '''
+    def __init__(self, data: dict, feeds=None):
+        self.states = data['states']
+        self.rules = data['rules']
+
+        assert len(self.states) > 0, 'Need at least one state'
+        assert len(self.rules) > 0, 'Need at least one rule'
+
+        # per rule: transitions as (minute of day, state index)
+
+        self._transitions = []
+
+        for rule in self.rules:
+            transitions = [(0, 0)]
+
+            for i, t in enumerate(rule['transitions']):
+                if t is not None:
+                    assert i + 1 < len(self.states), f'Too many transitions in rule {rule["name"]}'
+                    h, m = map(int, t.split(':'))
+                    transitions += [(60 * h + m, i + 1)]
+
+            self._transitions += [transitions]
+
+        # weekday -> index of first rule listing it (or the fallback rule)
+
+        last = len(self.rules) - 1
+        self._weekday_rules = [last] * 7
+
+        for wd in range(7):
+            for i, rule in enumerate(self.rules):
+                if wd in rule.get('cond_weekday', []):
+                    self._weekday_rules[wd] = i
+                    break
+
+        # sorted date keys (YYYYMMDD) -> index of first rule listing the date
+
+        date_rules = {}
+
+        for i, rule in enumerate(self.rules):
+            for d in rule.get('cond_date', []):
+                y, m, dd = map(int, d.split('-'))
+                key = 10000 * y + 100 * m + dd
+                if key not in date_rules:
+                    date_rules[key] = i
+
+            for url in feed_urls(rule):
+                for start, end in (feeds.ranges(url) if feeds is not None else ()):
+                    day = date(start // 10000, start // 100 % 100, start % 100)
+                    key = start
+
+                    while key < end:
+                        if key not in date_rules:
+                            date_rules[key] = i
+                        day = day.next_day()
+                        key = day.key()
+
+        self._date_keys = sorted(date_rules)
+        self._date_rules = [date_rules[key] for key in self._date_keys]
+
+        self._cached_day = None
+        self._cached_transitions = None
+
+    def _date_rule(self, key: int):
+        lo, hi = 0, len(self._date_keys)
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._date_keys[mid] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < len(self._date_keys) and self._date_keys[lo] == key:
+            return self._date_rules[lo]
+
+        return None
+
+    def rule_index(self, day: date, weekday: int = None):
+        if weekday is None:
+            weekday = day.weekday()
+
+        i = self._weekday_rules[weekday]
+        j = self._date_rule(day.key())
+
+        return i if j is None else min(i, j)
+
+    def rule(self, day: date, weekday: int = None):
+        return self.rules[self.rule_index(day, weekday)]
+
+    def successors(self):
+        '''
+        Set of (state index, index of the following state) of all rules, the
+        following state of the last state of a day is None.
+        '''
+        pairs = set()
+
+        for transitions in self._transitions:
+            for k in range(len(transitions)):
+                i = transitions[k][1]
+                j = transitions[k + 1][1] if k + 1 < len(transitions) else None
+                pairs.add((i, j))
+
+        return pairs
+
+    def transitions(self, day: date, weekday: int = None):
+        '''
+        Transitions (datetime, state) of a day, in order. The result of the
+        last day is cached (shared schedules are queried once per clock).
+        '''
+        key = day.key()
+
+        if key != self._cached_day:
+            transitions = self._transitions[self.rule_index(day, weekday)]
+
+            self._cached_transitions = [
+                (datetime(day.year, day.month, day.day, t // 60, t % 60), self.states[i])
+                for t, i in transitions]
+            self._cached_day = key
+
+        return list(self._cached_transitions)
+
+    def next_transitions(self, now: datetime, n: int = 1):
+        '''
+        The next n transitions (datetime, state) after now, across days.
+        '''
+        result = []
+
+        day = now.date()
+        weekday = now.weekday()
+        minute = 60 * now.hour + now.minute + 1  # first minute strictly after now
+        first = True
+
+        while len(result) < n:
+            transitions = self._transitions[self.rule_index(day, weekday)]
+            lo = 0
+
+            if first:
+                # binary search for the first transition after now
+                hi = len(transitions)
+
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if transitions[mid][0] < minute:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+
+                first = False
+
+            for t, i in transitions[lo:]:
+                result += [(datetime(day.year, day.month, day.day, t // 60, t % 60), self.states[i])]
+
+                if len(result) >= n:
+                    break
+
+            day = day.next_day()
+            weekday = (weekday + 1) % 7
+
+        return result
+
+
+def feed_urls(rule: dict):
+    '''
+    URLs of the ICS feeds used by a rule.
+    '''
+    urls = rule.get('cond_ics', [])
+    return [urls] if isinstance(urls, str) else urls
@@ -0,0 +1,119 @@
+import micropython
+from machine import Timer
+
+
+class Sequencer:
+    '''
+    Runs all LED patterns (blinking, animation frames, status LED) from one
+    hardware timer. The timer only runs while at least one pattern is active.
+
+    A pattern is a cycle of steps, each with a duration (ms) and an action
+    which is called at the end of the step. Patterns are compiled into ticks
+    when started, running them does not allocate. The timer interrupt only
+    schedules the actual work via micropython.schedule.
+
+    Example:
+
+            sequencer = Sequencer()
+            blink = sequencer.blink(leds.red, 500)  # 500ms on, 500ms off
+            frames = sequencer.periodic(50, render_frame)
+            status = sequencer.pattern((4800, 200), (leds.status.on, leds.status.off))
+            blink.deinit()  # stop pattern
+    '''
+    def __init__(
+        self,
+        tick_period: int = 50,  # ms
+        after_tick=None,  # called after every tick, e.g. to write outputs
+    ):
+        self.tick_period = tick_period
+        self.after_tick = after_tick
+
+        self._patterns = []
+        self._timer = None
+
+        # bound once, no allocation in interrupt
+        self._irq_cb = self._irq
+        self._run_cb = self._run
+
+    @property
+    def idle(self):
+        return self._timer is None
+
+    def pattern(self, durations: tuple, actions: tuple):
+        '''
+        Start a pattern: after durations[i] ms, actions[i] is called, then
+        the next step starts (cycling). Returns the pattern, stop it with
+        deinit().
+        '''
+        assert len(durations) == len(actions) > 0
+
+        ticks = tuple(max(1, (d + self.tick_period // 2) // self.tick_period) for d in durations)
+        pattern = Pattern(self, ticks, tuple(actions))
+        self._patterns += [pattern]
+
+        if self._timer is None:
+            self._timer = Timer(
+                mode=Timer.PERIODIC,
+                period=self.tick_period,
+                callback=self._irq_cb)
+
+        return pattern
+
+    def periodic(self, period: int, callback):
+        '''
+        Call callback() every period ms.
+        '''
+        return self.pattern((period, ), (callback, ))
+
+    def blink(self, output, period: int):
+        '''
+        Blink an output (with on() and off()): switched on after period ms,
+        off after another period ms, and so on.
+        '''
+        return self.pattern((period, period), (output.on, output.off))
+
+    def _remove(self, pattern):
+        if pattern in self._patterns:
+            self._patterns.remove(pattern)
+
+        if not self._patterns and self._timer is not None:
+            # nothing to do, go idle
+            self._timer.deinit()
+            self._timer = None
+
+    def _irq(self, timer):
+        try:
+            micropython.schedule(self._run_cb, 0)
+        except RuntimeError:
+            pass  # schedule queue full, skip tick
+
+    def _run(self, _):
+        # snapshot, actions may stop (or start) patterns; stopped patterns
+        # are skipped, started ones run from the next tick (runs scheduled,
+        # not in the interrupt, so the copy may allocate)
+        for pattern in tuple(self._patterns):
+            if pattern not in self._patterns:
+                continue
+
+            pattern.remaining -= 1
+
+            if pattern.remaining <= 0:
+                step = pattern.step
+                pattern.step = (step + 1) % len(pattern.ticks)
+                pattern.remaining = pattern.ticks[pattern.step]
+                pattern.actions[step]()
+
+        if self.after_tick is not None:
+            self.after_tick()
+
+
+class Pattern:
+    def __init__(self, sequencer: Sequencer, ticks: tuple, actions: tuple):
+        self.sequencer = sequencer
+        self.ticks = ticks
+        self.actions = actions
+        self.step = 0
+        self.remaining = ticks[0]
+
+    def deinit(self):
+        self.sequencer._remove(self)
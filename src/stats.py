@@ -0,0 +1,161 @@
+'''
+Timing accuracy of state transitions.
+
+For every transition, the scheduled time, the delay of the actual activation
+(s), and the RTC correction in effect (how far the RTC was off at the last
+NTP sync, s) are recorded. Delays are kept in a fixed-bucket histogram (a few
+ints, persisted on flash), the last few transitions are kept as is.
+
+Example:
+
+        stats = TransitionStats(correction=lambda: wifi_man.last_ntp_correction)
+        app = GetUpClock(leds, stats=stats)
+        ...
+        stats.percentile(95)  # s, 95% of the transitions were at most this late
+        stats.save()  # e.g. once per minute, only writes if needed
+
+The module has no board dependencies, tools/trace_decode.py uses Histogram
+to summarize transition delays from a trace on the host.
+'''
+import json
+
+from logging import log as print
+
+
+BOUNDS = (0, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800)  # s, inclusive upper bounds
+
+
+class Histogram:
+    '''
+    Counts of non-negative integer values in buckets with fixed upper bounds,
+    the last bucket counts values above the last bound.
+    '''
+    def __init__(self, bounds: tuple = BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.n = 0
+        self.max = 0
+
+    def add(self, value: int):
+        i = 0
+
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+
+        self.counts[i] += 1
+        self.n += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, p: int):
+        '''
+        Upper bound of the bucket containing the p-th percentile (the maximum
+        for the last bucket), None if empty.
+        '''
+        if self.n == 0:
+            return None
+
+        rank = max(1, (p * self.n + 99) // 100)
+        total = 0
+
+        for i, count in enumerate(self.counts):
+            total += count
+
+            if total >= rank:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+
+        return self.max
+
+    def rows(self):
+        '''
+        (label, count) per bucket, e.g. to print the histogram.
+        '''
+        labels = [f'<={b}s' for b in self.bounds] + [f'>{self.bounds[-1]}s']
+        return list(zip(labels, self.counts))
+
+    def state(self):
+        return [self.counts, self.n, self.max]
+
+    def restore(self, state: list):
+        counts, self.n, self.max = state
+
+        if len(counts) == len(self.counts):
+            self.counts = counts
+        else:
+            self.n = self.max = 0  # bounds changed
+
+
+class TransitionStats:
+    '''
+    Delays of state transitions (see module docstring). correction returns
+    the RTC correction of the last NTP sync (s) or None.
+    '''
+    def __init__(
+        self,
+        correction=None,
+        history: int = 8,  # last transitions kept as is
+        stats_file: str = "transition_stats.json",
+        verbose: bool = True,
+    ):
+        self.correction = correction
+        self.history = history
+        self.stats_file = stats_file
+        self.verbose = verbose
+
+        self.delays = Histogram()
+        self.skipped = 0  # transitions passed without being shown
+        self.recent = []  # [scheduled (compact_fmt), delay, correction]
+        self._dirty = False
+
+        self.load()
+
+    def record(self, scheduled, actual, skipped: int = 0):
+        '''
+        Record a transition scheduled at scheduled (datetime), activated at
+        actual. skipped: transitions passed at the same time, not shown.
+        '''
+        delay = max(0, scheduled.diff_seconds(actual))
+        correction = None if self.correction is None else self.correction()
+
+        self.delays.add(delay)
+        self.skipped += skipped
+        self.recent = (self.recent + [[scheduled.compact_fmt(), delay, correction]])[-self.history:]
+        self._dirty = True
+
+        if self.verbose and delay > 1:
+            print(f'[TransitionStats] transition at {scheduled} activated {delay}s late')
+
+    def percentile(self, p: int):
+        return self.delays.percentile(p)
+
+    def summary(self):
+        return {
+            'n': self.delays.n,
+            'p50': self.delays.percentile(50),
+            'p95': self.delays.percentile(95),
+            'max': self.delays.max,
+            'skipped': self.skipped,
+        }
+
+    def load(self):
+        try:
+            with open(self.stats_file, 'r') as f:
+                delays, self.skipped, self.recent = json.load(f)
+
+            self.delays.restore(delays)
+
+        except (ValueError, TypeError, OSError) as ex:
+            if self.verbose:
+                print(f'[TransitionStats] no stats loaded: {ex}')
+
+    def save(self):
+        if not self._dirty:
+            return
+
+        try:
+            with open(self.stats_file, 'w') as f:
+                json.dump([self.delays.state(), self.skipped, self.recent], f)
+
+            self._dirty = False
+
+        except OSError as ex:
+            print(f'[TransitionStats] ERROR: cannot write stats: {ex}')
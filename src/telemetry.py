@@ -0,0 +1,155 @@
+import _thread
+import io
+import json
+import time
+
+from logging import log as print
+
+try:
+    import deflate  # MicroPython
+    zlib = None
+except ImportError:
+    import zlib  # CPython
+    deflate = None
+
+try:
+    import gc
+except ImportError:
+    gc = None
+
+
+WBITS = 10  # compression window (1KB), the same on MicroPython and CPython
+
+
+class Telemetry:
+    '''
+    Log lines and counters buffered on the device (size capped, the oldest
+    lines are dropped first), uploaded gzip compressed in one POST while the
+    wifi is up anyway (see ConfigSync), so diagnostics cost no extra radio
+    wake-ups.
+
+    Example:
+
+            telemetry = Telemetry("https://.../telemetry")
+            logging.setup(telemetry)  # log() lines go to the buffer too
+            telemetry.count("sync_ok")
+            telemetry.upload(wifi_man)  # done by ConfigSync during a sync
+
+    The payload is a JSON dict: {"logs": [...], "dropped": n, "counters":
+    {...}, "uptime": s, "mem_free": bytes}.
+    '''
+    def __init__(
+        self,
+        url: str,
+        max_bytes: int = 4096,  # log lines kept (uncompressed)
+        max_line: int = 160,
+        verbose: bool = True,
+    ):
+        self.url = url
+        self.max_bytes = max_bytes
+        self.max_line = max_line
+        self.verbose = verbose
+
+        self._lines = []
+        self._size = 0
+        self._dropped = 0
+        self._counters = {}
+        self._lock = _thread.allocate_lock()  # log() may run on both cores
+
+    def log(self, line: str):
+        line = line[:self.max_line]
+
+        with self._lock:
+            self._lines += [line]
+            self._size += len(line)
+
+            while self._size > self.max_bytes:
+                self._size -= len(self._lines.pop(0))
+                self._dropped += 1
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    @property
+    def pending(self):
+        return bool(self._lines or self._counters)
+
+    def _take(self):
+        # move buffer contents out (restored by _put_back if upload fails)
+        with self._lock:
+            taken = (self._lines, self._dropped, self._counters)
+            self._lines = []
+            self._size = 0
+            self._dropped = 0
+            self._counters = {}
+
+        return taken
+
+    def _put_back(self, lines: list, dropped: int, counters: dict):
+        with self._lock:
+            self._dropped += dropped
+
+            for name, n in counters.items():
+                self._counters[name] = self._counters.get(name, 0) + n
+
+        for line in reversed(lines):
+            # older lines first in the buffer, drop them first if full
+            with self._lock:
+                if self._size + len(line) > self.max_bytes:
+                    self._dropped += 1
+                    continue
+
+                self._lines.insert(0, line)
+                self._size += len(line)
+
+    def upload(self, wifi_man):
+        '''
+        POST the buffered logs and counters (without connecting, the wifi has
+        to be up). Returns True on success, the buffer is kept otherwise.
+        '''
+        if not self.pending:
+            return True
+
+        lines, dropped, counters = self._take()
+
+        payload = json.dumps({
+            'logs': lines,
+            'dropped': dropped,
+            'counters': counters,
+            'uptime': time.ticks_ms() // 1000,
+            'mem_free': gc.mem_free() if gc is not None and hasattr(gc, 'mem_free') else None,
+        }).encode()
+
+        body = compress(payload)
+
+        status, _, _ = wifi_man.request(
+            'POST',
+            self.url,
+            {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'},
+            body,
+            connect=False)
+
+        if status is not None and 200 <= status < 300:
+            if self.verbose:
+                print(f'[Telemetry] uploaded {len(lines)} lines, {len(body)} bytes')
+            return True
+
+        self._put_back(lines, dropped, counters)
+        return False
+
+
+def compress(data: bytes):
+    '''
+    gzip compress data, with a window of 2**WBITS bytes.
+    '''
+    if deflate is None:
+        c = zlib.compressobj(9, zlib.DEFLATED, 16 + WBITS)  # 16: gzip
+        return c.compress(data) + c.flush()
+
+    buf = io.BytesIO()
+
+    with deflate.DeflateIO(buf, deflate.GZIP, WBITS) as f:  # no level argument, buf stays open
+        f.write(data)
+
+    return buf.getvalue()
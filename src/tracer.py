@@ -0,0 +1,161 @@
+'''
+Compact binary event tracer.
+
+Events are fixed-size records (ticks_ms, RTC time, code, aux, arg) in a
+preallocated ring buffer, flushed to flash with flush(). Recording an event
+only packs a few ints into the buffer, it is a no-op if tracing was not set
+up. Events can be recorded from both threads (e.g. a threaded ConfigSync).
+Decode dumps on the host with tools/trace_decode.py.
+
+Example:
+
+        import tracer
+
+        tracer.setup()
+        tracer.event(tracer.STATE, 2)
+        tracer.flush()  # e.g. once per minute, only writes if needed
+'''
+import _thread
+import struct
+import time
+
+from logging import log as print
+
+
+# event codes (arg / aux meaning in comments)
+
+STATE = 1  # arg: state index (-1: error state)
+SYNC_START = 2
+SYNC_END = 3  # arg: 1 success / 0 failure, aux: cause (see CAUSES)
+WIFI_STATUS = 4  # arg: WLAN status
+WIFI_UP = 5
+WIFI_DOWN = 6  # arg: radio-on time (s)
+NTP = 7  # arg: RTC correction (s, clipped)
+ERROR = 8  # aux: error source (see ERRORS)
+BOOT = 9  # arg: 1 warm boot / 0 cold boot
+TRANSITION = 10  # arg: delay of the activation (s), aux: transitions skipped
+
+EVENTS = {
+    STATE: 'state',
+    SYNC_START: 'sync_start',
+    SYNC_END: 'sync_end',
+    WIFI_STATUS: 'wifi_status',
+    WIFI_UP: 'wifi_up',
+    WIFI_DOWN: 'wifi_down',
+    NTP: 'ntp',
+    ERROR: 'error',
+    BOOT: 'boot',
+    TRANSITION: 'transition',
+}
+
+CAUSES = (None, 'no_ap', 'ntp', 'http', 'error', 'budget')
+
+ERR_PARSE = 1
+ERR_APPLY = 2
+ERR_COMPILE = 3
+
+ERRORS = {
+    ERR_PARSE: 'parse_cfg',
+    ERR_APPLY: 'apply_rules',
+    ERR_COMPILE: 'compile_cfg',
+}
+
+RECORD = '<IIhBB'  # ticks_ms, time, arg, code, aux
+TICKS_MASK = 0x3fffffff  # ticks_ms wraps at 2**30 on MicroPython
+RECORD_SIZE = struct.calcsize(RECORD)
+
+HEADER = '<4sHHHH'  # magic, record size, capacity, next index, count
+HEADER_SIZE = struct.calcsize(HEADER)
+MAGIC = b'TRC1'
+
+
+class Tracer:
+    def __init__(
+        self,
+        capacity: int = 256,  # records
+        trace_file: str = 'trace.bin',
+    ):
+        self.capacity = capacity
+        self.trace_file = trace_file
+
+        self._buf = bytearray(capacity * RECORD_SIZE)
+        self._next = 0
+        self._count = 0
+        self._dirty = False
+        self._lock = _thread.allocate_lock()  # event() may run in a sync thread
+
+    def event(self, code: int, arg: int = 0, aux: int = 0):
+        if arg > 32767:
+            arg = 32767
+        elif arg < -32768:
+            arg = -32768
+
+        with self._lock:
+            struct.pack_into(
+                RECORD, self._buf, self._next * RECORD_SIZE,
+                time.ticks_ms() & TICKS_MASK, int(time.time()) & 0xffffffff, arg, code, aux)
+
+            self._next = (self._next + 1) % self.capacity
+
+            if self._count < self.capacity:
+                self._count += 1
+
+            self._dirty = True
+
+    def flush(self):
+        if not self._dirty:
+            return
+
+        # copy under the lock, write without holding it
+        with self._lock:
+            header = struct.pack(HEADER, MAGIC, RECORD_SIZE, self.capacity, self._next, self._count)
+            buf = bytes(self._buf)
+            self._dirty = False
+
+        try:
+            with open(self.trace_file, 'wb') as f:
+                f.write(header)
+                f.write(buf)
+
+        except OSError as ex:
+            print(f'[Tracer] ERROR: cannot write trace: {ex}')
+            self._dirty = True  # retry with the next flush
+
+
+_tracer = None
+
+
+def setup(capacity: int = 256, trace_file: str = 'trace.bin'):
+    global _tracer
+    _tracer = Tracer(capacity, trace_file)
+
+
+def event(code: int, arg: int = 0, aux: int = 0):
+    if _tracer is not None:
+        _tracer.event(code, arg, aux)
+
+
+def flush():
+    if _tracer is not None:
+        _tracer.flush()
+
+
+def decode(dump: bytes):
+    '''
+    Decode a trace dump into a list of (ticks_ms, time, code, aux, arg),
+    oldest first.
+    '''
+    magic, record_size, capacity, next_index, count = struct.unpack_from(HEADER, dump, 0)
+
+    if magic != MAGIC or record_size != RECORD_SIZE:
+        raise ValueError('not a trace dump')
+
+    first = (next_index - count) % capacity
+    records = []
+
+    for i in range(count):
+        offset = HEADER_SIZE + ((first + i) % capacity) * RECORD_SIZE
+        ticks, t, arg, code, aux = struct.unpack_from(RECORD, dump, offset)
+        records += [(ticks, t, code, aux, arg)]
+
+    return records
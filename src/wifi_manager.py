@@ -2,9 +2,10 @@ import machine
 import network
 import ntptime
 import time
-import requests
 
+import tracer
 from datetime import datetime
+from http_pool import ConnectionPool
 from logging import log as print
 
 
@@ -12,28 +13,70 @@ class WifiManager:
     '''
     Wifi manager handling wifi state, network discovery, pinging, and
     downloads. Also provides NTP syncing.
+
+    Downloads reuse keep-alive connections (one per host) until the wifi is
+    brought down.
+
+    The WLAN power management mode can be set ("none", "performance",
+    "powersave", or None to keep the firmware default). The time the radio is
+    on is accounted per up/down session and per day, see radio_stats().
+    Downloads are refused once the radio has been up for longer than the
+    transfer budget (if set). Joining networks (trying the known networks in
+    turn) stops once the connect budget (if set) is used up.
+
+    Compressed (gzip / deflate) downloads are requested unless compression is
+    disabled, they are decompressed while parsing.
     '''
     def __init__(
         self,
         secrets: dict | list,
         tz_offset: int,
         auto_ntp_sync: bool = True,
-        connect_timeout: int = 20,
+        connect_timeout: int = 20,  # s per network
+        connect_budget: int = None,  # s for all networks tried per connect
+        http_timeout: int = 10,
+        power_mode: str = None,
+        transfer_budget: int = None,  # s per up/down session
+        compression: bool = True,
+        scan_ttl: int = 60,  # s
         verbose: bool = True,
     ):
         if isinstance(secrets, dict):
             secrets = [secrets]
 
         self.__secrets = secrets
+        self.__passwords = {s['ssid']: s['pw'] for s in secrets}  # ssid index
         self.tz_offset = tz_offset
         self.auto_ntp_sync = auto_ntp_sync
         self.connect_timeout = connect_timeout
+        self.connect_budget = connect_budget
+        self.http_timeout = http_timeout
+        self.power_mode = power_mode
+        self.transfer_budget = transfer_budget
+        self.compression = compression
+        self.scan_ttl = scan_ttl
         self.verbose = verbose
 
+        assert power_mode in POWER_MODES, f'Unknown power mode {power_mode}'
+
         # init
 
         self._wlan = network.WLAN(network.STA_IF)
+        self._pool = ConnectionPool(timeout=http_timeout, verbose=verbose)
         self._is_up = False
+        self.last_error = None  # "no_ap" or "ntp" if connect failed
+        self.last_ntp_sync = None  # time.time() of last NTP sync
+        self.last_ntp_correction = None  # s the RTC was off at last NTP sync
+
+        self._scan_cache = None  # (ticks_ms, known networks)
+
+        self._up_ticks = None
+        self._radio_day = None
+        self._radio_last_ms = 0
+        self._radio_today_ms = 0
+        self._radio_total_ms = 0
+        self._radio_sessions_today = 0
+
         self.down(verbose=False)
 
     @property
@@ -56,10 +99,21 @@ class WifiManager:
         self._wlan.active(True)
         self._is_up = True
 
+        if self._up_ticks is None:
+            self._up_ticks = time.ticks_ms()
+            tracer.event(tracer.WIFI_UP)
+
+        pm = POWER_MODES[self.power_mode]
+
+        if pm is not None and hasattr(self._wlan, pm):
+            self._wlan.config(pm=getattr(self._wlan, pm))
+
     def down(self, verbose: bool = None):
         if verbose is None:
             verbose = self.verbose
 
+        self._pool.close()
+
         if self.is_connected:
             self.disconnect(verbose=verbose)
 
@@ -69,6 +123,56 @@ class WifiManager:
         self._wlan.active(False)
         self._is_up = False
 
+        if self._up_ticks is not None:
+            ms = time.ticks_diff(time.ticks_ms(), self._up_ticks)
+            self._account_radio(ms)
+            self._up_ticks = None
+            tracer.event(tracer.WIFI_DOWN, ms // 1000)
+
+    def _account_radio(self, ms: int):
+        today = datetime.now().date()
+
+        if self._radio_day is None or self._radio_day != today:
+            self._radio_day = today
+            self._radio_today_ms = 0
+            self._radio_sessions_today = 0
+
+        self._radio_last_ms = ms
+        self._radio_today_ms += ms
+        self._radio_total_ms += ms
+        self._radio_sessions_today += 1
+
+        if self.verbose:
+            print(f'[Wifi] radio was on for {ms}ms (today: {self._radio_today_ms}ms)')
+
+    @property
+    def radio_on_ms(self):
+        '''
+        Time (ms) the radio has been on in the current session, 0 if down.
+        '''
+        if self._up_ticks is None:
+            return 0
+        return time.ticks_diff(time.ticks_ms(), self._up_ticks)
+
+    def radio_stats(self):
+        '''
+        Radio-on time accounting: last session, today (incl. the running
+        session), and total since boot, all in ms.
+        '''
+        current = self.radio_on_ms
+        day = self._radio_day
+        today = datetime.now().date()
+
+        is_today = day is not None and day == today
+
+        return {
+            'last_ms': self._radio_last_ms,
+            'current_ms': current,
+            'today_ms': (self._radio_today_ms if is_today else 0) + current,
+            'total_ms': self._radio_total_ms + current,
+            'sessions_today': self._radio_sessions_today if is_today else 0,
+        }
+
     def scan(
         self,
         up: bool = True,
@@ -93,6 +197,51 @@ class WifiManager:
 
         return networks
 
+    def known_networks(
+        self,
+        up: bool = True,
+        verbose: bool = None,
+    ):
+        '''
+        Known networks in range as [(ssid, rssi), ...], strongest first. Scan
+        results are cached for scan_ttl seconds.
+        '''
+        if verbose is None:
+            verbose = self.verbose
+
+        if self._scan_cache is not None:
+            ticks, networks = self._scan_cache
+
+            if time.ticks_diff(time.ticks_ms(), ticks) < 1000 * self.scan_ttl:
+                return networks
+
+        if not self.is_up and up:
+            self.up(verbose=verbose)
+
+        if verbose:
+            print('[Wifi] scanning for networks')
+
+        # one pass over the scan results, keep strongest rssi per known ssid
+
+        best = {}
+
+        for result in self._wlan.scan():
+            ssid = result[0].decode()
+            rssi = result[3]
+
+            if ssid in self.__passwords and rssi > best.get(ssid, -1000):
+                best[ssid] = rssi
+
+        networks = sorted(best.items(), key=lambda net: net[1], reverse=True)
+
+        if verbose:
+            for ssid, rssi in networks:
+                print(f'[Wifi] known network: ssid={ssid} rssi={rssi}')
+
+        self._scan_cache = (time.ticks_ms(), networks)
+
+        return networks
+
     def connect(
         self,
         up: bool = True,
@@ -105,6 +254,8 @@ class WifiManager:
         if ntp_sync is None:
             ntp_sync = self.auto_ntp_sync
 
+        self.last_error = None
+
         if self.is_connected:
             return True
 
@@ -113,56 +264,43 @@ class WifiManager:
 
         assert self.is_up
 
-        # find network to connect to
-
-        networks = self.scan(up=up, verbose=False)
+        # find network to connect to (strongest known first, then fallback)
 
-        ssid, password = None, None
+        networks = self.known_networks(up=up, verbose=verbose)
 
-        for net in networks:
-            for s in self.__secrets:
-                if net.ssid == s['ssid']:
-                    ssid = net.ssid
-                    password = s['pw']
-
-        if ssid is None:
+        if not networks:
             print(f'[Wifi] ERROR: no known network found, cannot connect')
+            self.last_error = 'no_ap'
             return
 
-        # connect
+        start = time.ticks_ms()
 
-        if verbose:
-            print(f'[Wifi] connecting to {ssid}')
+        for ssid, rssi in networks:
+            timeout = self.connect_timeout
 
-        self._wlan.connect(ssid, password)
+            if self.connect_budget is not None:
+                remaining = self.connect_budget - time.ticks_diff(time.ticks_ms(), start) // 1000
 
-        wait = 0
+                if remaining <= 0:
+                    print(f'[Wifi] ERROR: connect budget exhausted, not trying further networks')
+                    break
 
-        while wait < self.connect_timeout:
-            wait += 1
-            time.sleep(1)
+                timeout = min(timeout, remaining)
 
-            stat = self._wlan.status()
-
-            if stat == network.STAT_CONNECT_FAIL:
-                print('[Wifi] connect failed')
+            if self._join(ssid, self.__passwords[ssid], timeout, verbose):
                 break
 
-            elif stat == network.STAT_NO_AP_FOUND:
-                print('[Wifi] no AP found')
-                break
+            self._wlan.disconnect()
 
-            elif stat == network.STAT_GOT_IP:
-                self.connected = True
-
-                if self.verbose:
-                    status = self._wlan.ifconfig()
-                    print('[Wifi] connected, ip=' + status[0])
-
-                break
+        if not self.is_connected:
+            self._scan_cache = None  # may be stale, rescan next time
+            self.last_error = 'no_ap'
+            return False
 
         # sync ntp
 
+        rtc_before = time.time()
+
         try:
             ntptime.settime()
             if self.verbose:
@@ -170,6 +308,7 @@ class WifiManager:
         except (OSError, OverflowError) as ex:
             if self.verbose:
                 print(f'[Wifi] NTP sync failed: {ex}')
+            self.last_error = 'ntp'
             return False
 
         t = time.localtime()
@@ -183,6 +322,9 @@ class WifiManager:
         try:
             t = self.correct_time(t)
             machine.RTC().datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
+            self.last_ntp_sync = time.time()
+            self.last_ntp_correction = self.last_ntp_sync - rtc_before
+            tracer.event(tracer.NTP, int(self.last_ntp_correction))
 
             if self.verbose:
                 dt = datetime(None, None, None, localtime=t)
@@ -190,6 +332,7 @@ class WifiManager:
 
         except Exception as ex:
             print(f'[Wifi] ERROR setting time: {ex}')
+            self.last_error = 'ntp'
             return False
 
         if verbose:
@@ -198,6 +341,44 @@ class WifiManager:
 
         return True
 
+    def _join(self, ssid: str, password: str, timeout: int, verbose: bool):
+        if verbose:
+            print(f'[Wifi] connecting to {ssid}')
+
+        self._wlan.connect(ssid, password)
+
+        wait = 0
+        last_stat = None
+
+        while wait < timeout:
+            wait += 1
+            time.sleep(1)
+
+            stat = self._wlan.status()
+
+            if stat != last_stat:
+                tracer.event(tracer.WIFI_STATUS, stat)
+                last_stat = stat
+
+            if stat == network.STAT_CONNECT_FAIL:
+                print('[Wifi] connect failed')
+                break
+
+            elif stat == network.STAT_NO_AP_FOUND:
+                print('[Wifi] no AP found')
+                break
+
+            elif stat == network.STAT_GOT_IP:
+                self.connected = True
+
+                if self.verbose:
+                    status = self._wlan.ifconfig()
+                    print('[Wifi] connected, ip=' + status[0])
+
+                break
+
+        return self.is_connected
+
     def disconnect(
         self,
         verbose: bool = None,
@@ -205,19 +386,30 @@ class WifiManager:
         if verbose is None:
             verbose = self.verbose
 
+        self._pool.close()
         self._wlan.disconnect()
 
         if verbose:
             print('[Wifi] disconnected')
 
-    def get(
+    def request(
         self,
+        method: str,
         url: str,
+        headers: dict = None,
+        body: bytes = None,
         json: bool = False,
         connect: bool = True,
         down: bool = False,
         verbose: bool = None,
+        reader: Callable = None,
     ):
+        '''
+        HTTP request, returns (status, headers, content) with content parsed
+        (text or JSON) for 2xx responses. Status is None if the request failed.
+        With a reader, content is reader(stream) instead, with the (decoded)
+        body as a stream, e.g. to process large bodies in chunks.
+        '''
         if verbose is None:
             verbose = self.verbose
 
@@ -226,29 +418,67 @@ class WifiManager:
 
         if not self.is_connected:
             print(f'[Wifi] [get] ERROR: cannot download, wifi not up')
-            return None
+            return None, {}, None
+
+        timeout = self.http_timeout
+
+        if self.transfer_budget is not None:
+            remaining = self.transfer_budget - self.radio_on_ms // 1000
+
+            if remaining <= 0:
+                print(f'[Wifi] [get] ERROR: transfer budget exhausted')
+                return None, {}, None
+
+            timeout = min(timeout, remaining)
 
         print(f'[Wifi] [get] downloading data from {url}')
 
-        content = None
+        status, response_headers, content = None, {}, None
+
+        if self.compression:
+            headers = dict(headers or {})
+            headers['Accept-Encoding'] = 'gzip, deflate'
 
         try:
-            response = requests.get(url)
+            self._pool.timeout = timeout
+            response = self._pool.request(method, url, headers, body)
 
-            error_code = response.status_code
+            try:
+                status = response.status
+                response_headers = response.headers
 
-            print(f'[Wifi] [get] http error code {error_code}')
+                print(f'[Wifi] [get] http error code {status}')
 
-            if error_code == 200:
-                content = response.json() if json else response.text
+                if 200 <= status < 300:
+                    if reader is not None:
+                        content = reader(response.stream())
+                    else:
+                        content = response.json() if json else response.text
 
-        except OSError as ex:
+            finally:
+                response.close()
+
+        except (OSError, ValueError) as ex:
             print(f'[Wifi] [get] error: {ex}')
+            status = None
 
         if down:
             self.down(verbose=verbose)
 
-        return content
+        return status, response_headers, content
+
+    def get(
+        self,
+        url: str,
+        json: bool = False,
+        connect: bool = True,
+        down: bool = False,
+        verbose: bool = None,
+    ):
+        status, _, content = self.request(
+            'GET', url, json=json, connect=connect, down=down, verbose=verbose)
+
+        return content if status == 200 else None
 
     def get_json(
         self, *args,
@@ -284,6 +514,14 @@ class WifiManager:
         return t
 
 
+POWER_MODES = {
+    None: None,
+    'none': 'PM_NONE',
+    'performance': 'PM_PERFORMANCE',
+    'powersave': 'PM_POWERSAVE',
+}
+
+
 class Network:
     def __init__(self, scan_results):
         data = list(scan_results)
@@ -0,0 +1,24 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tools', 'stubs'))
+
+import host  # noqa: E402
+
+host.install()
+
+from fakes import Clock  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''
+    Fake wall clock, 2024-12-02 12:00 UTC (a Monday) unless set otherwise.
+    '''
+    clock = Clock()
+    monkeypatch.setattr(time, 'time', clock.time)
+    monkeypatch.setattr(time, 'localtime', clock.localtime)
+    return clock
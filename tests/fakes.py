@@ -0,0 +1,84 @@
+'''
+Stand-ins for the board's wall clock and wifi manager, shared by the tests.
+'''
+import io
+import time
+
+
+def timegm(year: int, month: int, day: int, hour: int = 0, minute: int = 0, second: int = 0):
+    # seconds since 1970-01-01 of a UTC time (calendar.timegm imports the
+    # standard datetime module, which src/datetime.py shadows)
+    y = year - (month <= 2)
+    days = 365 * y + y // 4 - y // 100 + y // 400 + (153 * ((month + 9) % 12) + 2) // 5 + day - 719469
+    return 86400 * days + 3600 * hour + 60 * minute + second
+
+
+class Clock:
+    '''
+    Wall clock (time.time, time.localtime in UTC) set by the test.
+    '''
+    def __init__(self, *t):
+        self.t = 0
+        self.set(*(t or (2024, 12, 2, 12, 0)))
+
+    def set(self, year: int, month: int, day: int, hour: int = 0, minute: int = 0, second: int = 0):
+        self.t = timegm(year, month, day, hour, minute, second)
+
+    def advance(self, seconds: int):
+        self.t += seconds
+
+    def time(self):
+        return self.t
+
+    def localtime(self, t: int = None):
+        return time.gmtime(self.t if t is None else t)
+
+
+class FakeWifi:
+    '''
+    Wifi manager answering requests from a dict url -> (status, headers,
+    content), or url -> callable(headers) returning such a tuple. Unknown
+    URLs fail (status None). Requests are recorded as (method, url, headers).
+    '''
+    def __init__(self, responses: dict = None, connects: bool = True):
+        self.responses = responses if responses is not None else {}
+        self.connects = connects
+        self.last_error = None
+        self.is_connected = False
+        self.connect_calls = 0
+        self.requests = []
+
+    def connect(self, verbose: bool = None):
+        self.connect_calls += 1
+        self.last_error = None if self.connects else 'no_ap'
+        self.is_connected = self.connects
+        return self.connects
+
+    def down(self, verbose: bool = None):
+        self.is_connected = False
+
+    def request(self, method: str, url: str, headers: dict = None, body: bytes = None,
+                json: bool = False, connect: bool = True, down: bool = False,
+                verbose: bool = None, reader=None):
+        self.requests += [(method, url, dict(headers or {}))]
+        response = self.responses.get(url)
+
+        if callable(response):
+            response = response(headers or {})
+
+        if response is None:
+            return None, {}, None
+
+        status, response_headers, content = response
+
+        if reader is not None and 200 <= status < 300:
+            content = reader(io.BytesIO(content.encode()))
+
+        return status, response_headers, content
+
+    def get_json(self, url: str, **kwargs):
+        status, _, content = self.request('GET', url, json=True)
+        return content if status == 200 else None
+
+    def urls(self):
+        return [url for _, url, _ in self.requests]
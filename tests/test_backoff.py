@@ -0,0 +1,50 @@
+from backoff import Backoff
+
+
+def test_delays_grow_per_cause_and_are_capped():
+    backoff = Backoff(base=60, cap=300, jitter=0)
+
+    assert [backoff.failure('ntp', 0) for _ in range(5)] == [60, 120, 240, 300, 300]
+    assert backoff.failure('http', 0) == 60  # counted per cause
+    assert backoff.last_cause == 'http'
+
+
+def test_jitter():
+    backoff = Backoff(base=60, cap=3600, jitter=.25)
+
+    for _ in range(20):
+        backoff.success()
+        assert 60 <= backoff.failure('no_ap', 1000) < 75
+
+
+def test_due():
+    backoff = Backoff(base=60, jitter=0)
+    assert not backoff.pending and not backoff.due(0)
+
+    backoff.failure('ntp', 1000)
+    assert backoff.pending
+    assert not backoff.due(1059)
+    assert backoff.due(1060)
+
+    backoff.success()
+    assert not backoff.pending and backoff.failures == {}
+
+
+def test_clock_jumped_back():
+    backoff = Backoff(base=60, cap=600, jitter=0)
+    backoff.failure('ntp', 10 ** 9)
+
+    assert not backoff.due(0)  # RTC reset: wait at most cap
+    assert backoff.next_retry == 600
+
+
+def test_state():
+    backoff = Backoff(jitter=0)
+    backoff.failure('ntp', 100)
+    backoff.failure('ntp', 100)
+
+    restored = Backoff(jitter=0)
+    restored.restore(backoff.state())
+
+    assert restored.state() == backoff.state()
+    assert restored.failure('ntp', 100) == 240
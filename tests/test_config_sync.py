@@ -0,0 +1,315 @@
+import time
+
+from config_sync import ConfigSync
+from datetime import datetime
+from fakes import FakeWifi
+
+URL = 'http://cfg/clock.json'
+
+
+def config_sync(tmp_path, wifi, sync_times=('04:00', ), **kwargs):
+    kwargs.setdefault('verbose', False)
+    return ConfigSync(wifi, list(sync_times), state_file=str(tmp_path / 'sync_state.json'), **kwargs)
+
+
+def ok(data: dict, etag: str = None):
+    return 200, {} if etag is None else {'etag': etag}, data
+
+
+# retries (backoff)
+
+def test_failed_connect_is_retried_with_backoff(tmp_path, clock):
+    wifi = FakeWifi({URL: ok({'v': 1})}, connects=False)
+    configs = []
+    cs = config_sync(tmp_path, wifi)
+    cs.register_app(URL, configs.append)
+
+    assert cs.sync(force=True) is False
+    assert cs.last_error == 'no_ap'
+    assert cs.retry_state['failures'] == {'no_ap': 1}
+
+    delay = cs.retry_state['next_retry'] - clock.t
+    assert 60 <= delay < 75
+
+    assert cs.sync() is None  # not due yet
+    clock.advance(delay - 1)
+    assert cs.sync() is None
+
+    wifi.connects = True
+    clock.advance(1)
+    assert cs.sync() is True
+    assert configs == [{'v': 1}]
+    assert cs.retry_state['next_retry'] is None
+
+
+def test_backoff_grows_and_survives_restart(tmp_path, clock):
+    wifi = FakeWifi(connects=False)
+    cs = config_sync(tmp_path, wifi)
+    cs.register_app(URL, lambda data: None)
+
+    cs.sync(force=True)
+    clock.advance(cs.retry_state['next_retry'] - clock.t)
+    cs.sync()
+
+    assert cs.retry_state['failures'] == {'no_ap': 2}
+    assert 120 <= cs.retry_state['next_retry'] - clock.t < 150
+
+    restarted = config_sync(tmp_path, wifi)
+    assert restarted.retry_state == cs.retry_state
+
+
+def test_sync_times_are_skipped_while_a_retry_is_pending(tmp_path, clock):
+    clock.set(2024, 12, 2, 3, 58)
+    wifi = FakeWifi(connects=False)
+    cs = config_sync(tmp_path, wifi, retry_base=600, sync_tolerance=60)
+    cs.register_app(URL, lambda data: None)
+
+    assert cs.sync(force=True) is False
+    assert wifi.connect_calls == 1
+
+    clock.set(2024, 12, 2, 4, 0)
+    assert cs.sync() is None  # the retry (in 10 minutes) covers 04:00
+    assert wifi.connect_calls == 1
+    assert cs._sync_times_today == []
+
+
+# delta updates (JSON patch)
+
+class App:
+    # config holder as GetUpClock: current() and update_data()
+    def __init__(self, data: dict = None):
+        self.data = data or {}
+        self.updates = []
+
+    def update_data(self, data: dict):
+        self.updates += [data]
+        self.data = data
+
+
+def delta_server(config: dict, etag: str, patch=None):
+    # 304 if the validator matches, the patch if given (226), else the config
+    def respond(headers):
+        if headers.get('If-None-Match') == etag:
+            return 304, {}, None
+
+        if patch is not None and headers.get('A-IM') == 'json-patch':
+            return 226, {'etag': etag}, patch
+
+        return 200, {'etag': etag}, config
+
+    return respond
+
+
+def test_delta_updates(tmp_path, clock):
+    app = App()
+    wifi = FakeWifi({URL: delta_server({'v': 1}, '"1"')})
+    cs = config_sync(tmp_path, wifi)
+    cs.register_app(URL, app.update_data, current=lambda: app.data)
+
+    assert cs.sync(force=True) is True
+    assert app.updates == [{'v': 1}]
+    assert wifi.requests[-1][2] == {}  # nothing to patch
+
+    # unchanged: 304, no callback
+    assert cs.sync(force=True) is True
+    assert wifi.requests[-1][2] == {'If-None-Match': '"1"', 'A-IM': 'json-patch'}
+    assert app.updates == [{'v': 1}]
+
+    # changed: patched
+    base = app.data
+    wifi.responses[URL] = delta_server({'v': 2}, '"2"', [{'op': 'replace', 'path': '/v', 'value': 2}])
+    assert cs.sync(force=True) is True
+    assert app.updates[-1] == {'v': 2}
+    assert base == {'v': 1}  # patched on a copy
+
+    # the validator follows the patched config
+    assert cs.sync(force=True) is True
+    assert wifi.requests[-1][2]['If-None-Match'] == '"2"'
+    assert len(app.updates) == 2
+
+
+def test_invalid_patch_downloads_the_full_config(tmp_path, clock):
+    app = App()
+    wifi = FakeWifi({URL: delta_server({'v': 1}, '"1"')})
+    cs = config_sync(tmp_path, wifi)
+    cs.register_app(URL, app.update_data, current=lambda: app.data)
+    cs.sync(force=True)
+
+    wifi.responses[URL] = delta_server({'v': 3}, '"3"', [{'op': 'remove', 'path': '/missing'}])
+    assert cs.sync(force=True) is True
+    assert app.updates[-1] == {'v': 3}
+    assert [h.get('A-IM') for _, _, h in wifi.requests[-2:]] == ['json-patch', None]
+
+
+def test_no_validator_for_a_changed_local_config(tmp_path, clock):
+    app = App()
+    wifi = FakeWifi({URL: delta_server({'v': 1}, '"1"')})
+    cs = config_sync(tmp_path, wifi)
+    cs.register_app(URL, app.update_data, current=lambda: app.data)
+    cs.sync(force=True)
+
+    app.data = {'v': 'local'}  # e.g. a different cache file
+    cs.sync(force=True)
+    assert wifi.requests[-1][2] == {}
+    assert app.updates[-1] == {'v': 1}
+
+
+# sync planning around deadlines, time budget
+
+def test_plan(tmp_path):
+    cs = config_sync(tmp_path, FakeWifi(), sync_tolerance=600, sync_budget=60)
+
+    assert cs._plan(100, []) == 100
+    assert cs._plan(-50, []) == 0  # overdue: now, not in the past
+    assert cs._plan(0, [30]) == 35  # after the deadline (+ guard)
+    assert cs._plan(100, [120]) == 125  # nearest window
+    assert cs._plan(100, [200]) == 100  # done 5s before the deadline
+    assert cs._plan(100, [160]) == 95  # ends in time if started earlier
+    assert cs._plan(300, list(range(0, 1000, 30))) == 300  # no window: as planned
+
+
+def test_sync_waits_for_a_window(tmp_path, clock):
+    clock.set(2024, 12, 2, 1, 0)
+    wifi = FakeWifi({URL: ok({'v': 1})})
+    cs = config_sync(tmp_path, wifi, sync_tolerance=600, sync_budget=60)
+    deadline = datetime(2024, 12, 2, 4, 0, 30)  # e.g. a transition at 04:00:30
+    cs.register_app(URL, lambda data: None, deadlines=lambda now, horizon: [deadline])
+    assert cs.sync(force=True) is True
+
+    clock.set(2024, 12, 2, 4, 0)
+    assert cs.sync() is None  # would run into the deadline
+    assert wifi.connect_calls == 1
+
+    clock.set(2024, 12, 2, 4, 0, 35)
+    assert cs.sync() is True
+
+
+def test_budget_until_next_deadline(tmp_path, clock, monkeypatch):
+    ticks = [0]
+    monkeypatch.setattr(time, 'ticks_ms', lambda: ticks[0])
+
+    deadlines = []
+    cs = config_sync(tmp_path, FakeWifi({URL: ok({'v': 1})}), sync_budget=60)
+    cs.register_app(URL, lambda data: None, deadlines=lambda now, horizon: deadlines)
+
+    cs.sync(force=True)
+    assert cs._budget_end == 60000
+
+    deadlines += [datetime(2024, 12, 2, 12, 0, 30)]
+    cs.sync(force=True)  # forced syncs run anyway, with a shorter budget
+    assert cs._budget_end == 25000
+
+    deadlines[0] = datetime(2024, 12, 2, 12, 0, 8)
+    cs.sync(force=True)
+    assert cs._budget_end == 10000  # SYNC_MIN_BUDGET
+
+
+def test_sync_cut_off_at_the_budget(tmp_path, clock, monkeypatch):
+    ticks = [0]
+    monkeypatch.setattr(time, 'ticks_ms', lambda: ticks[0])
+
+    class SlowConnect(FakeWifi):
+        def connect(self, verbose=None):
+            ticks[0] += 61000
+            return super().connect(verbose)
+
+    wifi = SlowConnect({URL: ok({'v': 1})})
+    cs = config_sync(tmp_path, wifi, sync_budget=60)
+    cs.register_app(URL, lambda data: None)
+
+    assert cs.sync(force=True) is False
+    assert cs.last_error == 'budget'
+    assert wifi.requests == [] and not wifi.is_connected
+    assert cs.retry_state['failures'] == {'budget': 1}
+
+
+def test_forced_sync_is_not_late_for_past_sync_times(tmp_path, clock, capsys):
+    cs = config_sync(tmp_path, FakeWifi({URL: ok({'v': 1})}), verbose=True)
+    cs.register_app(URL, lambda data: None)
+
+    assert cs.sync(force=True) is True  # 12:00, sync time 04:00
+    assert 'after planned time' not in capsys.readouterr().out
+    assert cs._sync_times_today == []
+
+
+# per app sync state, partial retries
+
+URL2 = 'http://cfg/other.json'
+
+
+def test_only_failed_apps_are_retried(tmp_path, clock):
+    wifi = FakeWifi({URL: ok({'v': 1})})
+    configs = {URL: [], URL2: []}
+    cs = config_sync(tmp_path, wifi)
+    cs.register_app(URL, configs[URL].append)
+    cs.register_app(URL2, configs[URL2].append)
+
+    assert cs.sync(force=True) is False
+    assert cs.last_error == 'http'
+    assert cs.retry_state['next_retry'] is None  # connection was fine
+    assert cs.app_state(URL)['next_due'] is None
+    assert cs.app_state(URL)['last_success'] == clock.t
+
+    retry = cs.app_state(URL2)['next_due']
+    assert 60 <= retry - clock.t < 75
+
+    wifi.responses[URL2] = ok({'w': 1})
+    clock.advance(retry - clock.t)
+    wifi.requests = []
+
+    assert cs.sync() is True
+    assert wifi.urls() == [URL2]
+    assert configs == {URL: [{'v': 1}], URL2: [{'w': 1}]}
+    assert cs.app_state(URL2)['next_due'] is None
+
+
+def test_app_state_survives_restart(tmp_path, clock):
+    wifi = FakeWifi({URL: ok({'v': 1}, etag='"1"')})
+    cs = config_sync(tmp_path, wifi)
+    cs.register_app(URL, lambda data: None, current=lambda: {'v': 1})
+    cs.register_app(URL2, lambda data: None)
+    cs.sync(force=True)
+
+    restarted = config_sync(tmp_path, wifi)
+    restarted.register_app(URL, lambda data: None, current=lambda: {'v': 1})
+    restarted.register_app(URL2, lambda data: None)
+
+    assert restarted.app_state(URL) == cs.app_state(URL)
+    assert restarted.app_state(URL2) == cs.app_state(URL2)
+    assert restarted.app_state(URL)['validator'][0] == '"1"'
+
+
+def test_refresh_interval(tmp_path, clock):
+    wifi = FakeWifi({URL: ok({'v': 1}), URL2: ok({'w': 1})})
+    cs = config_sync(tmp_path, wifi, sync_times=())
+    cs.register_app(URL, lambda data: None, interval=3600)
+    cs.register_app(URL2, lambda data: None)
+
+    assert cs.sync(force=True) is True
+    wifi.requests = []
+
+    clock.advance(3599)
+    assert cs.sync() is None
+
+    clock.advance(1)
+    assert cs.sync() is True
+    assert wifi.urls() == [URL]
+    assert cs.app_state(URL)['next_due'] == clock.t + 3600
+
+
+def test_rejected_config_is_retried_without_validator(tmp_path, clock):
+    wifi = FakeWifi({URL: ok({'v': 2}, etag='"2"')})
+    accept = [False]
+    cs = config_sync(tmp_path, wifi)
+    cs.register_app(URL, lambda data: accept[0], current=lambda: {'v': 1})
+
+    assert cs.sync(force=True) is False  # e.g. fragments not cached yet
+    assert cs.last_error == 'http'
+    assert cs.app_state(URL)['validator'] is None
+    assert cs.app_state(URL)['next_due'] is not None
+
+    accept[0] = True
+    clock.advance(cs.app_state(URL)['next_due'] - clock.t)
+    assert cs.sync() is True
+    assert wifi.requests[-1][2] == {}  # full download
+    assert cs.app_state(URL)['validator'][0] == '"2"'
@@ -0,0 +1,71 @@
+import json
+
+from config_sync import ConfigSync
+from datetime import datetime
+from fakes import FakeWifi
+from fragments import FragmentCache
+from get_up_clock import GetUpClock
+from leds import LEDs
+
+URL = 'http://cfg/clock.json'
+FRAGMENT = 'http://cfg/states.json'
+
+STATES = [{'name': 'NIGHT', 'leds': 'red'}, {'name': 'DAY', 'leds': 'green'}]
+CONFIG = {'states': STATES, 'rules': [{'name': 'default', 'transitions': ['07:00']}]}
+INVALID = {'states': STATES, 'rules': [{'name': 'default', 'transitions': ['07:00', '08:00', '09:00']}]}
+
+
+def clock_app(tmp_path, data: dict = None):
+    fragments = FragmentCache(cache_file=str(tmp_path / 'fragments.json'), verbose=False)
+    app = GetUpClock(
+        LEDs(red=14, green=16, verbose=False),
+        cache_file=str(tmp_path / 'cache.json'),
+        fragment_cache=fragments,
+        verbose=False)
+
+    if data is not None:
+        app.update_data(data)
+
+    return app
+
+
+def test_invalid_config_shows_the_error_state(tmp_path, clock):
+    app = clock_app(tmp_path, CONFIG)
+    app.step(datetime.now())
+    assert app.state_name == 'DAY'
+
+    assert app.update_data(INVALID) is True
+    assert app.data == INVALID
+    assert app.state_name == 'RULE_ERROR'
+
+    with open(tmp_path / 'cache.json') as f:
+        assert json.load(f)[1] == INVALID
+
+
+def test_config_with_missing_fragments_is_not_applied(tmp_path, clock):
+    app = clock_app(tmp_path, CONFIG)
+    app.step(datetime.now())
+
+    assert app.update_data({'include': [FRAGMENT], 'rules': CONFIG['rules']}) is False
+    assert app.data == CONFIG
+    assert app.state_name == 'DAY'
+
+
+def test_invalid_config_from_the_server_is_not_downloaded_again(tmp_path, clock):
+    app = clock_app(tmp_path, CONFIG)
+    app.step(datetime.now())
+
+    def server(headers):
+        if headers.get('If-None-Match') == '"bad"':
+            return 304, {}, None
+        return 200, {'etag': '"bad"'}, INVALID
+
+    wifi = FakeWifi({URL: server})
+    cs = ConfigSync(wifi, ['04:00'], state_file=str(tmp_path / 'sync_state.json'), verbose=False)
+    cs.register_app(URL, app.update_data, current=lambda: app.data, includes=app.includes)
+
+    assert cs.sync(force=True) is True
+    assert app.state_name == 'RULE_ERROR'
+
+    assert cs.sync(force=True) is True
+    assert wifi.requests[-1][2].get('If-None-Match') == '"bad"'
@@ -0,0 +1,210 @@
+import gzip
+import io
+import zlib
+
+import pytest
+
+from http_pool import MAX_REDIRECTS, Connection, ConnectionPool, Response, parse_url, resolve_url
+
+
+class MemoryConnection(Connection):
+    # connection reading a canned response from memory
+    def __init__(self, data: bytes):
+        self._sock = self._reader = io.BytesIO(data)
+        self.sent = []
+        self.write = self.sent.append
+
+
+def response(data: bytes, method: str = 'GET', pool: ConnectionPool = None):
+    conn = MemoryConnection(data)
+    status, headers = conn.read_head()
+    pool = pool or ConnectionPool(verbose=False)
+    return Response(pool, ('http', 'host', 80), conn, status, headers, method == 'HEAD')
+
+
+def test_content_length():
+    r = response(b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhelloEXTRA')
+    assert r.status == 200
+    assert r.read() == b'hello'
+    assert r.done
+
+
+def test_chunked():
+    r = response(
+        b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+        b'4;ext=1\r\nWiki\r\n'
+        b'5\r\npedia\r\n'
+        b'0\r\nX-Trailer: 1\r\n\r\n'
+        b'NEXT')
+    assert r.read(3) == b'Wik'
+    assert r.read() == b'ipedia'
+    assert r.done
+    assert r._conn._reader.read() == b'NEXT'  # trailers consumed, nothing more
+
+
+def test_chunked_json():
+    r = response(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n3\r\n{"a\r\n5\r\n": 1}\r\n0\r\n\r\n')
+    assert r.json() == {'a': 1}
+
+
+def test_no_body():
+    assert response(b'HTTP/1.1 204 No Content\r\n\r\n').read() == b''
+    assert response(b'HTTP/1.1 304 Not Modified\r\nContent-Length: 5\r\n\r\n').read() == b''
+    assert response(b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\n', method='HEAD').read() == b''
+
+
+def test_until_close():
+    r = response(b'HTTP/1.0 200 OK\r\n\r\nall of it')
+    assert r.read() == b'all of it'
+    assert not r._keep_alive
+
+
+def test_close_hands_back_connection():
+    pool = ConnectionPool(verbose=False)
+    r = response(b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello', pool=pool)
+    conn = r._conn
+    r.close()  # drains the unread body
+    assert pool._connections[('http', 'host', 80)] is conn
+    assert conn._reader.read() == b''
+
+
+def test_close_connection_close():
+    pool = ConnectionPool(verbose=False)
+    r = response(b'HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Length: 2\r\n\r\nok', pool=pool)
+    conn = r._conn
+    r.close()
+    assert not pool._connections
+    assert conn._sock.closed
+
+
+def test_invalid_status_line():
+    with pytest.raises(ValueError):
+        MemoryConnection(b'garbage\r\n\r\n').read_head()
+
+
+def encoded(body: bytes, encoding: str, chunk: int = 0):
+    # response with an encoded body, chunked if chunk > 0
+    head = f'HTTP/1.1 200 OK\r\nContent-Encoding: {encoding}\r\n'.encode()
+
+    if not chunk:
+        return head + f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+
+    chunks = b''.join(
+        f'{len(body[i:i + chunk]):x}\r\n'.encode() + body[i:i + chunk] + b'\r\n'
+        for i in range(0, len(body), chunk))
+
+    return head + b'Transfer-Encoding: chunked\r\n\r\n' + chunks + b'0\r\n\r\n'
+
+
+PAYLOAD = b'{"states": [' + b', '.join(b'{"name": "S%d"}' % i for i in range(200)) + b']}'
+
+
+@pytest.mark.parametrize('encoding, compress', [('gzip', gzip.compress), ('deflate', zlib.compress)])
+@pytest.mark.parametrize('chunk', [0, 7, 1000])
+def test_compressed(encoding, compress, chunk):
+    r = response(encoded(compress(PAYLOAD), encoding, chunk))
+    assert len(r.json()['states']) == 200
+    assert r.done
+
+
+def test_compressed_read_in_parts():
+    stream = response(encoded(gzip.compress(PAYLOAD), 'gzip')).stream()
+    parts = []
+
+    while True:
+        data = stream.read(100)
+        if not data:
+            break
+        assert len(data) <= 100
+        parts += [data]
+
+    assert b''.join(parts) == PAYLOAD
+
+
+def test_identity():
+    r = response(b'HTTP/1.1 200 OK\r\nContent-Encoding: identity\r\nContent-Length: 2\r\n\r\n{}')
+    assert r.json() == {}
+
+
+def test_corrupt_compressed_body():
+    body = bytearray(gzip.compress(PAYLOAD))
+    body[20:40] = bytes(20)
+
+    with pytest.raises(ValueError):
+        response(encoded(bytes(body), 'gzip')).content
+
+
+def test_unsupported_encoding():
+    with pytest.raises(ValueError):
+        response(encoded(b'xx', 'br')).stream()
+
+
+class RedirectPool(ConnectionPool):
+    # pool answering from a dict url -> raw response, records requests
+    def __init__(self, responses: dict):
+        super().__init__(verbose=False)
+        self.responses = responses
+        self.requests = []
+
+    def _send(self, method, url, headers, body):
+        self.requests += [(method, url, body)]
+        conn = MemoryConnection(self.responses[url])
+        status, response_headers = conn.read_head()
+        return Response(self, parse_url(url)[:3], conn, status, response_headers, method == 'HEAD')
+
+
+def redirect(status: int, location: str):
+    return f'HTTP/1.1 {status} Moved\r\nLocation: {location}\r\nContent-Length: 0\r\n\r\n'.encode()
+
+
+OK = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok'
+
+
+def test_redirect_relative():
+    pool = RedirectPool({
+        'http://a/cfg/x.json': redirect(301, 'y.json'),
+        'http://a/cfg/y.json': redirect(302, '/z.json'),
+        'http://a/z.json': redirect(307, 'https://b:8443/final'),
+        'https://b:8443/final': OK,
+    })
+    r = pool.request('GET', 'http://a/cfg/x.json')
+    assert r.status == 200 and r.read() == b'ok'
+    assert [url for _, url, _ in pool.requests] == [
+        'http://a/cfg/x.json', 'http://a/cfg/y.json', 'http://a/z.json', 'https://b:8443/final']
+
+
+def test_redirect_303_switches_to_get():
+    pool = RedirectPool({'http://a/up': redirect(303, '/done'), 'http://a/done': OK})
+    assert pool.request('POST', 'http://a/up', body=b'data').status == 200
+    assert pool.requests == [('POST', 'http://a/up', b'data'), ('GET', 'http://a/done', None)]
+
+
+def test_redirect_307_keeps_method_and_body():
+    pool = RedirectPool({'http://a/up': redirect(307, '/up2'), 'http://a/up2': OK})
+    assert pool.request('POST', 'http://a/up', body=b'data').status == 200
+    assert pool.requests[1] == ('POST', 'http://a/up2', b'data')
+
+
+def test_redirect_limit():
+    pool = RedirectPool({'http://a/loop': redirect(302, '/loop')})
+    r = pool.request('GET', 'http://a/loop')
+    assert r.status == 302
+    assert len(pool.requests) == MAX_REDIRECTS + 1
+
+
+def test_parse_url():
+    assert parse_url('https://example.com/a/b?c=1') == ('https', 'example.com', 443, '/a/b?c=1')
+    assert parse_url('HTTP://host:8080') == ('http', 'host', 8080, '/')
+
+    for url in ('example.com/a', 'ftp://host/a'):
+        with pytest.raises(ValueError):
+            parse_url(url)
+
+
+def test_resolve_url():
+    base = 'https://host/dir/cfg.json?v=1'
+    assert resolve_url(base, 'http://other/x') == 'http://other/x'
+    assert resolve_url(base, '//cdn/x') == 'https://cdn/x'
+    assert resolve_url(base, '/x') == 'https://host/x'
+    assert resolve_url(base, 'x.json') == 'https://host/dir/x.json'
+    assert resolve_url('https://host', 'x.json') == 'https://host/x.json'
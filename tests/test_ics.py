@@ -0,0 +1,131 @@
+import io
+
+import pytest
+
+from fakes import FakeWifi
+from ics import MAX_EVENT_DAYS, MAX_LINE, FeedCache, add_days, iter_lines, merge_ranges, parse_duration, parse_events
+
+FEED = 'http://cal/holidays.ics'
+
+
+def lines(text: bytes, chunk_size: int = 256):
+    return list(iter_lines(io.BytesIO(text), chunk_size))
+
+
+def events(*bodies):
+    text = ''.join(f'BEGIN:VEVENT\r\n{body}END:VEVENT\r\n' for body in bodies)
+    return list(parse_events(lines(f'BEGIN:VCALENDAR\r\n{text}END:VCALENDAR\r\n'.encode())))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 5, 256])
+def test_unfolding(chunk_size):
+    text = (
+        b'BEGIN:VEVENT\r\n'
+        b'SUMMARY:Christmas\r\n'
+        b'  holidays\r\n'
+        b'\tand more\r\n'
+        b'DTSTART;VALUE=DATE:2024\r\n'
+        b' 1223\n'
+        b'END:VEVENT')  # no line break at the end
+
+    assert lines(text, chunk_size) == [
+        'BEGIN:VEVENT',
+        'SUMMARY:Christmas holidaysand more',
+        'DTSTART;VALUE=DATE:20241223',
+        'END:VEVENT']
+
+
+def test_long_and_invalid_lines():
+    long = b'DESCRIPTION:' + b'x' * 1000
+    result = lines(long + b'\r\n ' + b'y' * 1000 + b'\r\n\xff\xfe\r\nEND:VEVENT\r\n')
+
+    assert result[0] == long[:MAX_LINE].decode()
+    assert result[1:] == ['', 'END:VEVENT']  # not UTF-8: empty
+
+
+def test_dates():
+    assert events(
+        'DTSTART;VALUE=DATE:20241223\r\nDTEND;VALUE=DATE:20250104\r\n',  # end exclusive
+        'DTSTART;VALUE=DATE:20240229\r\n',  # no end: one day
+        'DTSTART:20240301T080000Z\r\nDTEND:20240302T120000Z\r\n',  # timed: last day included
+        'DTSTART:20240401T080000\r\nDTEND:20240401T120000\r\n',
+        'DTSTART;VALUE=DATE:20240501\r\nDTEND;VALUE=DATE:20240501\r\n',  # empty: one day
+    ) == [
+        (20241223, 20250104),
+        (20240229, 20240301),
+        (20240301, 20240303),
+        (20240401, 20240402),
+        (20240501, 20240502)]
+
+
+def test_duration():
+    assert [parse_duration(d) for d in ('P1D', 'P2W', '+P3D', 'P1W2D', 'PT1H', 'P1DT12H', 'P0D')] == [
+        1, 14, 3, 9, 1, 2, 1]
+
+    assert events(
+        'DTSTART;VALUE=DATE:20241230\r\nDURATION:P1W\r\n',
+        'DTSTART:20240310T230000Z\r\nDURATION:PT2H\r\n',
+    ) == [(20241230, 20250106), (20240310, 20240311)]
+
+
+def test_invalid_values_are_skipped():
+    assert events(
+        'DTSTART;VALUE=DATE:20240230\r\n',  # no such day
+        'DTSTART;VALUE=DATE:2024\r\n',
+        'DTSTART;VALUE=DATE:20240601\r\nDURATION:1D\r\n',  # invalid duration: one day
+        'SUMMARY:no start\r\n',
+    ) == [(20240601, 20240602)]
+
+
+def test_long_events_are_cut_off():
+    assert events('DTSTART;VALUE=DATE:20240101\r\nDTEND;VALUE=DATE:20990101\r\n') == [
+        (20240101, add_days(20240101, MAX_EVENT_DAYS))]
+    assert events('DTSTART;VALUE=DATE:20240101\r\nDURATION:P100W\r\n') == [
+        (20240101, add_days(20240101, MAX_EVENT_DAYS))]
+
+
+def test_merge_ranges():
+    assert merge_ranges([(20240105, 20240110), (20240101, 20240103), (20240103, 20240104), (20240106, 20240107)]) == [
+        [20240101, 20240104], [20240105, 20240110]]
+
+
+def feed_cache(tmp_path):
+    return FeedCache(cache_file=str(tmp_path / 'feeds.json'), tmp_file=str(tmp_path / 'feed.tmp'), verbose=False)
+
+
+ICS = 'BEGIN:VEVENT\r\nDTSTART;VALUE=DATE:20241223\r\nDTEND;VALUE=DATE:20250104\r\nEND:VEVENT\r\n'
+
+
+def test_feed_cache(tmp_path):
+    wifi = FakeWifi({FEED: (200, {'etag': '"a"'}, ICS)})
+    feeds = feed_cache(tmp_path)
+
+    assert feeds.fetch(wifi, FEED) is True
+    assert feeds.ranges(FEED) == [[20241223, 20250104]]
+    assert feeds.version == 1
+
+    # unchanged content (new ETag): not parsed again
+    wifi.responses[FEED] = (200, {'etag': '"b"'}, ICS)
+    assert feeds.fetch(wifi, FEED) is False
+    assert feeds.version == 1
+
+    # 304 with the stored ETag
+    wifi.responses[FEED] = lambda headers: (304, {}, None) if headers.get('If-None-Match') == '"b"' else None
+    assert feeds.fetch(wifi, FEED) is False
+
+    # failed download: cached ranges are kept
+    wifi.responses = {}
+    assert feeds.fetch(wifi, FEED) is None
+    assert feed_cache(tmp_path).ranges(FEED) == [[20241223, 20250104]]  # persisted
+
+    feeds.retain([])
+    assert feeds.ranges(FEED) == [] and feeds.version == 2
+
+
+def test_temporary_file_is_removed(tmp_path):
+    feeds = feed_cache(tmp_path)
+
+    # parsed, unchanged, without valid events
+    for content in (ICS, ICS, 'BEGIN:VEVENT\r\nDTSTART:x\r\nEND:VEVENT\r\n'):
+        feeds.fetch(FakeWifi({FEED: (200, {}, content)}), FEED)
+        assert not (tmp_path / 'feed.tmp').exists()
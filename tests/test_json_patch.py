@@ -0,0 +1,76 @@
+import pytest
+
+from json_patch import apply_patch, copy, parse_pointer
+
+
+def test_operations():
+    doc = {'a': {'b': [1, 2]}, 'c': 1}
+    patch = [
+        {'op': 'add', 'path': '/a/b/-', 'value': 3},
+        {'op': 'add', 'path': '/a/b/0', 'value': 0},
+        {'op': 'remove', 'path': '/a/b/1'},
+        {'op': 'replace', 'path': '/c', 'value': 2},
+        {'op': 'copy', 'from': '/a/b', 'path': '/d'},
+        {'op': 'move', 'from': '/c', 'path': '/a/c'},
+        {'op': 'test', 'path': '/d', 'value': [0, 2, 3]},
+    ]
+
+    assert apply_patch(doc, patch) == {'a': {'b': [0, 2, 3], 'c': 2}, 'd': [0, 2, 3]}
+
+
+def test_copy_is_independent():
+    doc = apply_patch({'a': [1]}, [{'op': 'copy', 'from': '/a', 'path': '/b'}])
+    doc['b'] += [2]
+    assert doc == {'a': [1], 'b': [1, 2]}
+
+
+def test_root():
+    assert apply_patch({'a': 1}, [{'op': 'replace', 'path': '', 'value': [1]}]) == [1]
+    assert apply_patch({}, [{'op': 'add', 'path': '', 'value': {'b': 2}}]) == {'b': 2}
+
+
+def test_pointer_escapes():
+    assert parse_pointer('/a~1b/c~0d/~01') == ['a/b', 'c~d', '~1']
+    assert apply_patch({'a/b': 1}, [{'op': 'remove', 'path': '/a~1b'}]) == {}
+
+
+@pytest.mark.parametrize('patch', [
+    {'op': 'add', 'path': '/a', 'value': 1},  # not a list
+    [{'path': '/a'}],  # no op
+    [{'op': 'add'}],  # no path
+    ['add'],  # not an object
+    [{'op': 'add', 'path': '/a'}],  # no value
+    [{'op': 'move', 'path': '/a'}],  # no from
+    [{'op': 'frobnicate', 'path': '/a'}],
+    [{'op': 'add', 'path': 'a', 'value': 1}],  # pointer without /
+    [{'op': 'add', 'path': '/x/y', 'value': 1}],  # parent missing
+    [{'op': 'remove', 'path': '/x'}],
+    [{'op': 'replace', 'path': '/x', 'value': 1}],
+    [{'op': 'remove', 'path': ''}],  # root
+    [{'op': 'add', 'path': '/list/4', 'value': 1}],  # past the end
+    [{'op': 'remove', 'path': '/list/3'}],
+    [{'op': 'remove', 'path': '/list/-'}],  # - only appends
+    [{'op': 'remove', 'path': '/list/01'}],  # leading zero
+    [{'op': 'remove', 'path': '/list/-1'}],
+    [{'op': 'add', 'path': '/n/x', 'value': 1}],  # into a number
+    [{'op': 'add', 'path': '/n/x/y', 'value': 1}],
+    [{'op': 'move', 'from': '/obj', 'path': '/obj/inner'}],  # into own child
+    [{'op': 'copy', 'from': '/x', 'path': '/y'}],
+    [{'op': 'test', 'path': '/n', 'value': 2}],
+    [{'op': 'test', 'path': '/x', 'value': 1}],
+])
+def test_invalid_patches_raise_value_error(patch):
+    doc = {'list': [1, 2, 3], 'n': 1, 'obj': {'a': 1}}
+
+    with pytest.raises(ValueError):
+        apply_patch(doc, patch)
+
+
+def test_failed_patch_leaves_a_copy_untouched():
+    doc = {'list': [1, 2, 3]}
+    patch = [{'op': 'remove', 'path': '/list/0'}, {'op': 'test', 'path': '/list/0', 'value': 1}]
+
+    with pytest.raises(ValueError):
+        apply_patch(copy(doc), patch)
+
+    assert doc == {'list': [1, 2, 3]}
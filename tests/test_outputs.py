@@ -0,0 +1,50 @@
+import pytest
+
+from leds import LEDs
+from outputs import LEDOutput, PWMOutput
+
+
+def values(group):
+    return [pin.value() for pin in group._leds]
+
+
+def test_led_output_leaves_other_leds_alone():
+    leds = LEDs(status='LED', red=(14, 15), green=16, verbose=False)
+    output = LEDOutput(leds)
+    red = output.compile({'name': 'A', 'leds': 'red'}, None)
+    both = output.compile({'name': 'B', 'leds': 'red,green'}, None)
+    green = output.compile({'name': 'C', 'leds': 'green'}, None)
+
+    leds.status.on()  # e.g. the sync error flash
+
+    output.show(red)
+    assert values(leds.red) == [1, 1]
+    output.off()  # blinking
+    assert values(leds.red) == [0, 0]
+    output.show(both)
+    output.show(green)
+    assert values(leds.red) == [0, 0] and values(leds.green) == [1]
+
+    assert values(leds.status) == [1]
+
+
+def test_led_output_unknown_group():
+    output = LEDOutput(LEDs(red=14, verbose=False))
+
+    with pytest.raises(AssertionError):
+        output.compile({'name': 'A', 'leds': 'blue'}, None)
+
+
+def test_pwm_output():
+    class Palette:
+        gamma = 2
+
+    output = PWMOutput(red=(14, 15), green=16)
+    value = output.compile({'name': 'A', 'leds': 'red', 'luminosity': .5}, Palette())
+    assert value == (16384, 16384, 0)
+
+    output.show(value)
+    assert [pwm.duty_u16() for pwm in output.groups['all']] == [16384, 16384, 0]
+    output.off()
+    assert [pwm.duty_u16() for pwm in output.groups['all']] == [0, 0, 0]
+    assert output.error_state()['leds'] == 'all'
@@ -0,0 +1,117 @@
+import random
+import time
+
+import pytest
+
+from datetime import date, datetime
+from fakes import timegm
+from schedule import Schedule
+
+STATES = [{'name': 'NIGHT'}, {'name': 'WAKE'}, {'name': 'DAY'}, {'name': 'SLEEP'}]
+
+CONFIG = {
+    'states': STATES,
+    'rules': [
+        {'name': 'holiday', 'cond_date': ['2024-12-25', '2024-02-29'], 'transitions': ['09:00', None, '22:00']},
+        {'name': 'weekend', 'cond_weekday': [5, 6], 'transitions': ['08:00', '08:30', '21:00']},
+        {'name': 'default', 'transitions': ['06:30', '07:00', '20:00']},
+    ],
+}
+
+
+def names(transitions):
+    return [(f'{t.month}-{t.day} {t.hour:02d}:{t.minute:02d}', state['name']) for t, state in transitions]
+
+
+def test_weekday_across_leap_years():
+    # the weekday used to drift by one day per leap year since 2000
+    rng = random.Random(0)
+
+    for _ in range(500):
+        year, month, day = rng.randint(2000, 2099), rng.randint(1, 12), rng.randint(1, 28)
+        expected = time.gmtime(timegm(year, month, day)).tm_wday
+        assert datetime(year, month, day).weekday() == expected, (year, month, day)
+        assert date(year, month, day).weekday() == expected
+
+    assert datetime(2024, 2, 29).weekday() == 3
+    assert datetime(2024, 3, 1).weekday() == 4
+    assert datetime(2000, 1, 1).weekday() == 5
+
+
+def test_next_day():
+    assert date(2024, 2, 28).next_day() == date(2024, 2, 29)
+    assert date(2023, 2, 28).next_day() == date(2023, 3, 1)
+    assert date(2024, 12, 31).next_day() == date(2025, 1, 1)
+    assert date(2024, 4, 30).next_day().key() == 20240501
+
+
+def test_rule():
+    schedule = Schedule(CONFIG)
+
+    assert schedule.rule(date(2024, 12, 2))['name'] == 'default'  # Monday
+    assert schedule.rule(date(2024, 12, 7))['name'] == 'weekend'
+    assert schedule.rule(date(2024, 12, 25))['name'] == 'holiday'  # Wednesday
+    assert schedule.rule(date(2024, 2, 29))['name'] == 'holiday'
+    assert schedule.rule(date(2025, 12, 25))['name'] == 'default'
+
+
+def test_first_matching_rule_wins():
+    config = {
+        'states': STATES,
+        'rules': [
+            {'name': 'weekend', 'cond_weekday': [5, 6], 'transitions': []},
+            {'name': 'holiday', 'cond_date': ['2024-12-28'], 'transitions': []},
+            {'name': 'default', 'transitions': []},
+        ],
+    }
+    schedule = Schedule(config)
+
+    assert schedule.rule(date(2024, 12, 28))['name'] == 'weekend'  # Saturday
+    assert schedule.rule(date(2024, 12, 28), weekday=0)['name'] == 'holiday'
+
+
+def test_transitions():
+    schedule = Schedule(CONFIG)
+
+    assert names(schedule.transitions(date(2024, 12, 25))) == [
+        ('12-25 00:00', 'NIGHT'), ('12-25 09:00', 'WAKE'), ('12-25 22:00', 'SLEEP')]
+
+    transitions = schedule.transitions(date(2024, 12, 2))
+    transitions.pop()  # callers get a copy of the cached list
+    assert len(schedule.transitions(date(2024, 12, 2))) == 4
+
+
+def test_next_transitions_across_days():
+    schedule = Schedule(CONFIG)
+
+    # Friday evening: the rest of Friday, then the weekend rule
+    assert names(schedule.next_transitions(datetime(2024, 12, 6, 19, 59, 30), 4)) == [
+        ('12-6 20:00', 'SLEEP'), ('12-7 00:00', 'NIGHT'), ('12-7 08:00', 'WAKE'), ('12-7 08:30', 'DAY')]
+
+    # across the year, Dec 31st 2024 is a Tuesday
+    assert names(schedule.next_transitions(datetime(2024, 12, 31, 21, 0), 2)) == [
+        ('1-1 00:00', 'NIGHT'), ('1-1 06:30', 'WAKE')]
+
+
+def test_next_transitions_strictly_after_now():
+    schedule = Schedule(CONFIG)
+
+    assert names(schedule.next_transitions(datetime(2024, 12, 2, 7, 0), 1)) == [('12-2 20:00', 'SLEEP')]
+    assert names(schedule.next_transitions(datetime(2024, 12, 2, 6, 59, 59), 1)) == [('12-2 07:00', 'DAY')]
+
+
+def test_next_transitions_over_a_holiday_with_null_transition():
+    schedule = Schedule(CONFIG)
+
+    assert names(schedule.next_transitions(datetime(2024, 12, 24, 20, 0), 3)) == [
+        ('12-25 00:00', 'NIGHT'), ('12-25 09:00', 'WAKE'), ('12-25 22:00', 'SLEEP')]
+
+
+def test_invalid_configs():
+    for config in (
+        {'states': [], 'rules': CONFIG['rules']},
+        {'states': STATES, 'rules': []},
+        {'states': STATES[:2], 'rules': [{'name': 'x', 'transitions': ['06:00', '07:00']}]},
+    ):
+        with pytest.raises(AssertionError):
+            Schedule(config)
@@ -0,0 +1,50 @@
+from sequencer import Sequencer
+
+
+def test_pattern_steps():
+    sequencer = Sequencer(tick_period=50)
+    calls = []
+    sequencer.pattern((100, 50), (lambda: calls.append('a'), lambda: calls.append('b')))
+
+    for _ in range(6):
+        sequencer._run(0)
+
+    assert calls == ['a', 'b', 'a', 'b']
+
+
+def test_actions_stopping_patterns():
+    sequencer = Sequencer(tick_period=50)
+    calls = []
+    patterns = []
+
+    def stop_first():
+        calls.append(1)
+        patterns[0].deinit()
+
+    def stop_self():
+        calls.append(2)
+        patterns[2].deinit()
+
+    patterns += [
+        sequencer.periodic(50, lambda: calls.append(0)),
+        sequencer.periodic(50, stop_first),  # stops a pattern before it
+        sequencer.periodic(50, stop_self),
+        sequencer.periodic(50, lambda: calls.append(3)),
+    ]
+
+    sequencer._run(0)
+    sequencer._run(0)
+
+    # every remaining pattern runs exactly once per tick
+    assert calls == [0, 1, 2, 3, 1, 3]
+
+
+def test_idle():
+    sequencer = Sequencer()
+    assert sequencer.idle
+
+    pattern = sequencer.periodic(100, lambda: None)
+    assert not sequencer.idle
+
+    pattern.deinit()
+    assert sequencer.idle
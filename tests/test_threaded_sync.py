@@ -0,0 +1,143 @@
+'''
+Threaded ConfigSync with the real _thread: the sync worker and the main loop
+(GetUpClock.step) run at the same time.
+'''
+import threading
+import time
+
+from config_sync import ConfigSync
+from datetime import datetime
+from fakes import FakeWifi
+from fragments import FragmentCache
+from get_up_clock import GetUpClock
+from ics import FeedCache
+from leds import LEDs
+
+CFG = 'http://cfg/clock.json'
+FRAGMENT = 'http://cfg/states.json'
+FEED = 'http://cfg/holidays.ics'
+
+STATES = [{'name': 'NIGHT', 'leds': 'red'}, {'name': 'DAY', 'leds': 'green'}]
+
+HOLIDAYS = (
+    'BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\n'
+    'DTSTART;VALUE=DATE:20241202\r\nDTEND;VALUE=DATE:20241203\r\n'
+    'END:VEVENT\r\nEND:VCALENDAR\r\n')
+
+
+class Trace:
+    '''
+    Events (name, thread id) in the order they happened.
+    '''
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str):
+        with self._lock:
+            self.events += [(name, threading.get_ident())]
+
+    def threads(self, *names):
+        return {thread for name, thread in self.events if name in names}
+
+
+class SlowWifi(FakeWifi):
+    # every wifi call is traced and takes a while, so the main loop runs meanwhile
+    def __init__(self, trace: Trace, responses: dict):
+        super().__init__(responses)
+        self.trace = trace
+
+    def connect(self, verbose: bool = None):
+        self.trace.add('wifi')
+        time.sleep(.01)
+        return super().connect(verbose)
+
+    def down(self, verbose: bool = None):
+        self.trace.add('wifi')
+        super().down(verbose)
+
+    def request(self, *args, **kwargs):
+        self.trace.add('wifi')
+        time.sleep(.01)
+        return super().request(*args, **kwargs)
+
+
+def test_sync_worker_does_not_race_the_main_loop(tmp_path, clock):
+    trace = Trace()
+    main = threading.get_ident()
+
+    wifi = SlowWifi(trace, {
+        CFG: (200, {'etag': '"2"'}, {
+            'include': [FRAGMENT],
+            'rules': [
+                {'name': 'holiday', 'cond_ics': FEED, 'transitions': ['13:00']},
+                {'name': 'default', 'transitions': ['07:00']},
+            ],
+        }),
+        FRAGMENT: (200, {}, '{"states": %s}' % str(STATES).replace("'", '"')),
+        FEED: (200, {}, HOLIDAYS),
+    })
+
+    feed_cache = FeedCache(cache_file=str(tmp_path / 'feeds.json'), tmp_file=str(tmp_path / 'feed.tmp'), verbose=False)
+    fragment_cache = FragmentCache(cache_file=str(tmp_path / 'fragments.json'), verbose=False)
+
+    app = GetUpClock(
+        LEDs(red=14, green=16, verbose=False),
+        cache_file=str(tmp_path / 'cache.json'),
+        feed_cache=feed_cache,
+        fragment_cache=fragment_cache,
+        verbose=False)
+
+    app.update_data({'states': STATES, 'rules': [{'name': 'default', 'transitions': ['07:00']}]})
+    app.step(datetime.now())
+    assert app.state_name == 'DAY'
+
+    def traced(name: str, function):
+        def call(*args):
+            trace.add(name)
+            return function(*args)
+        return call
+
+    cs = ConfigSync(
+        wifi, ['04:00'], state_file=str(tmp_path / 'sync_state.json'), threaded=True,
+        feed_cache=feed_cache, fragment_cache=fragment_cache, verbose=False)
+
+    cs.register_app(
+        CFG,
+        traced('update', app.update_data),
+        current=traced('current', lambda: app.data),
+        feeds=traced('feeds', app.feeds),
+        includes=traced('includes', app.includes))
+
+    assert cs.sync(force=True) is None  # worker started
+    timeout = time.monotonic() + 10
+
+    while cs.busy and time.monotonic() < timeout:
+        trace.add('step')
+        app.step(datetime.now())
+        time.sleep(.001)
+
+    assert not cs.busy
+    assert cs.sync() is True  # result applied in the main thread
+
+    # the worker does all network work and reads the app's config,
+    # applying the result and the clock steps stay in the main thread
+
+    worker = trace.threads('wifi', 'current', 'includes', 'feeds')
+    assert len(worker) == 1 and main not in worker
+    assert trace.threads('update', 'step') == {main}
+
+    # the main loop ran while the worker was busy, but the config the worker
+    # read was not replaced before the worker was done
+
+    names = [name for name, _ in trace.events]
+    first = min(i for i, (_, thread) in enumerate(trace.events) if thread in worker)
+    last = max(i for i, (_, thread) in enumerate(trace.events) if thread in worker)
+
+    assert 'step' in names[first:last]
+    assert 'update' not in names[first:last]
+    assert names.index('update', last) > last
+
+    # new config, fragment, and feed applied: today is a holiday (13:00)
+    assert app.state_name == 'NIGHT'
+    assert not wifi.is_connected
@@ -0,0 +1,60 @@
+'''
+Host set-up to import the modules in src/ on Linux (CPython), e.g. for the
+tests in tests/.
+
+install() puts src/ and the stand-ins in this directory (machine, network,
+neopixel, ntptime, micropython) on the module path, and adds what CPython
+lacks: time.ticks_ms() and its helpers, and the Callable annotation name.
+src/datetime.py and src/logging.py shadow the standard library modules of
+the same name, so these are dropped from sys.modules first.
+
+Usage (before importing any module of src/):
+
+        import sys
+        sys.path.insert(0, 'tools/stubs')
+        import host
+        host.install()
+'''
+import builtins
+import os
+import sys
+import time
+
+from typing import Callable
+
+
+TICKS_PERIOD = 1 << 30  # as on the RP2040
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def ticks_ms():
+    return int(1000 * time.monotonic()) % TICKS_PERIOD
+
+
+def ticks_add(ticks: int, delta: int):
+    return (ticks + delta) % TICKS_PERIOD
+
+
+def ticks_diff(a: int, b: int):
+    half = TICKS_PERIOD // 2
+    return (a - b + half) % TICKS_PERIOD - half
+
+
+def install():
+    '''
+    Make the modules of src/ importable (once per process).
+    '''
+    for path in (os.path.join(ROOT, 'tools', 'stubs'), os.path.join(ROOT, 'src')):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    for name in ('datetime', 'logging'):
+        module = sys.modules.get(name)
+
+        if module is not None and not getattr(module, '__file__', '').startswith(ROOT):
+            del sys.modules[name]
+
+    time.ticks_ms = ticks_ms
+    time.ticks_add = ticks_add
+    time.ticks_diff = ticks_diff
+    builtins.Callable = Callable
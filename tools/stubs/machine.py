@@ -0,0 +1,65 @@
+'''
+Host stand-in for MicroPython's machine module (the parts used in src/).
+Pins and PWMs keep their value, timers never fire: call the callback (or
+Sequencer._run) to advance them.
+'''
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+
+    def __init__(self, pin, mode: int = None):
+        self.pin = pin
+        self._value = 0
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def toggle(self):
+        self._value ^= 1
+
+    def value(self, value: int = None):
+        if value is None:
+            return self._value
+
+        self._value = int(bool(value))
+
+
+class PWM:
+    def __init__(self, pin: Pin, freq: int = 1000):
+        self.pin = pin
+        self.freq = freq
+        self._duty = 0
+
+    def duty_u16(self, duty: int = None):
+        if duty is None:
+            return self._duty
+
+        self._duty = duty
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, mode: int = PERIODIC, period: int = -1, callback=None):
+        self.mode = mode
+        self.period = period
+        self.callback = callback
+
+    def deinit(self):
+        self.callback = None
+
+
+class RTC:
+    def datetime(self, t: tuple = None):
+        pass
+
+
+class UART:
+    def __init__(self, *args, **kwargs):
+        pass
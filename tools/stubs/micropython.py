@@ -0,0 +1,16 @@
+'''
+Host stand-in for MicroPython's micropython module: scheduled callbacks run
+right away.
+'''
+
+
+def schedule(function, arg):
+    function(arg)
+
+
+def alloc_emergency_exception_buf(size: int):
+    pass
+
+
+def const(value):
+    return value
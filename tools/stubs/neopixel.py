@@ -0,0 +1,28 @@
+'''
+Host stand-in for MicroPython's neopixel module. Pixels are kept as tuples,
+writes are counted.
+'''
+
+
+class NeoPixel:
+    def __init__(self, pin, n: int, bpp: int = 3, timing: int = 1):
+        self.pin = pin
+        self.n = n
+        self.bpp = bpp
+        self.writes = 0
+        self._pixels = [(0, ) * bpp] * n
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, i: int, color: tuple):
+        self._pixels[i] = tuple(color)
+
+    def __getitem__(self, i: int):
+        return self._pixels[i]
+
+    def fill(self, color: tuple):
+        self._pixels = [tuple(color)] * self.n
+
+    def write(self):
+        self.writes += 1
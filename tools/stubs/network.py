@@ -0,0 +1,45 @@
+'''
+Host stand-in for MicroPython's network module. The WLAN never connects;
+tests pass their own wifi manager to ConfigSync instead.
+'''
+STA_IF = 0
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_GOT_IP = 3
+STAT_CONNECT_FAIL = -1
+STAT_NO_AP_FOUND = -2
+STAT_WRONG_PASSWORD = -3
+
+
+class WLAN:
+    PM_NONE = 0
+    PM_PERFORMANCE = 1
+    PM_POWERSAVE = 2
+
+    def __init__(self, interface: int = STA_IF):
+        self._active = False
+        self._status = STAT_IDLE
+
+    def active(self, active: bool = None):
+        if active is None:
+            return self._active
+
+        self._active = active
+
+    def status(self, *args):
+        return self._status
+
+    def scan(self):
+        return []
+
+    def connect(self, ssid: str, password: str = None):
+        self._status = STAT_NO_AP_FOUND
+
+    def disconnect(self):
+        self._status = STAT_IDLE
+
+    def ifconfig(self):
+        return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+
+    def config(self, *args, **kwargs):
+        pass
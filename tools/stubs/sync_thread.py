@@ -0,0 +1,60 @@
+'''
+Synchronous stand-in for MicroPython's _thread, to run and check the threaded
+sync path (ConfigSync(threaded=True)) on Linux deterministically.
+
+start_new_thread() runs the function to completion before it returns, so a
+threaded sync finishes inside the sync() call that starts it, and its result
+is applied (through the mailbox) by the next sync() call, as on the board.
+
+Usage (before importing config_sync; _thread is a built-in module, so it
+cannot be shadowed on the module path):
+
+        import sys
+        sys.path.insert(0, 'tools/stubs')
+        import sync_thread
+        sync_thread.install()
+'''
+import sys
+
+
+class LockType:
+    def __init__(self):
+        self._locked = False
+
+    def acquire(self, waitflag: int = 1, timeout: float = -1):
+        # nothing runs concurrently, a held lock would never be released
+        assert not self._locked, 'deadlock: lock already held'
+        self._locked = True
+        return True
+
+    def release(self):
+        assert self._locked, 'release of an unlocked lock'
+        self._locked = False
+
+    def locked(self):
+        return self._locked
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def allocate_lock():
+    return LockType()
+
+
+def start_new_thread(function, args: tuple, kwargs: dict = None):
+    function(*args, **(kwargs or {}))
+
+
+def get_ident():
+    return 1
+
+
+def install():
+    '''
+    Use this module as _thread for all later imports.
+    '''
+    sys.modules['_thread'] = sys.modules[__name__]
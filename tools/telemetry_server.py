@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+'''
+Local HTTP endpoint for telemetry uploads (see src/telemetry.py), for testing.
+
+Usage:
+
+        python3 tools/telemetry_server.py [--port 8080] [--out telemetry.jsonl]
+
+Accepts POST requests (gzip or plain JSON), prints the log lines and counters,
+and appends every upload (with the receive time) to the output file.
+'''
+import argparse
+import gzip
+import http.server
+import json
+import time
+
+
+def make_handler(out: str):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+            try:
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                data = json.loads(body)
+            except (OSError, ValueError) as ex:
+                self.send_error(400, f'invalid upload: {ex}')
+                return
+
+            self.send_response(204)
+            self.end_headers()
+
+            received = time.strftime('%Y-%m-%d %H:%M:%S')
+            print(f'--- {received} from {self.client_address[0]}: uptime {data.get("uptime")}s, '
+                  f'mem_free {data.get("mem_free")}, {data.get("dropped", 0)} line(s) dropped')
+
+            for line in data.get('logs', []):
+                print(line)
+
+            for name, n in sorted(data.get('counters', {}).items()):
+                print(f'{name}: {n}')
+
+            if out:
+                with open(out, 'a') as f:
+                    f.write(json.dumps(dict(data, received=received)) + '\n')
+
+        def log_message(self, format, *args):
+            pass  # uploads are printed above
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--out', default='telemetry.jsonl', help='file to append uploads to ("" to disable)')
+    args = parser.parse_args()
+
+    server = http.server.HTTPServer((args.host, args.port), make_handler(args.out))
+    print(f'listening on {args.host}:{args.port}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
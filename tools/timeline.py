@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+'''
+Evaluate a clock config for every minute of a date range and check it.
+
+Usage:
+
+        python3 tools/timeline.py config/cfg-leds.json [--start 2024-01-01] [--days 366] [--render]
+
+Rules are resolved as on the board (first rule matching the date or weekday,
+the last rule is the fallback) for all days at once, the result is a per-minute
+state array (days x 1440).
+
+Configs the board rejects when loading them (it then shows the error state on
+every day) are reported as invalid: no states or rules, too many transitions,
+invalid times or dates, or a fading state ("transition") without a colour or
+followed by a state without colour. Otherwise, reported problems are:
+
+- unreachable rules: rules not used on any day of the range
+- null chains: transitions set to null such that the last state (the night)
+  is never reached, or a rule has no transition at all
+- states never shown in the range
+
+Included fragments ("include") are merged as on the board, URLs are
+downloaded, other entries are read as files relative to the config.
+
+The exit code is 1 if problems were found. Needs NumPy.
+'''
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+
+MINUTES = 1440
+ERROR = -1  # state index of days without a valid schedule
+SYMBOLS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def load_module(name: str):
+    # load a module from src/ without putting src/ on the path (it shadows stdlib modules)
+    path = os.path.join(os.path.dirname(__file__), '..', 'src', f'{name}.py')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_config(path: str):
+    '''
+    Config with its fragments merged.
+    '''
+    fragments = load_module('fragments')
+
+    with open(path) as f:
+        data = json.load(f)
+
+    cache = {}  # url -> fragment, in place of the board's FragmentCache
+
+    for url in fragments.include_urls(data):
+        if url.startswith(('http://', 'https://')):
+            with urllib.request.urlopen(url) as response:
+                fragment = json.load(response)
+        else:
+            with open(os.path.join(os.path.dirname(path), url)) as f:
+                fragment = json.load(f)
+
+        try:
+            fragments.validate(fragment)
+        except AssertionError as ex:
+            raise ValueError(f'invalid fragment {url}: {ex}')
+
+        cache[url] = fragment
+
+    return fragments.merge(data, cache)
+
+
+def parse_time(t: str):
+    # as on the board, times after 23:59 are accepted (and never reached)
+    try:
+        h, m = map(int, t.split(':'))
+    except (AttributeError, ValueError):
+        raise ValueError(f'invalid time {t}')
+
+    return 60 * h + m
+
+
+def state_sequence(rule: dict):
+    # (minute of day, state index) of a rule, starting with state 0 at 00:00
+    return [(0, 0)] + [
+        (parse_time(t), i + 1) for i, t in enumerate(rule['transitions']) if t is not None]
+
+
+def validate(data: dict):
+    '''
+    Errors for which the board rejects the whole config (as Schedule and
+    compile_plans on the board).
+    '''
+    states = data.get('states') or []
+    rules = data.get('rules') or []
+
+    if not states:
+        return ['no states']
+
+    if not rules:
+        return ['no rules']
+
+    errors = []
+
+    for rule in rules:
+        name = rule.get('name')
+
+        if not isinstance(rule.get('transitions'), list):
+            errors += [f'rule {name}: no transitions list']
+            continue
+
+        if len(rule['transitions']) > len(states) - 1:
+            errors += [f'rule {name}: too many transitions ({len(rule["transitions"])} for {len(states)} states)']
+            continue
+
+        for d in rule.get('cond_date', []):
+            try:
+                y, m, dd = map(int, d.split('-'))
+            except (AttributeError, ValueError):
+                errors += [f'rule {name}: invalid date {d}']
+
+        try:
+            sequence = state_sequence(rule)
+        except ValueError as ex:
+            errors += [f'rule {name}: {ex}']
+            continue
+
+        for k, (_, i) in enumerate(sequence):
+            if states[i].get('transition'):
+                if states[i].get('color') is None:
+                    errors += [f'rule {name}: state {i} fades, but has no colour']
+                elif k + 1 == len(sequence) or states[sequence[k + 1][1]].get('color') is None:
+                    errors += [f'rule {name}: state {i} fades, but the following state has no colour']
+
+    return errors
+
+
+def compile_rule(rule: dict, all_states: list):
+    '''
+    Per-minute state indices of one rule (of a valid config, see validate())
+    and a list of problems.
+    '''
+    problems = []
+    profile = np.full(MINUTES, ERROR, dtype=np.int8)
+    transitions = rule['transitions']
+    n_states = len(all_states)
+
+    times, states = map(list, zip(*state_sequence(rule)))
+
+    # as on the board: a transition earlier than a previous one fires right
+    # after it, so a state is active from the running maximum of the times
+    starts = np.maximum.accumulate(np.array(times))
+    active = np.searchsorted(starts, np.arange(MINUTES), side='right') - 1
+    profile[:] = np.array(states, dtype=np.int8)[active]
+
+    for k in range(1, len(times)):
+        if times[k] >= MINUTES:
+            problems += [f'rule {rule.get("name")}: transition {transitions[states[k] - 1]} '
+                         f'is after 23:59, never reached']
+        elif times[k] < times[k - 1]:
+            problems += [f'rule {rule.get("name")}: transition {transitions[states[k] - 1]} '
+                         f'is before the previous one, state {states[k - 1]} is skipped']
+
+    # null chains
+
+    if len(times) == 1:
+        problems += [f'rule {rule.get("name")}: no transitions, state 0 all day']
+    elif states[-1] != n_states - 1:
+        problems += [f'rule {rule.get("name")}: transitions to the last state are null or missing, '
+                     f'day ends in state {states[-1]}']
+
+    return profile, problems
+
+
+def resolve_rules(rules: list, days: np.ndarray):
+    '''
+    Index of the rule used on each day (datetime64[D] array), and a list of
+    problems (invalid dates).
+    '''
+    problems = []
+    weekdays = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+
+    rule_index = np.full(len(days), len(rules) - 1, dtype=np.int16)
+
+    # last to first, so the first matching rule wins
+    for i in range(len(rules) - 2, -1, -1):
+        rule = rules[i]
+        dates = []
+
+        for d in rule.get('cond_date', []):
+            try:
+                dates += [np.datetime64(datetime.date.fromisoformat(d), 'D')]
+            except ValueError:
+                problems += [f'rule {rule.get("name")}: date {d} does not exist, never matches']
+
+        match = np.isin(weekdays, rule.get('cond_weekday', [])) | np.isin(days, np.array(dates, dtype='datetime64[D]'))
+        rule_index[match] = i
+
+    return rule_index, problems
+
+
+def evaluate(data: dict, start: datetime.date, n_days: int):
+    '''
+    Returns (days, rule index per day, state per day and minute, problems,
+    invalid). Invalid configs (see validate()) are in the error state on
+    every day.
+    '''
+    days = np.arange(np.datetime64(start, 'D'), np.datetime64(start, 'D') + n_days)
+    errors = validate(data)
+
+    if errors:
+        rule_index = np.zeros(len(days), dtype=np.int16)
+        timeline = np.full((len(days), MINUTES), ERROR, dtype=np.int8)
+        problems = [f'invalid config, the board shows the error state on every day: {e}' for e in errors]
+        return days, rule_index, timeline, problems, True
+
+    states = data['states']
+    rules = data['rules']
+
+    rule_index, problems = resolve_rules(rules, days)
+
+    profiles = np.empty((len(rules), MINUTES), dtype=np.int8)
+
+    for i, rule in enumerate(rules):
+        profiles[i], rule_problems = compile_rule(rule, states)
+        problems += rule_problems
+
+    timeline = profiles[rule_index]  # days x minutes
+
+    return days, rule_index, timeline, problems, False
+
+
+def check(data: dict, rule_index: np.ndarray, timeline: np.ndarray):
+    problems = []
+
+    # unreachable rules
+
+    used = np.bincount(rule_index, minlength=len(data['rules']))
+
+    for i, rule in enumerate(data['rules']):
+        if used[i] == 0:
+            if rule.get('cond_ics'):
+                reason = ' (ICS feeds are not evaluated)'
+            elif rule.get('cond_date') or rule.get('cond_weekday') or i == len(data['rules']) - 1:
+                reason = ''
+            else:
+                reason = ' (no condition and not the last rule)'
+            problems += [f'unreachable rule: {rule.get("name")}{reason}']
+
+    # states never shown
+
+    shown = np.bincount(timeline[timeline != ERROR].astype(np.int64), minlength=len(data['states']))
+
+    for i, state in enumerate(data['states']):
+        if shown[i] == 0:
+            problems += [f'state never shown: {state.get("name")}']
+
+    return problems
+
+
+def render(data: dict, days: np.ndarray, rule_index: np.ndarray, timeline: np.ndarray, width: int):
+    '''
+    One line per run of days with the same schedule, one symbol per slot
+    (width slots per day, the state at the start of the slot).
+    '''
+    slots = timeline[:, ::MINUTES // width]
+    symbols = np.array(list(SYMBOLS[:len(data['states'])]) + ['!'])  # -1: error
+
+    changes = np.flatnonzero((slots[1:] != slots[:-1]).any(axis=1) | (rule_index[1:] != rule_index[:-1])) + 1
+    starts = np.concatenate(([0], changes))
+    ends = np.concatenate((changes, [len(days)])) - 1
+
+    for i, state in enumerate(data['states']):
+        print(f'{SYMBOLS[i]}: {state.get("name")}')
+
+    print('!: error')
+    print()
+
+    for lo, hi in zip(starts, ends):
+        span = f'{days[lo]}' + ('' if lo == hi else f' .. {days[hi]}')
+        line = ''.join(symbols[slots[lo]])
+        print(f'{span:<24s} |{line}| {data["rules"][rule_index[lo]].get("name")}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('config')
+    parser.add_argument('--start', type=datetime.date.fromisoformat,
+                        default=datetime.date(datetime.date.today().year, 1, 1),
+                        help='first day (default: Jan 1st of this year)')
+    parser.add_argument('--days', type=int, default=366)
+    parser.add_argument('--render', action='store_true', help='print the timeline')
+    parser.add_argument('--width', type=int, default=96, choices=(24, 48, 96, 144, 288),
+                        help='slots per day in the timeline')
+    args = parser.parse_args()
+
+    data = load_config(args.config)
+
+    t0 = time.perf_counter()
+    days, rule_index, timeline, problems, invalid = evaluate(data, args.start, args.days)
+
+    if not invalid:
+        problems += check(data, rule_index, timeline)
+    t1 = time.perf_counter()
+
+    if args.render and not invalid:
+        render(data, days, rule_index, timeline, args.width)
+        print()
+
+    for problem in problems:
+        print(problem)
+
+    print(f'{len(days)} days evaluated in {1000 * (t1 - t0):.1f}ms, {len(problems)} problem(s)', file=sys.stderr)
+
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
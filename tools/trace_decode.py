@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+'''
+Decode a trace dump (trace.bin, copied from the board) into a timeline.
+
+Usage:
+
+        python3 tools/trace_decode.py trace.bin [--config cfg.json]
+
+With a config, state indices are shown with their names. The delays of the
+state transitions in the trace are summarized at the end (see src/stats.py).
+'''
+import argparse
+import importlib.util
+import json
+import os
+import time
+
+
+def load_module(name: str):
+    # load a module from src/ without putting src/ on the path (it shadows stdlib modules)
+    path = os.path.join(os.path.dirname(__file__), '..', 'src', f'{name}.py')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+EPOCH_2000 = 946684800  # MicroPython epoch (rp2) relative to 1970
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('dump')
+    parser.add_argument('--config', help='clock config, for state names')
+    parser.add_argument('--epoch', type=int, default=2000, choices=(1970, 2000),
+                        help='epoch of the board\'s time.time()')
+    args = parser.parse_args()
+
+    tracer = load_module('tracer')
+    stats = load_module('stats')
+
+    with open(args.dump, 'rb') as f:
+        records = tracer.decode(f.read())
+
+    states = []
+
+    if args.config:
+        with open(args.config) as f:
+            states = [state['name'] for state in json.load(f)['states']]
+
+    offset = EPOCH_2000 if args.epoch == 2000 else 0
+    last_ticks = None
+    delays = stats.Histogram()
+
+    for ticks, t, code, aux, arg in records:
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(t + offset))  # RTC holds local time
+        delta = '' if last_ticks is None else f'+{(ticks - last_ticks) & tracer.TICKS_MASK}ms'
+        last_ticks = ticks
+
+        name = tracer.EVENTS.get(code, f'event_{code}')
+
+        if code == tracer.STATE:
+            detail = 'RULE_ERROR' if arg < 0 else (states[arg] if arg < len(states) else f'#{arg}')
+        elif code == tracer.SYNC_END:
+            detail = 'ok' if arg else f'failed ({tracer.CAUSES[aux] if aux < len(tracer.CAUSES) else aux})'
+        elif code == tracer.ERROR:
+            detail = tracer.ERRORS.get(aux, aux)
+        elif code == tracer.NTP:
+            detail = f'{arg:+d}s'
+        elif code == tracer.WIFI_DOWN:
+            detail = f'radio on {arg}s'
+        elif code == tracer.TRANSITION:
+            detail = f'{arg}s late' + (f', {aux} skipped' if aux else '')
+            delays.add(max(0, arg))
+        elif code == tracer.BOOT:
+            detail = 'warm' if arg else 'cold'
+        else:
+            detail = str(arg)
+
+        print(f'{stamp} {ticks:>10d} {delta:>10s} {name:<12s} {detail}')
+
+    if delays.n > 0:
+        print()
+        print(f'transition delays: {delays.n} transitions, p50 {delays.percentile(50)}s, '
+              f'p95 {delays.percentile(95)}s, p99 {delays.percentile(99)}s, max {delays.max}s')
+
+        for label, count in delays.rows():
+            if count:
+                print(f'{label:>8s} {count:>6d} {"#" * max(1, 40 * count // delays.n)}')
+
+
+if __name__ == '__main__':
+    main()